@@ -21,6 +21,18 @@ aspnames = OrderedDict(
      ('FPW', 'test_23_Forgotten_Password'), ('CPW', 'test_24_Change_Password'),
      ('CMP', 'test_25_Campaign')])
 
+# Which tests have to finish before each test can start, when they are part of the same run.
+# Mostly it's the user: REG makes it, TRN qualifies it, FPW breaks its password and CPW fixes it.
+# LOG checks the user is still a trainee, so TRN has to wait for it.
+# The email tests also can't overlap, they'd be reading each others' messages.
+_signed_in = ('LOG', 'FAV', 'PRF', 'TRN', 'ASC', 'TVL', 'FML', 'PHT', 'DLB', 'STR', 'PRM')
+aspdeps = {'LOG': ('REG',), 'FAV': ('REG',), 'PRF': ('REG',), 'TRN': ('REG', 'LOG'),
+           'ASC': ('REG', 'TRN'), 'TVL': ('REG', 'TRN'), 'FML': ('REG', 'TRN'),
+           'PHT': ('REG', 'TRN'), 'DLB': ('REG', 'TRN'), 'STR': ('REG', 'TRN'),
+           'PRM': ('REG', 'TRN'), 'FUN': ('REG', 'TRN'),
+           'FPW': ('REG', 'FUN') + _signed_in, 'CPW': ('REG', 'FUN', 'FPW') + _signed_in,
+           'CMP': ('REG', 'FUN', 'FPW', 'CPW') + _signed_in}
+
 class ASP(miklase.MyTestCase): # pylint: disable=R0904
     """The Test Suite for the ASP regression."""
     def test_01_Splash_Page(self) -> None:
@@ -66,37 +78,26 @@ class ASP(miklase.MyTestCase): # pylint: disable=R0904
         with self.restraint('About menu did not contain the right options'):
             about = CP.NavMenu.About(self.dr).open()
             # About section should have: About, Why Register, Program FAQ, Site Usage, Contact Us
-            about.about()
-            about.benefits()
-            about.how_to_use_the_site()
-            about.program_faq()
-            about.contact_us()
+            about.check_links('about', 'benefits', 'how_to_use_the_site', 'program_faq',
+                              'contact_us')
         # Click on 'Sales Resources' in the Mega Menu.
         with self.restraint('Sales Resources menu did not contain the right options'):
             sales = CP.NavMenu.SalesResources(self.dr).open()
             # The Sales section should have: Sales Resources (Landing), Interactive Map,
             # Fact Sheets, Useful Websites, Image and video galleries, My sales tools,
             # Itinerary Search, Australian Events, Destination FAQ
-            sales.sales_resources()
-            sales.interactive_map()
-            sales.itineraries_search_and_feature()
-            sales.fact_sheets_overview()
-            sales.events()
-            sales.useful_sites()
-            sales.destination_faq()
-            sales.image_and_video_galleries()
+            sales.check_links('sales_resources', 'interactive_map',
+                              'itineraries_search_and_feature', 'fact_sheets_overview', 'events',
+                              'useful_sites', 'destination_faq', 'image_and_video_galleries')
         # Click on 'Training' in the Mega Menu, should only have the landing page
         with self.restraint('Training menu section missing'):
-            train = CP.NavMenu.Training(self.dr).open()
-            train.training()
+            CP.NavMenu.Training(self.dr).open().check_links('training')
         # Click on 'News & Products' in the Mega Menu, should only have the landing page
         with self.restraint('News And Products menu section missing'):
-            news = CP.NavMenu.NewsAndProducts(self.dr).open()
-            news.news_and_product_updates()
+            CP.NavMenu.NewsAndProducts(self.dr).open().check_links('news_and_product_updates')
         # Click on 'Aussie Specialist Club' in the Mega Menu, should only have the landing page
         with self.restraint('Aussie Specialist Club menu missing'):
-            club = CP.NavMenu.AussieSpecialistClub(self.dr).open()
-            club.aussie_specialist_club()
+            CP.NavMenu.AussieSpecialistClub(self.dr).open().check_links('aussie_specialist_club')
 
     def test_04_Footer(self) -> None:
         """Checks the content of the Footer."""
@@ -106,26 +107,18 @@ class ASP(miklase.MyTestCase): # pylint: disable=R0904
         # Check the Social Media links
         with self.restraint('A Social Media link was missing from the footer'):
             if self.globs['cn_mode']:
-                footer.wechat()
+                footer.check_links('wechat')
             else:
-                footer.facebook()
-                footer.twitter()
-                footer.plus_google()
-                footer.instagram()
-                footer.youtube()
+                footer.check_links('facebook', 'twitter', 'plus_google', 'instagram', 'youtube')
         # About this site: links through to relevant pages
         with self.restraint('About This Site section missing a link'):
-            footer.sitemap()
-            footer.privacy_policy()
-            footer.terms_and_conditions()
-            footer.terms_of_use()
-            footer.contact_us()
+            footer.check_links('sitemap', 'privacy_policy', 'terms_and_conditions', 'terms_of_use',
+                               'contact_us')
         # Other sites: Links through to Aus.com, Corporate site and Business Events.
         with self.restraint('Other Sites section missing a link'):
-            footer.australia()
-            footer.businessevents_australia()
+            footer.check_links('australia', 'businessevents_australia')
             if not self.globs['cn_mode']:    # China doesn't have this one.
-                footer.tourism_australia()
+                footer.check_links('tourism_australia')
         # Click the Change Your Country link.
         with self.restraint('Splash Page link missing',
                             TimeoutException='Splash Page link not linking to the Splash Page'):
@@ -144,11 +137,15 @@ class ASP(miklase.MyTestCase): # pylint: disable=R0904
         with self.destruction('Sitemap is missing from the sitemap page'):
             sitemap = CP.Sitemap(self.dr)
         # Sitemap page should have links to each of the pages in the Nav Menu
+        nav_hrefs = sitemap_hrefs = set()
         with self.restraint('Could not collect list of nav/sitemap links',
                             AssertionError='The sitemap/nav menu link sets do not match'):
-            nav_links = CP.NavMenu(self.dr).get_all_links()
-            sitemap_links = sitemap.get_all_links()
-            self.assertTrue(nav_links.issubset(sitemap_links))
+            nav_hrefs = CP.NavMenu(self.dr).get_all_links(raw=True)
+            sitemap_hrefs = sitemap.get_all_links(raw=True)
+            self.assertTrue({self.dr.fix_url(x) for x in nav_hrefs}.issubset(
+                {self.dr.fix_url(x) for x in sitemap_hrefs}))
+        # And all of them should actually go somewhere. The links as they are, not tidied up.
+        self.check_links(nav_hrefs | sitemap_hrefs, 'sitemap')
         # And should also have Change Password, Unsubscribe, and Coming Soon links. But not China
         with self.restraint('Sitemap is missing some Other Misc Links'):
             if not self.globs['cn_mode']:
@@ -488,9 +485,8 @@ class ASP(miklase.MyTestCase): # pylint: disable=R0904
                     self.dr.back()
 
         # Sign in first
-        self.dr.open_home_page()
         with self.destruction('Could not sign in'):
-            CP.SignIn(self.dr).sign_in(self.globs['username'], self.globs['password'])
+            CP.quick_sign_in(self.dr, self.globs['username'], self.globs['password'])
         # If there are already favourites, that's a problem, remove them. Messes with the count.
         with self.destruction('Favourites section is missing from the Header'):
             if CP.HeaderHeartIcon(self.dr).favourites_count() != 0:
@@ -564,8 +560,7 @@ class ASP(miklase.MyTestCase): # pylint: disable=R0904
     def test_13_My_Profile(self):
         """Tests the Profile page."""
         # Pre-condition: Should be signed in.
-        self.dr.open_home_page()
-        CP.SignIn(self.dr).sign_in(self.globs['username'], self.globs['password'])
+        CP.quick_sign_in(self.dr, self.globs['username'], self.globs['password'])
         # Navigate to the Profile page.
         try:
             CP.NavMenu(self.dr).profile().click()
@@ -615,8 +610,7 @@ class ASP(miklase.MyTestCase): # pylint: disable=R0904
             modules = CP.TrainingSummary(self.dr)
             return mid
         # Pre-condition: Should be signed in.
-        self.dr.open_home_page()
-        CP.SignIn(self.dr).sign_in(self.globs['username'], self.globs['password'])
+        CP.quick_sign_in(self.dr, self.globs['username'], self.globs['password'])
         # Navigate to Training > Training Summary.
         try:
             CP.NavMenu.Training(self.dr).open().training_summary().click()
@@ -696,8 +690,7 @@ class ASP(miklase.MyTestCase): # pylint: disable=R0904
     def test_15_Aussie_Specialist_Club(self):
         """Checks the Aussie Specialist Club nav menu links."""
         # Pre-condition: Logged in as a Qualified User.
-        self.dr.open_home_page()
-        CP.SignIn(self.dr).sign_in(self.globs['username'], self.globs['password'])
+        CP.quick_sign_in(self.dr, self.globs['username'], self.globs['password'])
         # Open the Aussie Specialist Club section in the Nav menu
         club = CP.NavMenu.AussieSpecialistClub(self.dr)
         club.click()
@@ -716,8 +709,7 @@ class ASP(miklase.MyTestCase): # pylint: disable=R0904
     def test_16_Travel_Club(self):
         """Tests the Travel Club search."""
         # Pre-condition: Logged in as a Qualified User.
-        self.dr.open_home_page()
-        CP.SignIn(self.dr).sign_in(self.globs['username'], self.globs['password'])
+        CP.quick_sign_in(self.dr, self.globs['username'], self.globs['password'])
         # Navigate to ASC > Travel Club
         try:
             CP.NavMenu.AussieSpecialistClub(self.dr).open().travel_club().click()
@@ -733,8 +725,7 @@ class ASP(miklase.MyTestCase): # pylint: disable=R0904
     def test_17_Famils(self):
         """Checks the Famils page."""
         # pre-condition: Logged in as a Qualified User.
-        self.dr.open_home_page()
-        CP.SignIn(self.dr).sign_in(self.globs['username'], self.globs['password'])
+        CP.quick_sign_in(self.dr, self.globs['username'], self.globs['password'])
         # Navigate to ASC > Famils
         try:
             CP.NavMenu.AussieSpecialistClub(self.dr).open().famils().click()
@@ -748,8 +739,7 @@ class ASP(miklase.MyTestCase): # pylint: disable=R0904
     def test_18_Aussie_Specialist_Photos(self):
         """Checks the Aussie Specialist Photos page."""
         # pre-condition: Logged in as a Qualified User.
-        self.dr.open_home_page()
-        CP.SignIn(self.dr).sign_in(self.globs['username'], self.globs['password'])
+        CP.quick_sign_in(self.dr, self.globs['username'], self.globs['password'])
         # Navigate to ASC > AS Photos
         try:
             CP.NavMenu.AussieSpecialistClub(self.dr).open().aussie_specialist_photos().click()
@@ -770,8 +760,7 @@ class ASP(miklase.MyTestCase): # pylint: disable=R0904
         if self.globs['cn_mode']:
             self.skipTest("China doesn't have the Qualification Badge Download.")
         # Pre-condition: Logged in as a Qualified User.
-        self.dr.open_home_page()
-        CP.SignIn(self.dr).sign_in(self.globs['username'], self.globs['password'])
+        CP.quick_sign_in(self.dr, self.globs['username'], self.globs['password'])
         # Navigate to ASC > Download Qualification Badge
         CP.NavMenu.AussieSpecialistClub(self.dr).open().asp_logo().click()
         # Click the Download Qualification Badge link.
@@ -883,8 +872,7 @@ class ASP(miklase.MyTestCase): # pylint: disable=R0904
                 grid = CP.AussieStore.ProductGrid(self.dr)
 
         # Pre-condition: Logged in as a Qualified User.
-        self.dr.open_home_page()
-        CP.SignIn(self.dr).sign_in(self.globs['username'], self.globs['password'])
+        CP.quick_sign_in(self.dr, self.globs['username'], self.globs['password'])
         # Preamblic mess.
         try:
             CP.NavMenu(self.dr).profile().click()
@@ -961,8 +949,7 @@ class ASP(miklase.MyTestCase): # pylint: disable=R0904
     def test_21_Premier_Badge(self):
         """Checks that the Profile Page has a Premier Badge. Expect this one to fail."""
         # Pre-condition: Logged in as a Premier User
-        self.dr.open_home_page()
-        CP.SignIn(self.dr).sign_in(self.globs['username'], self.globs['password'])
+        CP.quick_sign_in(self.dr, self.globs['username'], self.globs['password'])
         # Navigate to the Profile Page.
         try:
             CP.NavMenu(self.dr).profile().click()
@@ -13,6 +13,9 @@ ausnames = OrderedDict(
      ('WYC', 'test_07_wycs'), ('OFF', 'test_08_special_offers'), ('BRT', 'test_09_brightcove'),
      ('BVD', 'test_10_banner_video'), ('XPL', 'test_11_explore')])
 
+# Which tests have to finish before each test can start. None of these share any state.
+ausdeps = {}
+
 class AUS(miklase.MyTestCase):
     """The Australia.com test cases."""
     def test_01_social(self):
@@ -12,6 +12,9 @@ invnames = OrderedDict(
      ('MOS', 'test_07_Mosaic'), ('LFR', 'test_08_Livefyre'), ('FIL', 'test_09_FilteredSearch'),
      ('MAP', 'test_10_Sitemap'), ])
 
+# Which tests have to finish before each test can start. None of these share any state.
+invdeps = {}
+
 class INV(miklase.MyTestCase):
     """The Test Suite for the Investment regression"""
     def test_01_Navigation(self) -> None:
@@ -272,17 +275,21 @@ class INV(miklase.MyTestCase):
         with self.destruction('Sitemap is missing from the sitemap page'):
             sma = CP.Sitemap(self.dr)
         # Sitemap should have links to each of the pages in the Nav Menu
+        nav_hrefs = sitemap_hrefs = sitemap_links = fo_li = set()
         with self.restraint('Could not collect list of nav/sitemap links',
                             AssertionError='The sitemap/nav menu link sets do not match'):
-            nav_links = CP.NavMenu(self.dr).get_all_links()
-            sitemap_links = sma.get_all_links()
-            self.assertTrue(nav_links.issubset(sitemap_links))
+            nav_hrefs = CP.NavMenu(self.dr).get_all_links(raw=True)
+            sitemap_hrefs = sma.get_all_links(raw=True)
+            sitemap_links = {self.dr.fix_url(x) for x in sitemap_hrefs}
+            self.assertTrue({self.dr.fix_url(x) for x in nav_hrefs}.issubset(sitemap_links))
         # And should also links corresponding to the footer links
         with self.restraint('Could not collect the list of footer links',
                             AssertionError='The sitemap/footer link sets do not match'):
             fo = CP.Footer(self.dr)
             fo_li = fo.get_all_links()
             self.assertTrue(fo_li.issubset(sitemap_links))
+        # And all of them should actually go somewhere. The links as they are, not tidied up.
+        self.check_links(nav_hrefs | sitemap_hrefs | fo_li, 'sitemap')
         # And, a bit for the languages
         with self.restraint('Could not collect the list of locales',
                             AssertionError='The sitemap/footer locales sets do not match'):
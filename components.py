@@ -9,8 +9,8 @@ from types import MethodType
 from typing import Set, List, Tuple
 from selenium.webdriver.support.select import Select
 from selenium.webdriver.remote.webelement import WebElement
-from selenium.common.exceptions import StaleElementReferenceException
-from drivery import Drivery, SHORT_WAIT
+from selenium.common.exceptions import StaleElementReferenceException, NoSuchElementException
+from drivery import Drivery, SHORT_WAIT, LOGINS
 
 class WrappedElement:
     """Superclass for the various helper classes here."""
@@ -45,6 +45,15 @@ class WrappedElement:
         """Again, a bit of a formality. Checks whether the element is displayed"""
         return self.element.is_displayed()
 
+    def check_links(self, *names: str) -> None:
+        """Checks that each of the named attach_links links is present. Does them all in one go,
+        rather than a lookup per link. Raises NoSuchElementException naming any missing ones."""
+        selectors = self.__dict__.get('link_selectors', {})
+        _, missing = self.dr.find_batch([(selectors[n], self.element) for n in names])
+        if missing:
+            raise NoSuchElementException("Couldn't find link(s) {0} on page {1}".format(
+                ', '.join(n for n in names if selectors[n] in missing), self.dr.current_url()))
+
     def __getattr__(self, name):
         """Basically just to stop pylint from complaining about dynamic attributes."""
         raise AttributeError('The {0} attribute does not exist on {1}.'.format(name, type(self)))
@@ -110,8 +119,8 @@ class SplashSelect(WrappedElement):
 
     def get_values(self) -> Set[str]:
         """Gets a set containing the URLs of all the Language Options."""
-        return {self.dr.fix_url(x.get_attribute('value'))
-                for x in self.dr.quietly_find_elements('option:not([value="#"])', self.element)}
+        return {self.dr.fix_url(x) for x in self.dr.get_properties(
+            'option:not([value="#"])', 'value', self.element)}
 
     def choose_locale(self) -> None:
         """Selects the Language Option representing the current locale."""
@@ -279,24 +288,29 @@ class WhatYouCanSeeMosaic(WrappedElement):
 def attach_links(menu: WrappedElement, names: List[str],
                  selector: str = '[href*="{}.html"]') -> None:
     """A function that attaches an attribute that can be called to create a simple link.
-    The 'names' arguments should be the bits that .format into the selector"""
+    The 'names' arguments should be the bits that .format into the selector.
+    The selectors are also remembered, so WrappedElement.check_links can check them in bulk."""
+    selectors = menu.__dict__.setdefault('link_selectors', {})
     for name in names:
         # Watch out for that closure.
         def link_maker(n):
             """A function that can be called to create a simple link"""
             return lambda: MinorElement(menu.dr, selector.format(n), menu.element)
         menu.__setattr__(name.replace('-', '_').replace('.', '_'), link_maker(name))
+        selectors[name.replace('-', '_').replace('.', '_')] = selector.format(name)
 
 def attach_fancy_links(menu: WrappedElement, names: List[str],
                        selector: str = 'a.mosaic-overlay[href*="{}.html"]') -> None:
     """Like attach_links, attaches an attribute that can be called to create a link.
     This one is for those Mosaic-type links, and those need a bit of a workaround
     to deal with element layering."""
+    selectors = menu.__dict__.setdefault('link_selectors', {})
     for name in names:
         def link_maker(n):
             """A function that can be called to create a fancy link."""
             return lambda: MinorElementParent(menu.dr, selector.format(n), menu.element)
         menu.__setattr__(name.replace('-', '_').replace('.', '_'), link_maker(name))
+        selectors[name.replace('-', '_').replace('.', '_')] = selector.format(name)
 
 class NavSection(WrappedElement):
     """Methods common to the five Nav Menu sections."""
@@ -492,11 +506,13 @@ class NavMenu(WrappedElement):
             attach_links(self, ['about-us', 'how-we-can-help', 'a-national-priority', 'contact-us',]
                          , selector='[href*="{0}.html"] p')
 
-    def get_all_links(self) -> Set[str]:
+    def get_all_links(self, raw: bool = False) -> Set[str]:
         """Gets a set containing the href of each link in the nav menu.
-        The Five/Four section panels, that is, not the Icons, or the Sign In thing."""
-        return {self.dr.fix_url(x.get_attribute('href')) for x in self.dr.flashy_find_elements(
-            '#nav-bar-top .nav-bar-left a[href]:not([href^="#"])', self.element)}
+        The Five/Four section panels, that is, not the Icons, or the Sign In thing.
+        Tidied up with fix_url, for comparing, unless raw: exactly what the page links to."""
+        hrefs = self.dr.get_hrefs('#nav-bar-top .nav-bar-left a[href]:not([href^="#"])',
+                                  self.element)
+        return set(hrefs) if raw else {self.dr.fix_url(x) for x in hrefs}
 
     def user_names(self) -> str:
         """Gets the text displayed in the corner that shows the user names.
@@ -522,13 +538,12 @@ class Footer(WrappedElement):
 
     def get_all_links(self) -> Set[str]:
         """Get a list of all of the links on the footer. Won't get the languages dropdown though."""
-        return {li.get_attribute('href') for li in
-                self.dr.flashy_find_elements('a', self.element) if li.is_displayed()}
+        return {href for href, shown in self.dr.get_properties(
+            'a', ['href', 'displayed'], self.element) if shown}
 
     def get_locales(self) -> List[str]:
         """Get a list of the countries available to the footer switcher. '/en-ca.html' format."""
-        return [opt.get_attribute('value') for opt in
-                self.dr.quietly_find_elements('#dropdown-select-language option', self.element)]
+        return self.dr.get_properties('#dropdown-select-language option', 'value', self.element)
 
     def pick_locale(self, locale):
         """Selects a value in the Country Selector in the footer. Formatted like /en-ca.html"""
@@ -542,15 +557,16 @@ class Sitemap(WrappedElement):
         self.element = self.dr.flashy_find_element('.sitemap')
         attach_links(self, ['change', 'newsletter-unsubscribe', 'coming-soon'])
 
-    def get_all_links(self) -> Set[str]:
-        """Gets a set containing the href of each link in the Sitemap link section"""
-        return {self.dr.fix_url(x.get_attribute('href'))
-                for x in self.dr.flashy_find_elements('a', self.element)}
+    def get_all_links(self, raw: bool = False) -> Set[str]:
+        """Gets a set containing the href of each link in the Sitemap link section.
+        Tidied up with fix_url, for comparing, unless raw: exactly what the page links to."""
+        hrefs = self.dr.get_hrefs('a', self.element)
+        return set(hrefs) if raw else {self.dr.fix_url(x) for x in hrefs}
 
     def get_locales(self) -> Set[str]:
         """Gets a set of the link hrefs, specifically the locale ones, formatted like /en-ca.html"""
-        return {'/' + self.dr.fix_url(x.get_attribute('href')).split('/')[-2] + '.html'
-                for x in self.dr.flashy_find_elements('a[href*="sitemap.html"]', self.element)}
+        return {'/' + self.dr.fix_url(x).split('/')[-2] + '.html'
+                for x in self.dr.get_hrefs('a[href*="sitemap.html"]', self.element)}
 
 class FilteredSearch(WrappedElement):
     """Represents the Itinerary or Fact Sheet Search or Generic Filtered Search Components."""
@@ -921,7 +937,7 @@ class InteractiveMap(WrappedElement):
             def get_names(self) -> List[str]:
                 """Returns a list of the labels on all of the pins"""
                 self.dr.blip_element(self.pins)
-                return [x.text for x in self.pins]
+                return self.dr.get_properties(self.pins, 'text')
 
         class InfoPopup(WrappedElement):
             """Represents the popup window thing that appears from an Itinerary Step Pin."""
@@ -1125,6 +1141,23 @@ class SignIn(WrappedElement):
         tmp.click()
         self.dr.wait_for_page('?cq_ck=')
 
+def quick_sign_in(dr: Drivery, user: str, passw: str) -> None:
+    """Signs in, as with SignIn.sign_in, but borrows a recent login's cookies, if there is one in
+    the LOGINS cache. If there isn't, or they no longer work, uses the Sign In panel after all,
+    and caches that login. Either way, ends up signed in, on the Home Page or wherever signing in
+    goes to."""
+    cookies = LOGINS.get(dr.base_url, dr.locale, user)
+    if cookies:
+        dr.import_session(cookies)
+        dr.open_home_page()
+        if not dr.check_visible_quick('.link-signin-text'):
+            return
+        LOGINS.forget(dr.base_url, dr.locale, user)
+        dr.import_session([])
+    dr.open_home_page()
+    SignIn(dr).sign_in(user, passw)
+    LOGINS.put(dr.base_url, dr.locale, user, dr.export_session())
+
 class ForgottenForm(WrappedElement):
     """Represents the Forgotten Username/Password / Resend Registration form.
     They are the same component."""
@@ -1231,8 +1264,9 @@ class Profile(WrappedElement):
 
     def set_partner(self) -> None:
         """Randomly sets the value of the Travel Partner field. Returns the chosen value."""
-        opt = random.choice(self.dr.flashy_find_element('[name="affiliationtype"]', self.element)
-                            .find_elements_by_css_selector('option:not([value=""])'))
+        sel = self.dr.flashy_find_element('[name="affiliationtype"]', self.element)
+        # Waits for the options, they might still be being filled in.
+        opt = random.choice(self.dr.quietly_find_elements('option:not([value=""])', sel))
         opt.click()
         return opt.text
 
@@ -1244,8 +1278,8 @@ class Profile(WrappedElement):
 
     def set_state(self) -> str:
         """Randomly sets the value of the State field. Returns the chosen value."""
-        opt = random.choice(self.dr.flashy_find_element('[name="state"]', self.element)
-                            .find_elements_by_css_selector('option:not([value=""])'))
+        sel = self.dr.flashy_find_element('[name="state"]', self.element)
+        opt = random.choice(self.dr.quietly_find_elements('option:not([value=""])', sel))
         opt.click()
         return opt.get_attribute('value')
 
@@ -1266,8 +1300,8 @@ class Profile(WrappedElement):
 
     def module_badges(self) -> Set[str]:
         """Checks the Recent Achievements section, returns a set of the badges attained."""
-        return {x.get_attribute('alt').split('_')[-1] for x in self.dr.flashy_find_elements(
-            '.Achievements .profile-status img', self.element)}
+        return {x.split('_')[-1] for x in self.dr.get_properties(
+            '.Achievements .profile-status img', 'alt', self.element)}
 
     def download_certificate(self) -> None:
         """Clicks the Download Certificate link."""
@@ -1568,8 +1602,8 @@ class AussieStore(WrappedElement):
 
         def get_product_names(self) -> List[str]:
             """Gets a list of the names of all of the Products in the Cart."""
-            return [x.text.casefold()
-                    for x in self.dr.flashy_find_elements('.cell-title', self.element)]
+            return [x.casefold()
+                    for x in self.dr.get_properties('.cell-title', 'text', self.element)]
 
         def count(self) -> int:
             """Counts the number of Products in the Cart."""
@@ -1,27 +1,65 @@
 """This is where all the specific Webdriver implementation details go."""
 
+import os
 import re
+import time
+import datetime
+import json
 import quopri
+import ssl
+import select
 import imaplib
-from typing import List, Set, Union, Any, Callable
+import functools
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from typing import List, Set, Tuple, Union, Any, Callable
 from selenium.webdriver import Chrome, Edge, Firefox, Ie, Opera, Safari, FirefoxProfile
-from selenium.webdriver.common.by import By
+from selenium.webdriver.remote.webdriver import WebDriver
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.remote.webelement import WebElement
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from selenium.common.exceptions import (NoSuchElementException, TimeoutException,
+                                        NoAlertPresentException, WebDriverException,
+                                        InvalidSelectorException, JavascriptException)
 from selenium.webdriver.chrome.options import Options as ChromeOptions
-import bs4
+from selenium.webdriver.firefox.options import Options as FirefoxOptions
+import mailparse
+import mailhost
+try:    # Only needed for measuring the browsers' memory use, not a big deal if it's missing.
+    import psutil
+except ImportError:
+    psutil = None
 
     ###Some Magic Numbers, default values.###
 # """How long, in seconds, to search the DOM before declaring an Element Not Found."""
 LONG_WAIT = 30
 # """Time in seconds to poll for something that should be absent or already here."""
 SHORT_WAIT = 2
+# """The polling interval of the wait loops starts at POLL_START, and doubles up to POLL_MAX."""
+POLL_START = 0.05
+POLL_MAX = 0.5
+# """The most other sites a pooled browser can have visited and still be cleaned up for the next
+# test, where each has to be visited again to clear it. More than that, and it's retired instead."""
+MAX_RESET_ORIGINS = 3
+# """How long, in seconds, an async script may run. The scripts keep their own, shorter, deadlines."""
+SCRIPT_TIMEOUT = 600
+
+# """The upper bounds, in seconds, of the profiler's latency histogram buckets. Slower goes in one more."""
+PROFILE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# """How long, in seconds, a login's cookies are trusted for. Comfortably inside the site's timeout."""
+LOGIN_TTL = 15 * 60
+# """The cookie fields that add_cookie takes. Some browsers hand out extras it won't take back."""
+COOKIE_KEYS = ('name', 'value', 'path', 'domain', 'secure', 'httpOnly', 'expiry')
 
 # Parameterise this word to remember the spelling.
 LATIN_EMAIL_ENCODING = 'windows-1252'
+# """How long, in seconds, a pooled IMAP connection can sit idle before it gets a NOOP to check it."""
+IMAP_KEEPALIVE = 60
+# """The most, in seconds, to IDLE in one go. The server's reply to DONE is awaited for this long too."""
+IDLE_WAIT = 30
+
+# The window size to use in headless mode, if none is given. Big enough for the modules' stage.
+DEFAULT_VIEWPORT = (1920, 1080)
 
 # A mapping of browser names to WebDriver Classes.
 BROWSERS = {'chrome': Chrome, 'edge': Edge, 'firefox': Firefox,
@@ -38,6 +76,63 @@ BLIP_SCRIPT = (
     'e>");wp=window.top;b=arguments[0];for(var a=0;a<b.length;a++){var c=b[a];wp.scrollTo(0,c.getBo'
     'undingClientRect().top+wp.pageYOffset-wp.innerHeight/2),c.style.animationDuration="0.5s",c.sty'
     'le.animationName="",setTimeout(function(e){e.style.animationName="selhian"},10,c)}}catch(e){}')
+# """The same highlight, but only injects the animation's stylesheet once per document, then just
+# toggles a class. No scrolling, no timeouts. For when nobody is watching the browser anyway."""
+LIGHT_BLIP_SCRIPT = (
+    'var b=arguments[0];for(var a=0;a<b.length;a++){try{var c=b[a],d=c.ownerDocument;if(!d.getElem'
+    'entById("selhist")){var s=d.createElement("style");s.id="selhist";s.textContent="@keyframes s'
+    'elhian{0%{outline: 0px outset transparent;}50%{outline: 10px outset yellow; background-color:'
+    ' yellow}100%{outline: 0px outset transparent;}} .selhi{animation: selhian 0.5s}";d.head.appen'
+    'dChild(s)}c.classList.remove("selhi");void c.offsetWidth;c.classList.add("selhi")}catch(e){}}')
+# The highlighting modes. full: the scrolling highlight, light: LIGHT_BLIP_SCRIPT, off: nothing.
+HIGHLIGHTS = ('full', 'light', 'off')
+# """A JS script that clears the current page's site's web storage."""
+CLEAR_STORAGE_SCRIPT = 'try{window.localStorage.clear();window.sessionStorage.clear()}catch(e){}'
+# """An async JS script, that calls back with true once the first element matching a selector is
+# (or isn't) there (and visible). Watches for DOM changes rather than polling, so it returns as soon
+# as it can. Calls back with false if that hasn't happened after the given number of milliseconds.
+# Arguments are: selector, want present, check visible, timeout ms, within element or null.
+# Not being in the DOM at all counts as gone. An invalid selector calls back with the error message."""
+WAIT_SCRIPT = (
+    'var s=arguments[0],w=arguments[1],v=arguments[2],m=arguments[3],r=arguments[4]||document,d=ar'
+    'guments[5],o,t,i;try{r.querySelector(s)}catch(x){return d("Invalid selector "+s+": "+x.messag'
+    'e)}function k(){var e=r.querySelector(s);return(!!e&&(!v||!!(e.offsetWidth||e.offsetHeight||e'
+    '.getClientRects().length)))===w}function f(y){if(o)o.disconnect();clearTimeout(t);clearInterv'
+    'al(i);d(y)}if(k())return d(true);t=setTimeout(function(){f(k())},m);if(window.MutationObserve'
+    'r){o=new MutationObserver(function(){if(k())f(true)});o.observe(r===document?document.docume'
+    'ntElement:r,{childList:true,subtree:true,attributes:true})}else{i=setInterval(function(){if(k'
+    '())f(true)},100)}')
+# """An async JS script that waits, in the page, until the url contains a given bit, the document
+# is complete, and (if asked) the network has been idle for a while: no jQuery ajax going, and no
+# new resources loaded. Calls back with whether it managed that, and the page's load timings.
+# Arguments are: url bit, wait for network idle, idle ms, timeout ms."""
+PAGE_SCRIPT = (
+    'var u=arguments[0],n=arguments[1],q=arguments[2],m=arguments[3],d=arguments[4],t=Date.now(),l'
+    '=-1,c=t;function i(){if(!n)return true;var j=window.jQuery,r=window.performance&&performance.g'
+    'etEntriesByType?performance.getEntriesByType("resource").length:0;if(j&&j.active||r!==l){l=r;'
+    'c=Date.now();return false}return Date.now()-c>=q}function e(k){var p=window.performance&&perf'
+    'ormance.timing||{},s=p.navigationStart||0;d({ok:k,href:location.href,waited:Date.now()-t,resp'
+    'onse:p.responseStart-s,interactive:p.domContentLoadedEventEnd-s,load:p.loadEventEnd-s})}(func'
+    'tion f(){if(location.href.indexOf(u)!==-1&&document.readyState==="complete"&&i())return e(tru'
+    'e);if(Date.now()-t>m)return e(false);setTimeout(f,50)})()')
+# """How long, in milliseconds, the network has to be quiet to count as idle."""
+IDLE_MS = 500
+# """A JS script that finds the first match of each [selector, within] pair. Nulls if missing."""
+BATCH_FIND_SCRIPT = (
+    'return arguments[0].map(function(p){try{return(p[1]||document).querySelector(p[0])}catch(e){'
+    'return null}});')
+# """A JS script that gets some properties of every element matching a selector (or of every
+# element in a list), all in one go. A row of values per element. Like get_attribute: the property
+# if there is one, otherwise the attribute, but href and src only if they're actually set.
+# And two made up ones, like WebElement's: text (the rendered text, '' if hidden) and displayed.
+# Arguments are: selector or elements, within, property names."""
+PROPERTIES_SCRIPT = (
+    'var s=arguments[0],p=arguments[2],l=typeof s==="string"?(arguments[1]||document).querySelectorA'
+    'll(s):s;function w(e){return!!(e.offsetWidth||e.offsetHeight||e.getClientRects().length)&&getCo'
+    'mputedStyle(e).visibility!=="hidden"}return Array.prototype.map.call(l,function(e){return p.map'
+    '(function(n){if(n==="text")return w(e)?(e.innerText||e.textContent||"").trim():"";if(n==="displ'
+    'ayed")return w(e);if(n==="href"||n==="src")return e.hasAttribute(n)?e[n]:null;var v=e[n];return'
+    ' v===undefined||v!==null&&typeof v==="object"?e.getAttribute(n):v})})')
 # """Type annotation, referring to either a WebElement, or a list of them."""
 ELEMENT_OR_LIST = Union[WebElement, List[WebElement]]
 ELEMENT_LIST = List[WebElement]
@@ -46,6 +141,10 @@ def to_list(item) -> list:
     """Wraps the input into a list if it wasn't already one."""
     return item if isinstance(item, list) else [item]
 
+def origin_of(url: str) -> str:
+    """The scheme and host of a url, like https://www.example.com. None if it isn't http(s)."""
+    return '/'.join(url.split('/')[:3]) if url and url.startswith('http') else None
+
 def find_error_improver(func: Callable):
     """A decorator, gets the NoSuchElementException to actually tell you what the problem is."""
     def actually_helpful(self, selector, within=None):
@@ -57,6 +156,86 @@ def find_error_improver(func: Callable):
                 selector, self.current_url())) from None
     return actually_helpful
 
+def launch_browser(browser: str, headless: bool = False, viewport: Tuple[int, int] = None,
+                   lean: bool = False) -> WebDriver:
+    """Starts up a browser, with all of the workarounds it needs. Only Chrome and Firefox can do
+    headless, with a fixed size virtual window, or lean: no images, web fonts, or animations.
+    The others get a regular maximised window no matter what."""
+    if headless and not viewport:
+        viewport = DEFAULT_VIEWPORT
+    # A workaround. Firefox gets suspicious when you hide a password in the url.
+    if browser == 'firefox':
+        p = FirefoxProfile()
+        p.set_preference('network.http.phishy-userpass-length', 255)
+        if lean:
+            p.set_preference('permissions.default.image', 2)
+            p.set_preference('browser.display.use_document_fonts', 0)
+            p.set_preference('ui.prefersReducedMotion', 1)
+            p.set_preference('toolkit.cosmeticAnimations.enabled', False)
+        o = FirefoxOptions()
+        if headless:
+            o.add_argument('-headless')
+        driver = Firefox(p, options=o)
+    # Chrome, too, just up and decided to stop supporting this one day.
+    elif browser == 'chrome':
+        c = ChromeOptions()
+        c.add_argument('--disable-blink-features=BlockCredentialedSubresources')
+        if headless:
+            c.add_argument('--headless')
+            c.add_argument('--disable-gpu')
+            c.add_argument('--window-size={0},{1}'.format(*viewport))
+        if lean:
+            c.add_argument('--blink-settings=imagesEnabled=false')
+            c.add_argument('--disable-remote-fonts')
+            c.add_argument('--force-prefers-reduced-motion')
+        driver = Chrome(chrome_options=c)
+    else:
+        driver = BROWSERS[browser]()
+    if viewport and browser in ('chrome', 'firefox'):
+        driver.set_window_size(*viewport)
+    else:
+        driver.maximize_window()
+    # The async scripts time themselves out, so just set a generous limit, once.
+    driver.set_script_timeout(SCRIPT_TIMEOUT)
+    return driver
+
+def poll(condition: Callable, timeout: float, desc: str) -> Any:
+    """Repeatedly calls the given no-input function until it returns truthy, then returns that.
+    Checks again quickly at first, then backs off, so short waits stay short without the long
+    ones hammering the browser. Raises a TimeoutException (explained with desc) after timeout."""
+    deadline, interval = time.time() + timeout, POLL_START
+    while True:
+        result = condition()
+        if result:
+            return result
+        if time.time() + interval > deadline:
+            raise TimeoutException('Timed out waiting for condition: {0}'.format(desc))
+        time.sleep(interval)
+        interval = min(interval * 2, POLL_MAX)
+
+def wait_for_selector(driver: WebDriver, selector: str, present: bool = True, visible: bool = False,
+                      within: WebElement = None, timeout: float = LONG_WAIT) -> bool:
+    """Waits for an element matching the selector to turn up (or, if not present, to be gone),
+    using WAIT_SCRIPT. If visible, being there but hidden counts as not being there.
+    Returns whether that happened within the timeout. Does not raise a TimeoutException,
+    but does raise an InvalidSelectorException, rather than wait on a typo forever."""
+    deadline = time.time() + timeout
+    while True:
+        remaining = max(deadline - time.time(), 0)
+        try:
+            found = driver.execute_async_script(
+                WAIT_SCRIPT, selector, present, visible, int(remaining * 1000), within)
+        except JavascriptException:
+            # The page was navigated away from while the script was waiting. Anything else, like
+            # a closed window, or a stale within, isn't going to get better by waiting.
+            if time.time() >= deadline:
+                return False
+            time.sleep(POLL_START)
+            continue
+        if isinstance(found, str):
+            raise InvalidSelectorException(found)
+        return found
+
 class Drivery:  # Don't give me that 'too many public methods' nonsense. pylint: disable=R0904
     """Because Module-Level-State is apparently a terrible idea, have a class singleton.
     Wraps a WebDriver instance, and does a bunch of other useful things."""
@@ -64,31 +243,133 @@ class Drivery:  # Don't give me that 'too many public methods' nonsense. pylint:
         if globs is None: return    # Just to handle the CP thing declaration.
         # To aid in checking for Page Loaded Status, track the last link clicked.
         self.last_link = ''
+        self.configure(globs)
+        self.browser = globs['browser']
+        # How many tests this browser has been handed out to, see SessionPool.
+        self.uses = 0
+        # How many of each WebDriver command this browser has been sent. See count_commands.
+        self.commands = Counter()
+        # The timings of each page load waited for, see wait_for_page.
+        self.page_stats = []
+        # The sites this browser has been to since its last reset, the ones reset has to clean up.
+        self.visited = set()
+        self.driver = launch_browser(globs['browser'], globs.get('headless'),
+                                     globs.get('viewport'), globs.get('lean'))
+        self.count_commands()
+        # No implicit waiting, every wait is explicit and has its own deadline. See wait_for.
+        self.driver.implicitly_wait(0)
+
+    def count_commands(self) -> None:
+        """Every WebDriver command, WebElement ones too, goes through the driver's execute method.
+        So wrap that, to keep count of how many round trips a test actually makes."""
+        execute = self.driver.execute
+        def counted(command, params=None):
+            """Counts the command, then sends it on as usual."""
+            self.commands[command] += 1
+            return execute(command, params)
+        self.driver.execute = counted
+        PROFILER.watch(self.driver)
+
+    def memory_usage(self) -> int:
+        """How much memory, in bytes, the browser is using: the driver executable, the browser,
+        and all of the browser's helper processes. None if it can't tell, or psutil is missing."""
+        if psutil is None:
+            return None
+        try:
+            root = psutil.Process(self.driver.service.process.pid)
+            procs = [root] + root.children(recursive=True)
+        except (AttributeError, psutil.Error):
+            return None
+        total = 0
+        for proc in procs:
+            try:
+                total += proc.memory_info().rss
+            except psutil.Error:  # Tabs come and go, never mind that one.
+                pass
+        return total
+
+    def configure(self, globs: dict) -> None:
+        """Takes on the locale and environment settings of the given globs.
+        Separate from the init, so a pooled browser can be handed to a different locale's test."""
         self.base_url = globs['base_url']
         self.locale = globs['locale']
         self.locale_url = self.base_url + self.locale
         self.auth = globs['auth']
         self.cn_mode = globs['cn_mode'] # yeah, but CP needs it apparently.
-        # A workaround. Firefox gets suspicious when you hide a password in the url.
-        if globs['browser'] == 'firefox':
-            p = FirefoxProfile()
-            p.set_preference('network.http.phishy-userpass-length', 255)
-            self.driver = Firefox(p)
-        # Chrome, too, just up and decided to stop supporting this one day.
-        elif globs['browser'] == 'chrome':
-            c = ChromeOptions()
-            c.add_argument('--disable-blink-features=BlockCredentialedSubresources')
-            self.driver = Chrome(chrome_options=c)
-        else:
-            self.driver = BROWSERS[globs['browser']]()
-        self.driver.implicitly_wait(LONG_WAIT)
-        self.driver.maximize_window()
+        self.highlight = globs.get('highlight') or 'full'
+        # Whether wait_for_page also waits for the ajax and resource loading to settle down.
+        self.network_idle = bool(globs.get('network_idle'))
+        # How long to wait for things, in seconds. See set_wait.
+        self.long_wait = LONG_WAIT
+
+    def reset(self) -> bool:
+        """Wipes the browser back to a fresh-session state: no extra windows, no frame focus,
+        no cookies or web storage. Returns False if the browser is broken, or can't be wiped
+        clean enough, and should be retired (the next test then gets a fresh profile).
+        Chrome can clear every site's cookies from anywhere, and each visited site's storage.
+        The others can only clear the cookies and storage of the page they're on, so each site
+        the tests went to has to be visited again. Only the ones the browser was actually on
+        (via get or wait_for_page, or at the end) are known: cookies that other sites set from
+        within a page, like third party frames, can't be got at there. Too many sites to visit,
+        see MAX_RESET_ORIGINS, and it's quicker to start afresh."""
+        try:
+            self.driver.switch_to.alert.dismiss()
+        except (NoAlertPresentException, WebDriverException):
+            pass    # No alert is the usual case, and a dead browser is caught below anyway.
+        try:
+            self.close_other_windows()
+            self.driver.switch_to.default_content()
+            self.visited.add(origin_of(self.current_url()))
+            self.visited.discard(None)
+            if hasattr(self.driver, 'execute_cdp_cmd'):
+                self.driver.execute_script(CLEAR_STORAGE_SCRIPT)    # The tab's sessionStorage.
+                self.driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+                for origin in self.visited:
+                    self.driver.execute_cdp_cmd('Storage.clearDataForOrigin',
+                                                {'origin': origin, 'storageTypes': 'all'})
+            else:
+                home = origin_of(self.base_url)
+                others = sorted(self.visited - {home})
+                if len(others) > MAX_RESET_ORIGINS:
+                    return False
+                for origin in [home] + others:
+                    if origin == home:
+                        self.go_to_site()
+                    else:
+                        self.driver.get(origin + '/robots.txt')
+                    self.driver.delete_all_cookies()
+                    self.driver.execute_script(CLEAR_STORAGE_SCRIPT)
+            self.driver.get('about:blank')
+        except WebDriverException:
+            return False
+        self.last_link = ''
+        self.page_stats = []
+        self.visited = set()
+        return True
+
+    def go_to_site(self) -> None:
+        """Cookies and storage can only be got at for the page currently open, so get back to
+        the environment's domain, if not there already. That's where the sign in cookies live."""
+        if self.current_url().split('/')[2:3] != self.base_url.split('/')[2:3]:
+            self.get(self.base_url + '/robots.txt')
+
+    def export_session(self) -> List[dict]:
+        """Gets the site's cookies, to sign another browser in with, see import_session."""
+        self.go_to_site()
+        return self.driver.get_cookies()
+
+    def import_session(self, cookies: List[dict]) -> None:
+        """Replaces this browser's cookies for the site with the given ones, from export_session.
+        With a signed in browser's cookies, this one will be signed in as well."""
+        self.go_to_site()
+        self.driver.delete_all_cookies()
+        for cookie in cookies:
+            self.driver.add_cookie({k: v for k, v in cookie.items() if k in COOKIE_KEYS})
 
     def set_wait(self, wait: int) -> None:
-        """Set the driver's implicit waiting value and the LONG_WAIT value too."""
-        global LONG_WAIT
-        LONG_WAIT = wait
-        self.driver.implicitly_wait(wait)
+        """Set how long this browser waits for things before giving up, in seconds.
+        Only until it gets handed on to the next test, that goes back to LONG_WAIT."""
+        self.long_wait = wait
 
     def close(self) -> None:
         """The testing bit calls this at the end of each test. Clears the session."""
@@ -124,6 +405,7 @@ class Drivery:  # Don't give me that 'too many public methods' nonsense. pylint:
         """For whatever reason, there is no Basic Authentication that works across all browsers.
         This has workarounds for each. Ironically, only IE supports the correct method."""
         isie = isinstance(self.driver, Ie)
+        self.visited.add(origin_of(url))
         if not isie and self.auth:
             url = re.sub('(https?://)', r'\1{0}:{1}@'.format(*self.auth), url)
         self.driver.get(url)
@@ -145,54 +427,74 @@ class Drivery:  # Don't give me that 'too many public methods' nonsense. pylint:
         """Returns the window's vertical scroll position as stated by javascript's window.scrollY"""
         return self.driver.execute_script('return window.scrollY;')
 
-    def wait_for_page(self, url=None) -> None:
+    def wait_for_page(self, url=None, network_idle: bool = None) -> dict:
         """Holds up execution until the current page's url contains the Last Link value (or, if
-        given, a custom url) and its document.readyState is 'complete'. A decent approximation?"""
-        script = 'return document.readyState === "complete";'
+        given, a custom url) and its document.readyState is 'complete'. A decent approximation?
+        With network_idle (default: the network_idle setting), also waits for the ajax to stop.
+        All the checking happens in the page, see PAGE_SCRIPT. Returns the load's timings,
+        and adds them to page_stats too."""
         if url is None:
             url = self.last_link
-        try:
-            WebDriverWait(self.driver, LONG_WAIT).until(
-                lambda _: url in self.current_url())
-            WebDriverWait(self.driver, LONG_WAIT).until(
-                lambda _: self.driver.execute_script(script))
-        except TimeoutException:
-            raise TimeoutException(
-                'Timed out waiting for {0} to load.'.format(url)) from None
+        idle = self.network_idle if network_idle is None else network_idle
+        start, tries = time.time(), 0
+        while True:
+            tries += 1
+            remaining = max(start + self.long_wait - time.time(), 0)
+            try:
+                stats = self.driver.execute_async_script(
+                    PAGE_SCRIPT, url, idle, IDLE_MS, int(remaining * 1000))
+            except JavascriptException:
+                # The old page unloaded while the script was running on it. Try the new one.
+                if remaining > 0:
+                    time.sleep(POLL_START)
+                    continue
+                stats = {'ok': False}
+            if not stats['ok']:
+                raise TimeoutException('Timed out waiting for {0} to load.'.format(url))
+            break
+        self.visited.add(origin_of(stats.get('href')))
+        stats.update(url=url, tries=tries, total=time.time() - start)
+        self.page_stats.append(stats)
+        return stats
+
+    def wait_for(self, selector: str, present: bool = True, visible: bool = False,
+                 within: WebElement = None, timeout: float = None) -> bool:
+        """Waits until an element matching the selector is there (or, if not present, is gone).
+        If visible, a hidden element counts as not being there. Returns as soon as the page
+        changes to match, or False once the timeout (default: the usual long wait) is up."""
+        return wait_for_selector(self.driver, selector, present, visible, within,
+                                 self.long_wait if timeout is None else timeout)
+
+    def find_all(self, selector: str, within: WebElement = None, timeout: float = None
+                ) -> ELEMENT_LIST:
+        """Finds all of the elements matching a CSS selector, optionally within a given element.
+        If there aren't any yet, waits for up to the timeout for some to turn up, then tries again.
+        The browser-provided webdriver self.driver implementations seem to not return a
+        list when only one element matches, so fixing that here."""
+        found = to_list((within or self.driver).find_elements_by_css_selector(selector))
+        if not found and timeout != 0 and self.wait_for(selector, within=within, timeout=timeout):
+            found = to_list((within or self.driver).find_elements_by_css_selector(selector))
+        return found
 
     def wait_until_present(self, selector: str) -> WebElement:
         """Holds up execution until the selectored elment is visibly present.
         Use this instead of quietly_find if the target is in the DOM, but hidden."""
-        try:
-            return WebDriverWait(self.driver, LONG_WAIT).until(
-                EC.visibility_of_element_located((By.CSS_SELECTOR, selector)))
-        except TimeoutException:
-            raise TimeoutException(
-                'Timed out waiting for {0} to appear.'.format(selector)) from None
+        if not self.wait_for(selector, visible=True):
+            raise TimeoutException('Timed out waiting for {0} to appear.'.format(selector))
+        return self.driver.find_element_by_css_selector(selector)
 
-    def wait_until_gone(self, selector: str) -> WebElement:
+    def wait_until_gone(self, selector: str) -> bool:
         """Holds up execution until the selectored element is not visibly present.
-        EC doesn't seem to support local searches, so be sure the selector is page-unique."""
-        try:
-            # The poll_freq value is not the wait-til-fail time. Apparently.
-            self.driver.implicitly_wait(0.5)
-            ret = WebDriverWait(self.driver, LONG_WAIT).until(
-                EC.invisibility_of_element_located((By.CSS_SELECTOR, selector)))
-            self.driver.implicitly_wait(LONG_WAIT)
-            return ret
-        except TimeoutException:
-            raise TimeoutException(
-                'Timed out waiting for {0} to disappear.'.format(selector)) from None
+        Be sure the selector is page-unique, only the first match is checked."""
+        if not self.wait_for(selector, present=False, visible=True):
+            raise TimeoutException('Timed out waiting for {0} to disappear.'.format(selector))
+        return True
 
     def wait_until(self, condition: Callable, desc: str) -> Any:
         """Holds up execution, repeatedly calling the given function until it returns truthy.
         The given condition lambda should have no inputs.
         desc should explain what the lambda does, as the contents can't really be examined."""
-        try:
-            return WebDriverWait(self.driver, LONG_WAIT).until(lambda _: condition())
-        except TimeoutException:
-            raise TimeoutException(
-                'Timed out waiting for condition: {0}'.format(desc)) from None
+        return poll(condition, self.long_wait, desc)
 
     def switch_to_window(self, window: int) -> None:
         """Switch WebDriver's focus to the given open tab or window. Zero based indexing."""
@@ -220,19 +522,22 @@ class Drivery:  # Don't give me that 'too many public methods' nonsense. pylint:
 
     def blip_element(self, elle: ELEMENT_OR_LIST) -> ELEMENT_OR_LIST:
         """Scrolls (an) element(s) into view, and highlights (i)t(hem).
-        Returns the found element(s) as well, just for chaining purposes."""
+        Returns the found element(s) as well, just for chaining purposes.
+        How much of that actually happens depends on the highlight mode, see HIGHLIGHTS."""
+        if self.highlight == 'off' or elle == []:   # Don't even bother the browser.
+            return elle
         # Kick off the highlight animation, list-wrapped for the sake of only writing one handler.
-        self.driver.execute_script(BLIP_SCRIPT, to_list(elle))
+        self.driver.execute_script(
+            LIGHT_BLIP_SCRIPT if self.highlight == 'light' else BLIP_SCRIPT, to_list(elle))
         return elle
 
     def check_visible_quick(self, selector: str, within: WebElement = None) -> bool:
         """Check for an element without potentially spending a lot of time polling the DOM.
         Ususally used when asserting an element's absence, saves waiting the full timeout."""
-        within = within or self.driver
-        self.driver.implicitly_wait(SHORT_WAIT)
-        elements = within.find_elements_by_css_selector(selector)
-        self.driver.implicitly_wait(LONG_WAIT)
-        return len(elements) != 0 and elements[0].is_displayed()
+        if self.wait_for(selector, visible=True, within=within, timeout=SHORT_WAIT):
+            elements = (within or self.driver).find_elements_by_css_selector(selector)
+            return len(elements) != 0 and elements[0].is_displayed()
+        return False
 
     def execute_mouse_over(self, element: WebElement) -> None:
         """Simulates the mouse moving into an element."""
@@ -245,38 +550,74 @@ class Drivery:  # Don't give me that 'too many public methods' nonsense. pylint:
     @find_error_improver
     def quietly_find_element(self, selector: str, within: WebElement = None) -> WebElement:
         """Finds a single element matching a CSS selector, optionally within a given element."""
-        within = within or self.driver
-        return within.find_element_by_css_selector(selector)
+        found = self.find_all(selector, within)
+        if not found:
+            raise NoSuchElementException(selector)
+        return found[0]
 
     @find_error_improver
     def quietly_find_elements(self, selector: str, within: WebElement = None) -> ELEMENT_LIST:
         """Finds multiple elements that match a CSS selector, optionally within a given element."""
-        within = within or self.driver
-        return to_list(within.find_elements_by_css_selector(selector))
+        return self.find_all(selector, within)
 
     @find_error_improver
     def flashy_find_element(self, selector: str, within: WebElement = None) -> WebElement:
         """Finds a single element matching a CSS selector, highlights it as well."""
-        within = within or self.driver
-        return self.blip_element(within.find_element_by_css_selector(selector))
+        return self.blip_element(self.quietly_find_element(selector, within))
 
     @find_error_improver
     def flashy_find_elements(self, selector: str, within: WebElement = None) -> ELEMENT_LIST:
-        """Finds multiple elements that match a CSS selector, highlights them as well.
-
-        The browser-provided webdriver self.driver implementations seem to not return a
-        list when only one element matches, so fixing that here."""
-        within = within or self.driver
-        return self.blip_element(to_list(within.find_elements_by_css_selector(selector)))
+        """Finds multiple elements that match a CSS selector, highlights them as well."""
+        return self.blip_element(self.find_all(selector, within))
 
     @find_error_improver
     def find_visible_element(self, selector: str, within: WebElement = None) -> WebElement:
         """Given a selector that could match multiple different elements,
         return the one that is currently visible, not the first one that matches."""
-        within = within or self.driver
-        return self.blip_element([x for x in within.find_elements_by_css_selector(selector)
+        return self.blip_element([x for x in self.find_all(selector, within)
                                   if x.is_displayed()][0])
 
+    def get_properties(self, elements: Union[str, ELEMENT_LIST], props: Union[str, List[str]],
+                       within: WebElement = None) -> list:
+        """Gets some properties of every element matching a CSS selector (optionally within a
+        given element), or of every element in a list, in a single script call, instead of a
+        get_attribute or .text call per element per property. See PROPERTIES_SCRIPT for which.
+        Given one property name, returns a list of its values. Given a list, a list per element.
+        Like find_all, if nothing matches the selector yet, waits a while for something to."""
+        names = [props] if isinstance(props, str) else list(props)
+        if isinstance(elements, str):
+            found = self.driver.execute_script(PROPERTIES_SCRIPT, elements, within, names)
+            if not found and self.wait_for(elements, within=within):
+                found = self.driver.execute_script(PROPERTIES_SCRIPT, elements, within, names)
+        else:
+            elements = to_list(elements)
+            found = self.driver.execute_script(
+                PROPERTIES_SCRIPT, elements, None, names) if elements else []
+        return [row[0] for row in found] if isinstance(props, str) else found
+
+    def get_hrefs(self, selector: str, within: WebElement = None) -> List[str]:
+        """Gets the href of every element matching a CSS selector, optionally within a given
+        element. Just get_properties, for the one property."""
+        return self.get_properties(selector, 'href', within)
+
+    def find_batch(self, pairs: List[Tuple[str, WebElement]], wait: bool = True
+                  ) -> Tuple[List[WebElement], Set[str]]:
+        """Finds the first match for each of a list of (selector, within) pairs, all in a single
+        script call, and highlights them. within can be None, for the whole page.
+        Returns the found elements (None where missing) and the set of missing selectors.
+        If wait, tries again until nothing is missing, or the usual timeout is up."""
+        deadline = time.time() + self.long_wait
+        while True:
+            found = self.driver.execute_script(BATCH_FIND_SCRIPT, [list(p) for p in pairs])
+            missing = {sel for (sel, _), ele in zip(pairs, found) if ele is None}
+            if not missing or not wait or time.time() > deadline:
+                break
+            # Wait for one of the missing ones to turn up, then check them all again.
+            sel, within = next(p for p in pairs if p[0] in missing)
+            self.wait_for(sel, within=within, timeout=max(deadline - time.time(), 0))
+        self.blip_element([ele for ele in found if ele is not None])
+        return found, missing
+
     def get_parent_element(self, element: WebElement) -> WebElement:
         """Gets the immediate parent of the given element."""
         return element.find_element_by_xpath('..')
@@ -290,72 +631,578 @@ class Drivery:  # Don't give me that 'too many public methods' nonsense. pylint:
         """Executes a javascript snippet, returning what the script returns."""
         return self.driver.execute_script(script, *args)
 
+class SessionPool:
+    """Keeps this process's browsers alive between tests, instead of starting a new one for each.
+    A released browser is reset and parked, and retired once it breaks or has been used max_uses
+    times. A max_uses of 0 means never reuse: one browser per test, like it used to be."""
+    def __init__(self, max_uses: int = 0):
+        self.max_uses = max_uses
+        self.idle = {}      # Browser name: [Parked Drivery objects]
+        self.launched = self.reused = self.retired = self.resets = 0
+        self.reset_time = 0.0
+        self.peak_memory = 0    # The most memory any one browser was seen using, in bytes.
+
+    def acquire(self, globs: dict) -> Drivery:
+        """Hands out a browser of the globs' browser type, set up for the globs' locale."""
+        parked = self.idle.get(globs['browser'])
+        if parked:
+            dr = parked.pop()
+            dr.configure(globs)
+            self.reused += 1
+        else:
+            dr = Drivery(globs)
+            self.launched += 1
+        dr.uses += 1
+        return dr
+
+    def release(self, dr: Drivery) -> None:
+        """Takes a browser back after a test. Resets it for the next one, or retires it."""
+        self.peak_memory = max(self.peak_memory, dr.memory_usage() or 0)
+        if dr.uses < self.max_uses:
+            start = time.perf_counter()
+            healthy = dr.reset()
+            self.reset_time += time.perf_counter() - start
+            self.resets += 1
+            if healthy:
+                self.idle.setdefault(dr.browser, []).append(dr)
+                return
+        self.retire(dr)
+
+    def retire(self, dr: Drivery) -> None:
+        """Shuts down a browser for good. If it's already dead, never mind."""
+        self.retired += 1
+        try:
+            dr.close()
+        except WebDriverException:
+            pass
+
+    def drain(self) -> None:
+        """Shuts down all of the parked browsers. Call this when the process is done testing."""
+        for parked in self.idle.values():
+            while parked:
+                self.retire(parked.pop())
+
+    def report(self) -> str:
+        """A line or two summarising how much browser startup the pool saved."""
+        report = ('Browser sessions: {0} launched, {1} reused, {2} retired. '
+                  'Average reset time: {3:.2f}s\n').format(
+                      self.launched, self.reused, self.retired,
+                      self.reset_time / self.resets if self.resets else 0)
+        if psutil is not None:
+            report += 'Peak browser memory: {0:.0f}MB, worker process memory: {1:.0f}MB\n'.format(
+                self.peak_memory / 2**20, psutil.Process().memory_info().rss / 2**20)
+        return report
+
+# The process-wide pool. Each worker process gets its own copy, browsers can't cross processes.
+SESSIONS = SessionPool()
+
+class LoginCache:
+    """Remembers signed in sessions' cookies, by environment, locale and username, so a test can
+    borrow a recent login instead of going through the sign in form again. Kept in a JSON file,
+    so all of the worker processes, and the next run if it's soon enough, can share them.
+    An entry lasts LOGIN_TTL, or until one of its cookies expires. With no path, does nothing."""
+    def __init__(self, path: str = None):
+        self.path = path
+
+    def load(self) -> dict:
+        """Reads the file. Missing, or half written, just means nothing cached."""
+        try:
+            with open(self.path, encoding='UTF-8') as fil:
+                return json.load(fil)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, data: dict) -> None:
+        """Writes the file, in one go, so the other processes never read half of it."""
+        temp = '{0}.{1}'.format(self.path, os.getpid())
+        try:
+            with open(temp, mode='w', encoding='UTF-8') as fil:
+                json.dump(data, fil)
+            os.replace(temp, self.path)
+        except OSError as ex:
+            print('Failed to save the login cache:', ex)
+
+    def get(self, env: str, locale: str, user: str) -> List[dict]:
+        """The cookies of the user's login, if there is a recent enough one. Otherwise None."""
+        if not self.path:
+            return None
+        entry = self.load().get('|'.join((env, locale, user)))
+        if not entry or entry['expires'] < time.time():
+            return None
+        return entry['cookies']
+
+    def put(self, env: str, locale: str, user: str, cookies: List[dict]) -> None:
+        """Remembers a freshly signed in user's cookies. Clears out the expired entries too."""
+        if not self.path:
+            return
+        now = time.time()
+        data = {k: v for k, v in self.load().items() if v['expires'] >= now}
+        data['|'.join((env, locale, user))] = {'cookies': cookies, 'expires': min(
+            [now + LOGIN_TTL] + [c['expiry'] for c in cookies if c.get('expiry')])}
+        self.save(data)
+
+    def forget(self, env: str, locale: str, user: str) -> None:
+        """Drops a login that turned out not to work, signed out or changed password, say."""
+        if not self.path:
+            return
+        data = self.load()
+        if data.pop('|'.join((env, locale, user)), None) is not None:
+            self.save(data)
+
+# The process's login cache. The runners give it a path, to turn it on.
+LOGINS = LoginCache()
+
+class Profiler:
+    """Opt-in timing of everything that talks to the browser, to see where a run's time goes.
+    Records, per kind, name and test: how many calls, how long in total, the slowest, and a
+    latency histogram (see PROFILE_BUCKETS). The kinds are 'command' (WebDriver round trips),
+    'method' (Drivery methods, with the selector if given one), 'element' (the WebElement click
+    overrides) and 'sleep'. Method times include the commands and sleeps they made.
+    Off until install is called, and then only in that process. See PROFILER."""
+    def __init__(self):
+        self.enabled = False
+        self.test = ''      # The test currently running, so its calls can be told apart.
+        self.stats = {}     # 'kind|name|test': {count, total, max, histogram}
+
+    def record(self, kind: str, name: str, seconds: float) -> None:
+        """Adds a call that took the given time to the stats."""
+        entry = self.stats.setdefault('{0}|{1}|{2}'.format(kind, name, self.test), {
+            'count': 0, 'total': 0.0, 'max': 0.0, 'histogram': [0] * (len(PROFILE_BUCKETS) + 1)})
+        entry['count'] += 1
+        entry['total'] += seconds
+        entry['max'] = max(entry['max'], seconds)
+        entry['histogram'][bisect_left(PROFILE_BUCKETS, seconds)] += 1
+
+    def wrap(self, func: Callable, kind: str, name: Union[str, Callable]) -> Callable:
+        """Returns the function, but timed while profiling is on. The name can be a function
+        of the call's arguments instead, to tell apart the commands, or the selectors."""
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            """Calls the function, and records how long it took."""
+            if not self.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(kind, name(*args, **kwargs) if callable(name) else name,
+                            time.perf_counter() - start)
+        return timed
+
+    def watch(self, driver: WebDriver) -> None:
+        """Times each of a WebDriver's commands. Every one of them goes through execute."""
+        driver.execute = self.wrap(driver.execute, 'command', lambda command, params=None: command)
+
+    def sleep(self, seconds: float, why: str) -> None:
+        """time.sleep, but counted as the given reason, so the deliberate waiting shows up."""
+        start = time.perf_counter()
+        time.sleep(seconds)
+        if self.enabled:
+            self.record('sleep', why, time.perf_counter() - start)
+
+    def install(self) -> None:
+        """Turns profiling on, timing all of the public Drivery methods. Only once, though."""
+        if self.enabled:
+            return
+        self.enabled = True
+        def method_name(attr):
+            """Name a method call after the method, and its selector if it was given one."""
+            return lambda _, *args, **kwargs: '{0} {1}'.format(attr, args[0]) if (
+                args and isinstance(args[0], str)) else attr
+        for attr, func in list(vars(Drivery).items()):
+            if callable(func) and not attr.startswith('_'):
+                setattr(Drivery, attr, self.wrap(func, 'method', method_name(attr)))
+
+    def take(self) -> dict:
+        """Hands over the stats recorded so far, and starts afresh."""
+        stats, self.stats = self.stats, {}
+        return stats
+
+    @staticmethod
+    def merge(into: dict, stats: dict) -> dict:
+        """Adds one lot of stats to another, like from several processes. Returns into."""
+        for key, entry in stats.items():
+            if key not in into:
+                into[key] = dict(entry, histogram=list(entry['histogram']))
+                continue
+            old = into[key]
+            old['count'] += entry['count']
+            old['total'] += entry['total']
+            old['max'] = max(old['max'], entry['max'])
+            old['histogram'] = [a + b for a, b in zip(old['histogram'], entry['histogram'])]
+        return into
+
+    @staticmethod
+    def summary(stats: dict) -> dict:
+        """Lays the stats out for the profile file: the total time per kind, then each entry,
+        slowest total first."""
+        rows = []
+        for key, entry in stats.items():
+            kind, name, test = key.split('|', 2)
+            rows.append(dict(entry, kind=kind, name=name, test=test))
+        rows.sort(key=lambda row: row['total'], reverse=True)
+        totals = {}
+        for row in rows:
+            totals[row['kind']] = totals.get(row['kind'], 0) + row['total']
+        return {'buckets': PROFILE_BUCKETS, 'totals': totals, 'stats': rows}
+
+# The process-wide profiler. Like SESSIONS, each worker process has its own.
+PROFILER = Profiler()
+
+class MailPool:
+    """Keeps the process's IMAP connections open between emails, rather than connecting and
+    logging in all over again for every one. One per account: (server, port, ssl, username,
+    password), switching mailboxes as needed. One that's been idle a while gets a NOOP before
+    it's handed out, to check it's still alive, and a dead one is replaced. See MAIL."""
+    def __init__(self):
+        self.conns = {}     # account: [IMAP4, time last handed out]
+        self.opened = 0
+        self.reused = 0
+
+    def get(self, account: tuple, mailbox: str = 'INBOX') -> imaplib.IMAP4:
+        """A logged in connection to the account, with the mailbox selected."""
+        entry = self.conns.get(account)
+        if entry:
+            try:
+                if time.time() - entry[1] > IMAP_KEEPALIVE:
+                    entry[0].noop()
+                entry[1] = time.time()
+                self.reused += 1
+                return self.select(entry[0], mailbox)
+            except (imaplib.IMAP4.error, OSError):
+                self.drop(account)
+        server, port, ssl, user, passw = account
+        imap = (imaplib.IMAP4_SSL if ssl else imaplib.IMAP4)(server, *([port] if port else []))
+        try:
+            imap.login(user, passw)
+            # What the server can do once logged in, which may be more than it said up front.
+            imap.capabilities = tuple(imap.capability()[1][0].decode().upper().split())
+            imap.selected = None
+            self.select(imap, mailbox)
+        except imaplib.IMAP4.error:
+            imap.shutdown()
+            raise
+        self.opened += 1
+        self.conns[account] = [imap, time.time()]
+        return imap
+
+    @staticmethod
+    def select(imap: imaplib.IMAP4, mailbox: str) -> imaplib.IMAP4:
+        """Switches the connection to the mailbox, unless it's already there."""
+        if imap.selected != mailbox:
+            got, why = imap.select(mailbox)
+            if got != 'OK':
+                raise imaplib.IMAP4.error('Could not select {0}: {1}'.format(mailbox, why))
+            imap.selected = mailbox
+            # If this changes, the UIDs no longer mean the same messages, see MailCache.
+            imap.uidvalidity = (imap.response('UIDVALIDITY')[1][0] or b'0').decode()
+        return imap
+
+    def drop(self, account: tuple) -> None:
+        """Closes the account's connection, if there is one. If it's already dead, never mind."""
+        entry = self.conns.pop(account, None)
+        if entry:
+            try:
+                entry[0].logout()
+            except (imaplib.IMAP4.error, OSError):
+                pass
+
+    def close_all(self) -> None:
+        """Closes all of the connections. Call this when the process is done testing."""
+        for account in list(self.conns):
+            self.drop(account)
+
+    def report(self) -> str:
+        """A line about how many logins the pool saved."""
+        return 'Mail connections: {0} opened, {1} reused\n'.format(
+            self.opened, self.reused) if self.opened else ''
+
+# The process-wide mail connections. Like SESSIONS, each worker process has its own.
+MAIL = MailPool()
+
+class MailCache:
+    """Remembers the emails already downloaded, so the checks that look through all of them
+    don't download and parse every one again, every time. A message never changes, so each one
+    is kept, along with anything worked out from it, in a JSON file of its own: by username,
+    mailbox, UIDVALIDITY and UID, in the path folder. So the worker processes never write the same file.
+    With no path, it only remembers them for as long as the process lasts."""
+    def __init__(self, path: str = None):
+        self.path = path
+        self.memo = {}      # (username, mailbox, UIDVALIDITY, UID): {'body': html, and so on}
+
+    def file(self, key: tuple) -> str:
+        """Where an email is kept."""
+        return os.path.join(self.path, re.sub(r'[^\w@.+-]', '_', '{0}_{1}_{2}_{3}.json'.format(*key)))
+
+    def get(self, key: tuple) -> dict:
+        """The email's entry, with its html as 'body'. None if it hasn't been seen before."""
+        if key not in self.memo and self.path:
+            try:
+                with open(self.file(key), encoding='UTF-8') as fil:
+                    self.memo[key] = json.load(fil)
+            except (OSError, ValueError):
+                pass
+        return self.memo.get(key)
+
+    def put(self, key: tuple, entry: dict) -> None:
+        """Keeps the email's entry, or the changes to it."""
+        self.memo[key] = entry
+        if not self.path:
+            return
+        temp = '{0}.{1}'.format(self.file(key), os.getpid())
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(temp, mode='w', encoding='UTF-8') as fil:
+                json.dump(entry, fil)
+            os.replace(temp, self.file(key))
+        except OSError as ex:
+            print('Failed to save the email cache:', ex)
+
+# The process's email cache. The runners give it a path, to share it between processes.
+MAIL_CACHE = MailCache()
+
+def uid_set(uids: List[int]) -> str:
+    """Puts a bunch of message UIDs in IMAP's shorthand, with runs as ranges, like '3:7,9'.
+    So any number of messages can be FETCHed with the one command."""
+    nums = sorted({int(x) for x in uids})
+    ranges = []
+    for num in nums:
+        if ranges and ranges[-1][1] == num - 1:
+            ranges[-1][1] = num
+        else:
+            ranges.append([num, num])
+    return ','.join(str(a) if a == b else '{0}:{1}'.format(a, b) for a, b in ranges)
+
+def imap_backend(globs: dict, userid: str) -> Tuple[tuple, str]:  # pylint: disable=W0613
+    """The test email account, from the test_email settings. Everyone's emails are in the one
+    INBOX, told apart by their sub-address. Returns the account (see MailPool), and mailbox."""
+    return (globs['test_email_imap_server'], globs.get('test_email_imap_port'),
+            globs.get('test_email_imap_ssl', True), globs['test_email_username'],
+            globs['test_email_password']), 'INBOX'
+
+def local_backend(globs: dict, userid: str) -> Tuple[tuple, str]:  # pylint: disable=W0613
+    """The stand-in mail server, see mailhost. Each user's emails have a mailbox of their own."""
+    return (mailhost.HOST, mailhost.IMAP_PORT, False, 'tester', 'tester'), userid
+
+# A mapping of the mail_backend setting to where the emails are. Add to this for other servers.
+# Given the globs and a user id (or '*', for everyone), returns the account and mailbox(es).
+MAIL_BACKENDS = {'imap': imap_backend, 'local': local_backend}
+
+def list_name(line: Union[bytes, tuple]) -> str:
+    """The mailbox name from one of LIST's lines, like (\\HasNoChildren) "/" "Some box".
+    The name's the last field, and could be a quoted string, an atom, or a literal (which
+    imaplib gives as a tuple of the line so far and the literal itself)."""
+    if isinstance(line, tuple):
+        return line[1].decode()
+    name = re.match(rb'\([^)]*\)\s+(?:"(?:[^"\\]|\\.)*"|NIL)\s+(.*)$', line).group(1).strip()
+    if name.startswith(b'"') and name.endswith(b'"'):
+        name = re.sub(rb'\\(.)', rb'\1', name[1:-1])
+    return name.decode()
+
+def purge_mail(globs: dict, days: int) -> int:
+    """Deletes the ASP emails older than the given number of days, from all of the test users'
+    mailboxes, so the searches have less to look through. Returns how many it deleted."""
+    account, pattern = MAIL_BACKENDS[globs.get('mail_backend') or 'imap'](globs, '*')
+    before = mailhost.imap_date(datetime.date.today() - datetime.timedelta(days=days))
+    froms = globs['asp_from_emails']
+    deleted = 0
+    for line in MAIL.get(account).list('""', pattern)[1]:
+        if not line:
+            continue
+        imap = MAIL.get(account, list_name(line))
+        uids = imap.uid('SEARCH', ' OR FROM '.join(['', *froms[:-1]]).strip(), 'FROM', froms[-1],
+                        'BEFORE', before)[1][0].split()
+        if uids:
+            imap.uid('STORE', uid_set(uids), '+FLAGS', '(\\Deleted)')
+            imap.expunge()
+            deleted += len(uids)
+    return deleted
+
+def imap_idle(imap: imaplib.IMAP4, timeout: float) -> bool:
+    """IDLEs on the connection's selected mailbox, for up to timeout seconds, until the server says
+    a message has arrived. Returns whether one did. imaplib can't IDLE, so this sends the commands
+    itself, but reads the replies through imaplib's own buffer, so nothing imaplib has already
+    read gets missed, and nothing after the IDLE's reply gets lost. The IDLE gets a tag of its own,
+    rather than one of imaplib's, which leaves imaplib's bookkeeping alone."""
+    sock, tag = imap.socket(), 'IDLE{0}'.format(int(time.time() * 1000)).encode()
+    def buffered() -> bool:
+        """Whether imaplib has read anything from the server that it hasn't handed out yet.
+        A non-blocking peek: it only reads the socket if there's nothing buffered already."""
+        old = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            return bool(imap.file.peek())
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return False
+        finally:
+            sock.settimeout(old)
+    def readline(deadline: float) -> bytes:
+        """The server's next line, or None if it has nothing more to say by the deadline."""
+        while not buffered():
+            wait = deadline - time.time()
+            if wait <= 0 or not select.select([sock], [], [], wait)[0]:
+                return None
+        line = imap.readline()
+        if not line:
+            raise imaplib.IMAP4.abort('The connection was closed while IDLE')
+        return line.rstrip(b'\r\n')
+
+    arrived = False
+    imap.send(tag + b' IDLE\r\n')
+    line = b''
+    while not line.startswith(b'+'):   # Wait for the go-ahead.
+        line = readline(time.time() + IDLE_WAIT)
+        if line is None or line.startswith(tag):
+            raise imaplib.IMAP4.error('IDLE was refused: {0}'.format(line))
+        arrived = arrived or bool(re.match(rb'\* \d+ (EXISTS|RECENT)', line))
+    deadline = time.time() + timeout
+    while not arrived:
+        line = readline(deadline)
+        if line is None:
+            break
+        arrived = bool(re.match(rb'\* \d+ (EXISTS|RECENT)', line))
+    imap.send(b'DONE\r\n')
+    deadline, line = time.time() + IDLE_WAIT, b''
+    while not line.startswith(tag):     # Whatever else it says before finishing, ignore it.
+        line = readline(deadline)
+        if line is None:
+            raise imaplib.IMAP4.abort('No reply to DONE after IDLE')
+    return arrived
+
 class Email:
     """Handler for the email checks. Due to languages, there's really no way to tell
     which email is which, so to ensure schedule synchronicity, make sure
     get_new_messages is called every time an email is expected."""
     def __init__(self, globs: dict, dr: Drivery, userid: str):
         self.email = globs['email'].format(userid)
-        self.cn_mode, self.imapsvr, self.usern, self.passw, self.froms = (
-            globs['cn_mode'], globs['test_email_imap_server'], globs['test_email_username'],
-            globs['test_email_password'], globs['asp_from_emails'])
+        self.cn_mode, self.froms = globs['cn_mode'], globs['asp_from_emails']
+        # Which IMAP account and mailbox to use, see MAIL_BACKENDS.
+        # The connection itself is MAIL's, shared with every other Email.
+        self.account, self.mailbox = MAIL_BACKENDS[globs.get('mail_backend') or 'imap'](
+            globs, userid)
         self.dr = dr
 
+    def imap(self) -> imaplib.IMAP4:
+        """The pooled connection, with this Email's mailbox selected."""
+        return MAIL.get(self.account, self.mailbox)
+
+    def command(self, name: str, *args) -> Tuple[str, list]:
+        """Sends a UID command (SEARCH, FETCH, and so on) down the pooled connection.
+        If the connection turns out to have died, reconnects, and tries again, once."""
+        try:
+            return self.imap().uid(name, *args)
+        except (imaplib.IMAP4.abort, OSError):
+            MAIL.drop(self.account)
+            return self.imap().uid(name, *args)
+
     def get_all_locales(self) -> Set[str]:
         """Collects all of the emails received by this email subaddress,
-        and returns a set of Locale codes representing each one found."""
+        and returns a set of Locale codes representing each one found.
+        Only the emails it hasn't seen before are downloaded and looked through, see MAIL_CACHE."""
         locs = set()
-        ems = [bs4.BeautifulSoup(x, 'html.parser')
-               for x in self.get_new_messages(really_get_new=False)]
-        for ema in ems:
-            if self.cn_mode:    # China does not have locale-tagged links.
-                links = ema.select('a[href*="t.dpc.rimanggis.com"]')
-                hrefs = {x['href'].split('.')[-1] for x in links}
-                locs = locs.union({'zh-cn'} if hrefs == {'json'} else hrefs)
-            else:
-                links = ema.select('a[href*="t.campaign.adobe.com"]')
-                hrefs = [re.search(r'p1\=\w\w((-|_)\w\w)?', x['href']) for x in links]
-                locs = locs.union({x.group().split('=')[-1] for x in hrefs if x})
+        found = 'cn_locales' if self.cn_mode else 'locales'
+        for key, entry in self.fetch(self.wait_for_mail(really_get_new=False), cached=True):
+            if found not in entry:
+                entry[found] = sorted(mailparse.locales(entry['body'], self.cn_mode))
+                MAIL_CACHE.put(key, entry)
+            locs = locs.union(entry[found])
         return locs
 
     def get_new_messages(self, really_get_new: bool = True) -> List[str]:
         """Polls the IMAP server untill a (maybe) new email(s) are found, then
         attempts to make sense of their ridiculous transmission formatting."""
-        results = []
-        with imaplib.IMAP4_SSL(self.imapsvr) as imap:
-            imap.login(self.usern, self.passw)
-            imap.select()
-            nums = self.dr.wait_until(lambda: self.email_loop(imap, really_get_new),
-                                      'Waiting for emails to be found, calls self.email_loop.')
+        return [entry['body'] for _, entry in self.fetch(self.wait_for_mail(really_get_new))]
+
+    def fetch(self, uids: List[int], cached: bool = False) -> List[Tuple[tuple, dict]]:
+        """Downloads the emails, all in the one FETCH, like [(MAIL_CACHE key, {'body': html})].
+        With cached, the ones MAIL_CACHE already has aren't downloaded again. Not for new emails,
+        those have to be downloaded, to mark them as seen. Every one downloaded is cached."""
+        imap = self.imap()
+        keys = OrderedDict((uid, (self.account[3], self.mailbox, imap.uidvalidity, uid))
+                           for uid in uids)
+        entries = {uid: MAIL_CACHE.get(key) for uid, key in keys.items()} if cached else {}
+        missing = [uid for uid in uids if not entries.get(uid)]
+        if missing:
             # The Latin Character Set emails have two parts, the second of which is the html part.
-            got, ems = imap.fetch(nums, 'body[2]')
+            got, ems = self.command('FETCH', uid_set(missing), 'body[2]')
             if got == 'NO':    # The others do not have two parts.
-                got, ems = imap.fetch(nums, 'body[1]')
+                got, ems = self.command('FETCH', uid_set(missing), 'body[1]')
             for ema in ems:     # Yeah, the results come back wierd sometimes,
                 if isinstance(ema, tuple):  # have to filter out the bits.
                     try:
-                        results.append(quopri.decodestring(ema[1]).decode())
+                        body = quopri.decodestring(ema[1]).decode()
                     except UnicodeDecodeError:    # Some quasi-latin languages are different
-                        results.append(quopri.decodestring(ema[1]).decode(LATIN_EMAIL_ENCODING))
-        return results
+                        body = quopri.decodestring(ema[1]).decode(LATIN_EMAIL_ENCODING)
+                    uid = int(re.search(rb'UID (\d+)', ema[0]).group(1))
+                    entries[uid] = {'body': body}
+                    if uid in keys:
+                        MAIL_CACHE.put(keys[uid], entries[uid])
+        return [(key, entries[uid]) for uid, key in keys.items() if entries.get(uid)]
+
+    def wait_for_mail(self, really_get_new: bool = True) -> List[int]:
+        """Waits for the email(s) to turn up, returning their UIDs, like email_loop.
+        Rather than SEARCHing over and over, IDLEs until the server says something has arrived
+        (or for IDLE_WAIT), then SEARCHes just the messages that are new since it started waiting.
+        If the server can't IDLE, it's back to polling email_loop."""
+        if 'IDLE' not in self.imap().capabilities:
+            return self.dr.wait_until(lambda: self.email_loop(really_get_new),
+                                      'Waiting for emails to be found, calls self.email_loop.')
+        # Anything arriving from here on gets at least this UID, so the later SEARCHes needn't look
+        # any further back than that.
+        status = self.imap().status(self.mailbox, '(UIDNEXT)')[1][0]
+        since = int(re.search(rb'UIDNEXT (\d+)', status).group(1))
+        uids = self.search(really_get_new)
+        deadline = time.time() + self.dr.long_wait
+        while not uids:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutException('Timed out waiting for condition: '
+                                       'Waiting for emails to be found, IDLEing for new mail.')
+            try:
+                imap_idle(self.imap(), min(remaining, IDLE_WAIT))
+            except (imaplib.IMAP4.abort, OSError):
+                MAIL.drop(self.account)     # Try again with a new connection.
+            except imaplib.IMAP4.error:     # It wouldn't IDLE after all.
+                return self.dr.wait_until(lambda: self.email_loop(really_get_new),
+                                          'Waiting for emails to be found, calls self.email_loop.')
+            # Whether or not the IDLE said anything. A message that arrived before it started,
+            # the server won't mention again: its EXISTS went out with the last SEARCH's reply.
+            uids = self.search(really_get_new, since)
+        return uids
+
+    def email_loop(self, really_get_new: bool = True) -> List[int]:
+        """SEARCHes the server, checking for (maybe) new email. Put this in a wait-until loop.
+        Returns the UIDs of what it found, in order. Empty if nothing."""
+        self.imap().noop()
+        return self.search(really_get_new)
 
-    def email_loop(self, imap: imaplib.IMAP4_SSL, really_get_new: bool = True) -> bytes:
-        """SEARCHes the server, checking for (maybe) new email. Put this in a wait-until loop."""
-        imap.noop()
+    def search(self, really_get_new: bool = True, since: int = None) -> List[int]:
+        """The one SEARCH for this address's emails, like email_loop, without the NOOP.
+        Given since, only looks at the messages with that UID or later."""
         # Returns a tuple. (Result_code, Actual_results). Actual_results is also a list.
         # Containing a single bytestring of space-separated return values.
-        # And IMAP requires that imput values be comma separated.         Because why not.
-        return b','.join(imap.search(     # Search from all addresses, it could be any of them.
-            None, ' OR FROM '.join(['', *self.froms[:-1]]).strip(), 'FROM', self.froms[-1],
-            'TO', self.email, 'UNSEEN' if really_get_new else 'SEEN')[1][0].split(b' '))
+        # Search from all addresses, it could be any of them.
+        return sorted(int(x) for x in self.command(
+            'SEARCH', *(['UID', '{0}:*'.format(since)] if since else []),
+            ' OR FROM '.join(['', *self.froms[:-1]]).strip(), 'FROM', self.froms[-1],
+            'TO', self.email, 'UNSEEN' if really_get_new else 'SEEN')[1][0].split()
+                      if not since or int(x) >= since)
 
     class LocalizedEmail():    # Oh, whatever. pylint: disable=R0903
         """Superclass for the various emails."""
         def __init__(self, globs: dict, dr: Drivery, userid: str):
-            self.email = bs4.BeautifulSoup(
-                Email(globs, dr, userid).get_new_messages()[0], 'html.parser')
+            self.html = Email(globs, dr, userid).get_new_messages()[0]
             self.userid = userid
             self.cn_mode = globs['cn_mode']
+            self._soup = None
+
+        @property
+        def email(self):
+            """The whole email, parsed by BeautifulSoup. Only done if it's needed,
+            mailparse can find most things without it."""
+            if self._soup is None:
+                self._soup = mailparse.soup(self.html)
+            return self._soup
 
     class RegistrationEmail(LocalizedEmail):    # pylint: disable=R0903
         """Represents the Registration Email, if used correctly. Correctly here meaning:
@@ -364,15 +1211,15 @@ class Email:
         def activation_link(self) -> str:
             """Returns the address of the Click Here To Activate Your Account link."""
             if self.cn_mode:    # China does not have that format of link.
-                return self.email.a['href']
-            return self.email.select('a[href*="activation"]')[0]['href']
+                return mailparse.hrefs(self.html)[0]
+            return mailparse.hrefs(self.html, 'activation')[0]
 
     class ForgottenUsernameEmail(LocalizedEmail):    # pylint: disable=R0903
         """Represents the Forgotten Username Email.
         If it is called at the right time, of course."""
         def get_username(self) -> str:
             """Returns the Username that the email is trying to remind you of."""
-            return self.email.find('td', string=re.compile(self.userid)).string
+            return mailparse.cell(self.html, self.userid)
 
 
     class ForgottenPasswordEmail(LocalizedEmail):
@@ -380,7 +1227,7 @@ class Email:
         If it is called at the right time, of course."""
         def get_username(self) -> str:
             """Forgotten Password email also contains your Username, returns that."""
-            return self.email.find('td', string=re.compile(self.userid)).string
+            return mailparse.cell(self.html, self.userid)
 
         def get_password(self) -> str:
             """Returns the new temporary password from the email."""
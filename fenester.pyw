@@ -3,19 +3,26 @@ import os
 os.chdir(os.path.dirname(__file__))
 
 import sys
+import time
+import queue
+import threading
 import tkinter as tk
 import tkinter.ttk as ttk
 from math import ceil
-from multiprocessing import Pool, cpu_count
+from multiprocessing import Queue
 import selene
 from miklase import STATES
 from ASP import aspnames
-from drivery import BROWSERS
+from drivery import BROWSERS, HIGHLIGHTS
 from modulescripts import FANCY_LANGS
 # Too many ancestors. That's external wrapper libraries for you. pylint: disable=R0901
 
 relcol = {STATES.PASS.name: 'green', STATES.SKIP.name: 'grey',
           STATES.FAIL.name: 'yellow', STATES.ERROR.name: 'red'}
+# The colour of a test that's still going, in the live view.
+RUNNING_COLOUR = 'light blue'
+# How often the live view checks for news from the workers, in milliseconds.
+LIVE_POLL = 250
 
 class TestForm(tk.Frame):
     """A Frame containing a bunch of controls, used to customise test runs."""
@@ -82,6 +89,16 @@ class TestForm(tk.Frame):
         tk.Label(self.user, text='Username (optional)').grid(sticky='e')
         tk.Entry(self.user, textvariable=self.user.name, width=15).grid()
 
+        # How to highlight elements. Off is the fastest, for when nobody is watching.
+        self.highlight = tk.Frame(self, borderwidth=5, relief='groove')
+        self.highlight.grid(column=3, row=0, sticky='nsew')
+        self.highlight.mode = tk.StringVar()
+        tk.Label(self.highlight, text='Highlighting').grid(sticky='w')
+        for h in HIGHLIGHTS:
+            tk.Radiobutton(self.highlight, text=h, value=h,
+                           variable=self.highlight.mode).grid(sticky='w')
+        self.highlight.mode.set(props['highlight'])
+
         # The Test Options list.
         self.tests = tk.Frame(self, borderwidth=5, relief='groove')
         self.tests.grid(column=2, row=1, rowspan=2, sticky='nsew')
@@ -140,20 +157,33 @@ class TestForm(tk.Frame):
             args['email'] = args['email'].format(args['userid'])
         args['environment'] = self.environs.environment.get()
         args['chenvironment'] = self.environs.chenvironment.get()
+        args['highlight'] = self.highlight.mode.get()
         prev = self.master.children.get('!resultsform')
         if prev:
             prev.grid_forget()
+        prev = self.master.children.get('!liveform')
+        if prev:
+            prev.destroy()
         # fenestrate(self.launch_fake_test())
         self.launch_test_suite(args)
 
     def launch_test_suite(self, args) -> None:
-        """Set up the multiprocessing constructure, and kick off all of the tests.
-        It's supposed to be asynchronous, so don't worry about all those extra handles"""
-        outdir = os.path.split(__file__)[0]
-        locs, bros = args['locales'], args['browsers']
-        count = min(cpu_count() * 3, len(locs) * len(bros))   # Make up to 3xcores processes
-        largs = [(loc, bro, outdir, args.copy()) for loc in locs for bro in bros] # Args to pass
-        Pool(count).map_async(selene.launch_test, largs, callback=fenestrate, error_callback=print)
+        """Kick off all of the tests, with selene's scheduler, and watch them go.
+        The scheduler gets a thread of its own, so the window doesn't freeze up meanwhile.
+        The workers put each test's start and stop on a queue, for the LiveForm to show."""
+        events = Queue()
+        def run():
+            """Runs the tests, then puts the results on the queue, as the last event.
+            Whatever happens, even a sys.exit, the window still gets told it's done."""
+            results = []
+            try:
+                results = selene.launch_test_suite(args, events)
+            except Exception as ex:    # Still have to tell the window. pylint: disable=W0703
+                print('The test run failed:', repr(ex))
+            finally:
+                events.put({'event': 'done', 'results': results})
+        LiveForm(args, events, master=self.master).watch()
+        threading.Thread(target=run, daemon=True).start()
 
     def launch_fake_test(self) -> list:
         """Just so I don't have to do an actual test run each time I test this thing."""
@@ -162,6 +192,67 @@ class TestForm(tk.Frame):
                 ('Firefox', '/it-it', {'Test_01_Something': [(STATES.PASS, 'Test Passed')], 'Test_02_Elsething': [(STATES.FAIL, 'Assertion: should not fail'), (STATES.ERROR, 'Could not find element')]}),
                 ('Firefox', '/en-gb', {'Test_01_Something': [(STATES.PASS, 'Test Passed')], 'Test_02_Elsething': [(STATES.FAIL, 'Assertion: should not fail'), (STATES.ERROR, '\nFile "C:\\Users\\bzalakos\\Documents\\GitHub\\selphi\\ASP.py", line 799, in test_15_Aussie_Specialist_Club\nclub.click()\nselenium.common.exceptions.WebDriverException: Message: unknown error: Element <li id="nav-main-panel-5" class="has-children" style="animation-duration: 0.5s; animation-name:\nselhian;">...</li> is not clickable at point (1131, 108). Other element would receive the click: <div class="fancybox-overlay fancybox-overlay-fixed" style="width: auto; height: auto; display: block;"></div>\n(Session info: chrome=59.0.3071.115)\n(Driver info: chromedriver=2.30.477700 (0057494ad8732195794a7b32078424f92a5fce41),platform=Windows NT 6.3.9600 x86_64)\n')]})]
 
+class LiveForm(tk.Frame):
+    """A grid of each locale and browser against each test, coloured in as the run goes.
+    A running test shows how long it's been going, a finished one how long it took.
+    Once the run is done, it makes way for the usual ResultsForm."""
+    def __init__(self, args, events, master=None):
+        super().__init__(master, borderwidth=2, relief='solid')
+        self.grid(column=1, row=0, sticky='nsew')
+        self.events = events
+        _, names, _ = selene.suite_of(args['site'])
+        codes = args['tests'] or list(names)
+        self.cells = {}     # (locale, browser, test method name): its Label
+        self.started = {}   # Same key: when it started, for the ones still running.
+        self.finished, self.failed, self.begun = 0, 0, time.time()
+        self.summary = tk.StringVar()
+        tk.Label(self, textvariable=self.summary, anchor='w').grid(
+            row=0, column=0, columnspan=len(codes) + 1, sticky='w')
+        for col, code in enumerate(codes, 1):
+            tk.Label(self, text=code).grid(row=1, column=col)
+        pairs = [(loc, bro) for loc in args['locales'] for bro in args['browsers']]
+        for row, (loc, bro) in enumerate(pairs, 2):
+            tk.Label(self, text=bro + ' - ' + loc).grid(row=row, column=0, sticky='e')
+            for col, code in enumerate(codes, 1):
+                cell = tk.Label(self, width=5, background='white', relief='ridge')
+                cell.grid(row=row, column=col, sticky='nsew')
+                self.cells[loc, bro, names[code]] = cell
+
+    def watch(self) -> None:
+        """Deals with everything that's come in on the queue, then checks back in a bit."""
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if event['event'] == 'done':
+                self.destroy()
+                fenestrate(event['results'])
+                return
+            self.update_cell(event)
+        now = time.time()
+        for key, start in self.started.items():
+            self.cells[key].configure(text='{0:.0f}s'.format(now - start))
+        self.summary.set('{0} of {1} tests done, {2} failing, {3} running. {4:.0f}s so far.'.format(
+            self.finished, len(self.cells), self.failed, len(self.started), now - self.begun))
+        self.after(LIVE_POLL, self.watch)
+
+    def update_cell(self, event: dict) -> None:
+        """Colours in a test's cell, as it starts or stops."""
+        key = (event['locale'], event['browser'], event['test'].split('.')[-1])
+        cell = self.cells.get(key)
+        if cell is None:
+            return
+        if event['event'] == 'start':
+            self.started[key] = event['time']
+            cell.configure(background=RUNNING_COLOUR, text='0s')
+        else:
+            self.started.pop(key, None)
+            self.finished += 1
+            self.failed += event['status'] in (STATES.FAIL.name, STATES.ERROR.name)
+            cell.configure(background=relcol[event['status']],
+                           text='{0:.0f}s'.format(event['duration']))
+
 class ResultsForm(tk.Frame):
     """A Frame containing a bunch of Frames containing a bunch of Frames"""
     def __init__(self, results, master=None):
@@ -0,0 +1,62 @@
+"""Keeps track, on disk, of which bits of a run are finished. So if a run crashes, or gets
+cancelled, it can be picked up again where it stopped, instead of starting all over."""
+import os
+import json
+from collections import OrderedDict
+
+class RunJournal:
+    """A JSON Lines file: the first line is the run's settings, then a line per finished unit,
+    with its key (a tuple, like (locale, browser, test)) and whatever the runner wants to keep.
+    Opened with resume, it keeps the units already finished, if the settings still match.
+    Otherwise it starts afresh. Several processes can write to the one journal, so long as they
+    all share the same lock, like miklase.ResultLog."""
+    def __init__(self, path: str, settings: dict, resume: bool = False, lock=None):
+        self.path = path
+        self.lock = lock
+        self.done = self.load(path, settings) if resume else None
+        if self.done is None:
+            self.done = OrderedDict()
+            with open(path, mode='w', encoding='UTF-8') as fil:
+                fil.write(json.dumps(settings, sort_keys=True) + '\n')
+
+    @staticmethod
+    def load(path: str, settings: dict) -> OrderedDict:
+        """Reads the finished units from a journal, like {key: data}. None if there isn't one,
+        or it was for a different run. A half-written last line, from a crash, is ignored."""
+        try:
+            with open(path, encoding='UTF-8') as fil:
+                lines = fil.read().splitlines()
+        except OSError:
+            return None
+        if not lines or lines[0] != json.dumps(settings, sort_keys=True):
+            return None
+        done = OrderedDict()
+        for line in lines[1:]:
+            try:
+                key, data = json.loads(line)
+            except ValueError:
+                continue
+            done[tuple(key)] = data
+        return done
+
+    def record(self, key: tuple, data=None) -> None:
+        """Notes down that the unit is finished. Data must be JSON-able."""
+        self.done[key] = data
+        line = json.dumps([key, data]) + '\n'
+        if self.lock is not None:
+            self.lock.acquire()
+        try:
+            with open(self.path, mode='a', encoding='UTF-8') as fil:
+                fil.write(line)
+        except OSError as ex:
+            print('Failed to write to the journal:', ex)
+        finally:
+            if self.lock is not None:
+                self.lock.release()
+
+    def finish(self) -> None:
+        """The whole run is done, so there's nothing left to resume. Deletes the journal."""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
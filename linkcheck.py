@@ -0,0 +1,189 @@
+"""Checks that links actually lead somewhere: hundreds of them at once, in seconds, with plain
+HTTP, rather than having the browser open every one of them in turn.
+Each link gets a HEAD request (a GET, if the server won't do HEAD), and its redirects are followed.
+The requests all go at once, but only a few at a time to any one host, over connections that are
+kept open for that host's next one. The results are remembered in a JSON file for LINK_TTL,
+so the other locales' tests, and the next run if it's soon enough, don't check them all again."""
+import os
+import ssl
+import json
+import time
+import base64
+import asyncio
+from urllib.parse import urlsplit, urljoin
+from typing import Dict, Iterable, List, Tuple
+
+# How many requests to have going at once, in all, and to any one host.
+MAX_REQUESTS = 32
+PER_HOST = 4
+# How long, in seconds, to give a link to answer.
+LINK_TIMEOUT = 20
+# How many redirects to follow before calling it broken.
+MAX_REDIRECTS = 5
+# How long, in seconds, a link's result is trusted for.
+LINK_TTL = 60 * 60
+# The redirect statuses, which are followed to where they go.
+REDIRECTS = (301, 302, 303, 307, 308)
+
+class ConnectionPool:
+    """Keeps connections to each host open for its next request, and no more than per_host
+    requests going to any one host at once. Only usable inside the one event loop."""
+    def __init__(self, per_host: int = PER_HOST, auth: Tuple[str, str] = None, auth_hosts=()):
+        self.per_host = per_host
+        self.idle = {}      # (scheme, host, port): [(reader, writer)]
+        self.limits = {}    # (scheme, host, port): Semaphore
+        self.auth = 'Basic ' + base64.b64encode(':'.join(auth).encode()).decode() if auth else None
+        # Only the site being tested gets the password, not everything it links to.
+        self.auth_hosts = set(auth_hosts)
+        # It's the links being checked, not the test environments' certificates.
+        self.ssl = ssl.create_default_context()
+        self.ssl.check_hostname = False
+        self.ssl.verify_mode = ssl.CERT_NONE
+        self.opened = 0
+
+    async def request(self, method: str, url: str) -> Tuple[int, dict]:
+        """Sends the one request. Returns the status, and the headers, with lowercase names."""
+        parts = urlsplit(url)
+        https = parts.scheme == 'https'
+        key = (parts.scheme, parts.hostname, parts.port or (443 if https else 80))
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        head = '{0} {1} HTTP/1.1\r\nHost: {2}\r\nUser-Agent: selphi-linkcheck\r\n'.format(
+            method, path, parts.netloc.rpartition('@')[2])
+        if self.auth and parts.hostname in self.auth_hosts:
+            head += 'Authorization: {0}\r\n'.format(self.auth)
+        if key not in self.limits:
+            self.limits[key] = asyncio.Semaphore(self.per_host)
+        async with self.limits[key]:
+            for retry in (True, False):
+                kept = bool(self.idle.get(key))
+                if kept:
+                    reader, writer = self.idle[key].pop()
+                else:
+                    reader, writer = await asyncio.wait_for(asyncio.open_connection(
+                        key[1], key[2], ssl=self.ssl if https else None), LINK_TIMEOUT)
+                    self.opened += 1
+                try:
+                    writer.write((head + '\r\n').encode('latin-1'))
+                    await writer.drain()
+                    status, headers = await asyncio.wait_for(read_head(reader), LINK_TIMEOUT)
+                except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    writer.close()
+                    if kept and retry:
+                        continue    # The server had closed that one in the meantime.
+                    raise
+                # A GET's body isn't wanted, so that connection can't be used again.
+                if method == 'HEAD' and headers.get('connection', '').lower() != 'close':
+                    self.idle.setdefault(key, []).append((reader, writer))
+                else:
+                    writer.close()
+                return status, headers
+
+    async def check(self, url: str) -> int:
+        """Follows a link, and its redirects, to wherever it ends up. Returns that status.
+        0 if it couldn't be reached at all, or went round in circles."""
+        for _ in range(MAX_REDIRECTS + 1):
+            try:
+                status, headers = await self.request('HEAD', url)
+                if status in (405, 501):    # Some servers just won't HEAD.
+                    status, headers = await self.request('GET', url)
+            except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                return 0
+            if status not in REDIRECTS or 'location' not in headers:
+                return status
+            url = urljoin(url, headers['location'])
+        return 0
+
+    def close(self) -> None:
+        """Closes all of the kept connections."""
+        for conns in self.idle.values():
+            for _, writer in conns:
+                writer.close()
+        self.idle = {}
+
+async def read_head(reader: asyncio.StreamReader) -> Tuple[int, dict]:
+    """Reads a response's status line and headers."""
+    line = await reader.readuntil(b'\r\n')
+    parts = line.split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith(b'HTTP/'):
+        raise ValueError('Not an HTTP response: {0!r}'.format(line))
+    headers = {}
+    while True:
+        line = (await reader.readuntil(b'\r\n')).decode('latin-1').strip()
+        if not line:
+            return int(parts[1]), headers
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+class LinkCache:
+    """Remembers links' statuses, by environment and url, in a JSON file, like drivery.LoginCache.
+    An entry lasts LINK_TTL. With no path, does nothing."""
+    def __init__(self, path: str = None):
+        self.path = path
+
+    def load(self) -> dict:
+        """Reads the file. Missing, or half written, just means nothing cached."""
+        try:
+            with open(self.path, encoding='UTF-8') as fil:
+                return json.load(fil)
+        except (OSError, ValueError, TypeError):
+            return {}
+
+    def get(self, env: str, urls: Iterable[str]) -> Dict[str, int]:
+        """The statuses of whichever of the urls were checked recently enough."""
+        data, now = self.load(), time.time()
+        found = {url: data.get(env + '|' + url) for url in urls}
+        return {url: entry['status'] for url, entry in found.items()
+                if entry and entry['checked'] + LINK_TTL >= now}
+
+    def put(self, env: str, results: Dict[str, int]) -> None:
+        """Remembers some freshly checked statuses. Clears out the expired entries too."""
+        if not self.path:
+            return
+        now = time.time()
+        data = {k: v for k, v in self.load().items() if v['checked'] + LINK_TTL >= now}
+        data.update({env + '|' + url: {'status': status, 'checked': now}
+                     for url, status in results.items()})
+        temp = '{0}.{1}'.format(self.path, os.getpid())
+        try:
+            with open(temp, mode='w', encoding='UTF-8') as fil:
+                json.dump(data, fil)
+            os.replace(temp, self.path)
+        except OSError as ex:
+            print('Failed to save the link cache:', ex)
+
+def check_links(urls: Iterable[str], auth: List[str] = None, env: str = '',
+                cache_path: str = None) -> Dict[str, int]:
+    """Checks all of the http(s) urls at once. Returns their statuses, like {url: 200}, with 0
+    for the ones that couldn't be reached at all. The others, mailto: and so on, are left out.
+    auth is the basic auth for the env site, the one being tested. Not sent anywhere else."""
+    urls = {url for url in urls if url and urlsplit(url).scheme in ('http', 'https')}
+    cache = LinkCache(cache_path)
+    results = cache.get(env, urls)
+    todo = sorted(urls - set(results))
+    if todo:
+        pool = ConnectionPool(auth=tuple(auth) if auth else None,
+                              auth_hosts=[urlsplit(env).hostname])
+        async def check_all():
+            """Checks them all, but no more than MAX_REQUESTS at once."""
+            limit = asyncio.Semaphore(MAX_REQUESTS)
+            async def check(url):
+                """Checks the one."""
+                async with limit:
+                    return await pool.check(url)
+            return await asyncio.gather(*(check(url) for url in todo))
+        loop = asyncio.new_event_loop()
+        try:
+            statuses = loop.run_until_complete(check_all())
+        finally:
+            pool.close()
+            loop.close()
+        checked = dict(zip(todo, statuses))
+        cache.put(env, checked)
+        results.update(checked)
+    return results
+
+def broken_links(urls: Iterable[str], auth: List[str] = None, env: str = '',
+                 cache_path: str = None) -> Dict[str, int]:
+    """Just the links that don't work: couldn't be reached, or came back 400 or worse."""
+    return {url: status for url, status in check_links(urls, auth, env, cache_path).items()
+            if status == 0 or status >= 400}
@@ -0,0 +1,371 @@
+"""A stand-in mail server, for running the email checks without the test Gmail account.
+It takes mail in over SMTP, and hands it out over IMAP, just enough of both for drivery.Email.
+Each recipient's sub-address gets a mailbox of its own: mail to testeratta+abcd@gmail.com goes
+in the 'abcd' mailbox, so each test user's emails are kept apart from everyone else's.
+Anything else goes in the INBOX. It's all kept in memory, and it'll take any login.
+Point the site's outgoing mail at the SMTP port, and set mail_backend to local in test.properties.
+Run this directly to start one, or see ensure_running."""
+import re
+import sys
+import time
+import email
+import socket
+import select
+import datetime
+import threading
+import socketserver
+from collections import OrderedDict
+from typing import Callable, List
+
+# Where the stand-in listens.
+HOST = 'localhost'
+IMAP_PORT = 1143
+SMTP_PORT = 1025
+# The months, as IMAP writes them in dates, like 01-Feb-2017. Not the locale's names for them.
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+# How often, in seconds, an IDLEing client is checked on.
+IDLE_TICK = 0.1
+# An IMAP command's words: a quoted string, a bracket, or anything else up to a space or bracket.
+TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"|([()])|([^\s()]+(?:\[[^\]]*\])?)')
+
+def imap_date(day: datetime.date) -> str:
+    """A date the way IMAP SEARCH wants it, like 01-Feb-2017."""
+    return '{0:02}-{1}-{2}'.format(day.day, MONTHS[day.month - 1], day.year)
+
+def parse_date(text: str) -> datetime.date:
+    """The other way round."""
+    day, month, year = text.split('-')
+    return datetime.date(int(year), MONTHS.index(month.title()) + 1, int(day))
+
+def mailbox_of(address: str) -> str:
+    """Which mailbox mail to the address goes in: its sub-address, if it has one."""
+    local = address.strip('<> ').split('@')[0]
+    return local.split('+', 1)[1] if '+' in local else 'INBOX'
+
+def tokenize(text: str) -> list:
+    """Splits up an IMAP command's arguments, with the bracketed bits as lists."""
+    stack = [[]]
+    for quoted, bracket, atom in TOKEN.findall(text):
+        if bracket == '(':
+            stack.append([])
+        elif bracket == ')' and len(stack) > 1:
+            done = stack.pop()
+            stack[-1].append(done)
+        else:
+            stack[-1].append(re.sub(r'\\(.)', r'\1', quoted) if atom == '' else atom)
+    return stack[0]
+
+def in_set(text: str, top: int) -> Callable[[int], bool]:
+    """Whether a number is in an IMAP sequence set, like '3:7,9,12:*'. top is what * means."""
+    ranges = []
+    for part in text.split(','):
+        ends = [top if x == '*' else int(x) for x in part.split(':')]
+        ranges.append((min(ends), max(ends)))
+    return lambda num: any(lo <= num <= hi for lo, hi in ranges)
+
+class Mailhost:
+    """The mailboxes, like {name: {'next': next UID, 'messages': {UID: message}}}.
+    A message is a dict: its 'data', the parsed 'email', its 'flags', and the 'date' it came in."""
+    def __init__(self):
+        self.boxes = {}
+        self.validity = int(time.time())
+        self.lock = threading.Condition()
+
+    def box(self, name: str) -> dict:
+        """The named mailbox. Made, empty, if there isn't one yet."""
+        name = 'INBOX' if name.upper() == 'INBOX' else name
+        return self.boxes.setdefault(name, {'next': 1, 'messages': OrderedDict()})
+
+    def deliver(self, recipients: List[str], data: bytes) -> None:
+        """Puts a copy of the email in each of the recipients' mailboxes."""
+        with self.lock:
+            for name in {mailbox_of(x) for x in recipients}:
+                box = self.box(name)
+                box['messages'][box['next']] = {
+                    'data': data, 'email': email.message_from_bytes(data), 'flags': set(),
+                    'date': datetime.date.today()}
+                box['next'] += 1
+            self.lock.notify_all()
+
+    def criteria(self, words: list, top: int) -> Callable[[int, dict], bool]:
+        """Turns SEARCH criteria into a test of a (UID, message). Uses up the words it reads."""
+        word = words.pop(0)
+        if isinstance(word, list):
+            tests = []
+            while word:
+                tests.append(self.criteria(word, top))
+            return lambda uid, msg: all(test(uid, msg) for test in tests)
+        word = word.upper()
+        if word == 'ALL':
+            return lambda uid, msg: True
+        if word in ('SEEN', 'UNSEEN', 'DELETED', 'UNDELETED'):
+            flag, want = '\\' + word.replace('UN', '').title(), not word.startswith('UN')
+            return lambda uid, msg: (flag in msg['flags']) == want
+        if word in ('FROM', 'TO', 'SUBJECT'):
+            text = words.pop(0).lower()
+            return lambda uid, msg: text in str(msg['email'].get(word, '')).lower()
+        if word in ('BEFORE', 'SINCE', 'ON'):
+            day = parse_date(words.pop(0))
+            return {'BEFORE': lambda uid, msg: msg['date'] < day,
+                    'SINCE': lambda uid, msg: msg['date'] >= day,
+                    'ON': lambda uid, msg: msg['date'] == day}[word]
+        if word == 'UID':
+            wanted = in_set(words.pop(0), top)
+            return lambda uid, msg: wanted(uid)
+        if word == 'NOT':
+            test = self.criteria(words, top)
+            return lambda uid, msg: not test(uid, msg)
+        if word == 'OR':
+            first, second = self.criteria(words, top), self.criteria(words, top)
+            return lambda uid, msg: first(uid, msg) or second(uid, msg)
+        raise ValueError('Unsupported search: ' + word)
+
+    @staticmethod
+    def part(msg: dict, section: str) -> bytes:
+        """A message's BODY[section]: the whole thing, or one of its parts, as it was sent.
+        None if it hasn't got that part."""
+        if not section:
+            return msg['data']
+        parts = msg['email'].get_payload() if msg['email'].is_multipart() else [msg['email']]
+        num = int(section)
+        if num > len(parts):
+            return None
+        return parts[num - 1].get_payload().encode('UTF-8', 'surrogateescape')
+
+class IMAPHandler(socketserver.StreamRequestHandler):
+    """One IMAP client's connection."""
+    def setup(self):
+        super().setup()
+        self.selected = None
+
+    def send(self, text) -> None:
+        """Sends a line, or a few."""
+        self.wfile.write(text if isinstance(text, bytes) else text.encode('UTF-8'))
+        self.wfile.flush()
+
+    def handle(self):
+        self.send('* OK [CAPABILITY IMAP4rev1 IDLE] mailhost ready\r\n')
+        for line in self.rfile:
+            tag, _, rest = line.decode('UTF-8', 'replace').rstrip('\r\n').partition(' ')
+            command, _, args = rest.partition(' ')
+            command = command.upper()
+            if command == 'UID':
+                command, _, args = args.partition(' ')
+                command = 'UID ' + command.upper()
+            doer = getattr(self, 'do_' + command.replace(' ', '_'), None)
+            host = self.server.mailhost
+            try:
+                if doer is None:
+                    raise ValueError('Unknown command ' + command)
+                if command.startswith('UID') and self.selected is None:
+                    raise ValueError('Nothing selected')
+                if command == 'IDLE':   # Not holding the lock, or nothing could arrive.
+                    reply = self.do_IDLE(tag, host)
+                else:
+                    with host.lock:
+                        reply = doer(tag, tokenize(args), host)
+            except (ValueError, IndexError) as ex:
+                reply = '{0} BAD {1}\r\n'.format(tag, ex)
+            self.send(reply)
+            if command == 'LOGOUT':
+                return
+
+    def do_CAPABILITY(self, tag, args, host):   # pylint: disable=W0613
+        """What it can do."""
+        return '* CAPABILITY IMAP4rev1 IDLE\r\n{0} OK CAPABILITY done\r\n'.format(tag)
+
+    def do_LOGIN(self, tag, args, host):   # pylint: disable=W0613
+        """Anyone can log in."""
+        return '{0} OK LOGIN done\r\n'.format(tag)
+
+    def do_NOOP(self, tag, args, host):   # pylint: disable=W0613
+        """Says how many messages there are now."""
+        count = len(host.box(self.selected)['messages']) if self.selected else None
+        return '{0}{1} OK NOOP done\r\n'.format(
+            '' if count is None else '* {0} EXISTS\r\n'.format(count), tag)
+
+    def do_LOGOUT(self, tag, args, host):   # pylint: disable=W0613
+        """Bye."""
+        return '* BYE\r\n{0} OK LOGOUT done\r\n'.format(tag)
+
+    def do_SELECT(self, tag, args, host):
+        """Opens a mailbox, the one everything else works on."""
+        self.selected = args[0]
+        box = host.box(self.selected)
+        return ('* {0} EXISTS\r\n* 0 RECENT\r\n* FLAGS (\\Seen \\Deleted)\r\n'
+                '* OK [UIDVALIDITY {1}]\r\n* OK [UIDNEXT {2}]\r\n{3} OK [READ-WRITE] SELECT done\r\n'
+               ).format(len(box['messages']), host.validity, box['next'], tag)
+    do_EXAMINE = do_SELECT
+
+    def do_STATUS(self, tag, args, host):
+        """Some numbers about a mailbox."""
+        box = host.box(args[0])
+        unseen = sum('\\Seen' not in msg['flags'] for msg in box['messages'].values())
+        return '* STATUS "{0}" (MESSAGES {1} UIDNEXT {2} UIDVALIDITY {3} UNSEEN {4})\r\n' \
+               '{5} OK STATUS done\r\n'.format(args[0], len(box['messages']), box['next'],
+                                               host.validity, unseen, tag)
+
+    def do_LIST(self, tag, args, host):
+        """The mailboxes matching the pattern. * and % both match anything."""
+        pattern = re.compile(re.escape(args[1]).replace(r'\*', '.*').replace('%', '.*') + '$')
+        return ''.join('* LIST () "/" "{0}"\r\n'.format(name) for name in sorted(host.boxes)
+                       if pattern.match(name)) + '{0} OK LIST done\r\n'.format(tag)
+
+    def do_EXPUNGE(self, tag, args, host):   # pylint: disable=W0613
+        """Throws out the deleted messages."""
+        messages, reply = host.box(self.selected)['messages'], ''
+        for seq, uid in reversed(list(enumerate(messages, 1))):
+            if '\\Deleted' in messages[uid]['flags']:
+                del messages[uid]
+                reply += '* {0} EXPUNGE\r\n'.format(seq)
+        return reply + '{0} OK EXPUNGE done\r\n'.format(tag)
+
+    def do_CLOSE(self, tag, args, host):
+        """Throws out the deleted messages, quietly, and closes the mailbox."""
+        self.do_EXPUNGE(tag, args, host)
+        self.selected = None
+        return '{0} OK CLOSE done\r\n'.format(tag)
+
+    def do_UID_SEARCH(self, tag, args, host):
+        """The UIDs of the messages matching all of the criteria."""
+        messages = host.box(self.selected)['messages']
+        if args and str(args[0]).upper() == 'CHARSET':
+            args = args[2:]
+        top = max(messages, default=0)
+        tests = []
+        while args:
+            tests.append(host.criteria(args, top))
+        found = [str(uid) for uid, msg in messages.items() if all(t(uid, msg) for t in tests)]
+        return '* SEARCH{0}\r\n{1} OK SEARCH done\r\n'.format(
+            ''.join(' ' + x for x in found), tag)
+
+    def do_UID_FETCH(self, tag, args, host):
+        """The messages' UIDs, flags, and bodies. Fetching a body marks it seen, unless PEEKing."""
+        messages = host.box(self.selected)['messages']
+        wanted = in_set(args[0], max(messages, default=0))
+        items = ' '.join(x if isinstance(x, str) else ' '.join(x) for x in args[1:]).upper()
+        bodies = re.findall(r'BODY(\.PEEK)?\[(\d*)\]', items)
+        reply = b''
+        for seq, (uid, msg) in enumerate(messages.items(), 1):
+            if not wanted(uid):
+                continue
+            parts = [Mailhost.part(msg, section) for _, section in bodies]
+            if None in parts:
+                return '{0} NO No such part\r\n'.format(tag)
+            if any(not peek for peek, _ in bodies):
+                msg['flags'].add('\\Seen')
+            reply += '* {0} FETCH (UID {1}'.format(seq, uid).encode()
+            if 'FLAGS' in items:
+                reply += ' FLAGS ({0})'.format(' '.join(sorted(msg['flags']))).encode()
+            for (_, section), part in zip(bodies, parts):
+                reply += ' BODY[{0}] {{{1}}}\r\n'.format(section, len(part)).encode() + part
+            reply += b')\r\n'
+        return reply + '{0} OK FETCH done\r\n'.format(tag).encode()
+
+    def do_UID_STORE(self, tag, args, host):
+        """Sets, adds, or takes away the messages' flags."""
+        messages = host.box(self.selected)['messages']
+        wanted = in_set(args[0], max(messages, default=0))
+        how, flags = args[1].upper(), set(args[2] if isinstance(args[2], list) else args[2:])
+        reply = ''
+        for seq, (uid, msg) in enumerate(messages.items(), 1):
+            if wanted(uid):
+                if how.startswith('+'):
+                    msg['flags'] |= flags
+                elif how.startswith('-'):
+                    msg['flags'] -= flags
+                else:
+                    msg['flags'] = flags.copy()
+                reply += '* {0} FETCH (UID {1} FLAGS ({2}))\r\n'.format(
+                    seq, uid, ' '.join(sorted(msg['flags'])))
+        return reply + '{0} OK STORE done\r\n'.format(tag)
+
+    def do_IDLE(self, tag, host):
+        """Says whenever a message arrives in the selected mailbox, until the client says DONE."""
+        if self.selected is None:
+            raise ValueError('Nothing selected')
+        self.send('+ idling\r\n')
+        with host.lock:
+            count = len(host.box(self.selected)['messages'])
+        while not select.select([self.connection], [], [], 0)[0]:
+            with host.lock:
+                host.lock.wait(IDLE_TICK)
+                now = len(host.box(self.selected)['messages'])
+            if now > count:
+                self.send('* {0} EXISTS\r\n'.format(now))
+            count = now
+        self.rfile.readline()   # DONE
+        return '{0} OK IDLE done\r\n'.format(tag)
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """One SMTP client's connection. Everything it sends gets delivered."""
+    def handle(self):
+        def send(text):
+            """Sends a reply line."""
+            self.wfile.write(text.encode('UTF-8') + b'\r\n')
+            self.wfile.flush()
+        send('220 mailhost ready')
+        recipients = []
+        for line in self.rfile:
+            command = line.decode('UTF-8', 'replace').strip()
+            verb = command[:4].upper()
+            if verb in ('HELO', 'EHLO'):
+                send('250 mailhost')
+            elif verb in ('MAIL', 'RSET'):
+                recipients = []
+                send('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(command.split(':', 1)[1])
+                send('250 OK')
+            elif verb == 'DATA':
+                send('354 End with a . on a line of its own')
+                data = b''
+                for row in self.rfile:
+                    if row.rstrip(b'\r\n') == b'.':
+                        break
+                    data += row[1:] if row.startswith(b'..') else row
+                self.server.mailhost.deliver(recipients, data)
+                send('250 OK')
+            elif verb == 'NOOP':
+                send('250 OK')
+            elif verb == 'QUIT':
+                send('221 Bye')
+                return
+            else:
+                send('502 Not implemented')
+
+class Server(socketserver.ThreadingTCPServer):
+    """A server for one of the protocols, sharing the one Mailhost."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple, handler: type, mailhost: Mailhost):
+        super().__init__(address, handler)
+        self.mailhost = mailhost
+
+def serve(imap_port: int = IMAP_PORT, smtp_port: int = SMTP_PORT) -> Mailhost:
+    """Starts the stand-in, in the background of this process. Returns its mailboxes."""
+    host = Mailhost()
+    for port, handler in ((imap_port, IMAPHandler), (smtp_port, SMTPHandler)):
+        server = Server((HOST, port), handler, host)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return host
+
+def ensure_running() -> bool:
+    """Starts the stand-in, unless there already is one. Returns whether it had to."""
+    try:
+        socket.create_connection((HOST, IMAP_PORT), timeout=1).close()
+        return False
+    except OSError:
+        serve()
+        return True
+
+if __name__ == '__main__':
+    serve(*(int(x) for x in sys.argv[1:3]))
+    print('Stand-in mail server: IMAP on {0}:{1}, SMTP on {0}:{2}. Ctrl-C to stop.'.format(
+        HOST, *(sys.argv[1:3] or (IMAP_PORT, SMTP_PORT))))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,93 @@
+"""Quick ways of picking out the few bits of the ASP emails the tests read: the links, and the
+plain text table cells. Regexes over the html, rather than building a whole BeautifulSoup tree
+of every email, which used to be most of the time an email check took. Anything the regexes
+can't manage falls back to BeautifulSoup. Run this directly to see how the two compare."""
+import re
+import sys
+import html
+import time
+from typing import List, Set
+import bs4
+
+# An <a> tag's href, whichever way it's quoted. Or not quoted.
+HREF = re.compile(r'''<a\s[^>]*?\bhref\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>"']+))''', re.I)
+# A table cell with nothing but text in it.
+CELL = re.compile(r'<td\b[^>]*>([^<]*)</td\s*>', re.I)
+# The locale parameter in the tracking links, like p1=en-gb.
+LOCALE_PARAM = re.compile(r'p1\=\w\w((-|_)\w\w)?')
+# The tracking links' domains, which say what locale an email is for.
+TRACKING = 't.campaign.adobe.com'
+CN_TRACKING = 't.dpc.rimanggis.com'
+
+def soup(page: str) -> bs4.BeautifulSoup:
+    """The whole email, parsed, the slow way."""
+    return bs4.BeautifulSoup(page, 'html.parser')
+
+def hrefs(page: str, part: str = '') -> List[str]:
+    """The addresses of the email's links, the ones containing part, in order."""
+    found = [html.unescape(next(g for g in match.groups() if g is not None))
+             for match in HREF.finditer(page)]
+    if not found and re.search(r'<a\s', page, re.I):    # Some odd markup, let the parser try.
+        return [x['href'] for x in soup(page).select('a[href*="{0}"]'.format(part))]
+    return [x for x in found if part in x]
+
+def cell(page: str, pattern: str) -> str:
+    """The text of the first table cell matching the regex pattern. Like
+    find('td', string=re.compile(pattern)).string, so None if there isn't one."""
+    for match in CELL.finditer(page):
+        text = html.unescape(match.group(1))
+        if re.search(pattern, text):
+            return text
+    # Could be inside some other tag, in the cell. BeautifulSoup's string looks through those.
+    found = soup(page).find('td', string=re.compile(pattern))
+    return found.string if found else None
+
+def locales(page: str, cn_mode: bool = False) -> Set[str]:
+    """The locale codes the email's tracking links are tagged with."""
+    if cn_mode:     # China does not have locale-tagged links.
+        found = {x.split('.')[-1] for x in hrefs(page, CN_TRACKING)}
+        return {'zh-cn'} if found == {'json'} else found
+    params = [LOCALE_PARAM.search(x) for x in hrefs(page, TRACKING)]
+    return {x.group().split('=')[-1] for x in params if x}
+
+def soup_locales(page: str, cn_mode: bool = False) -> Set[str]:
+    """locales, the way it used to be done, with the whole email parsed. For comparison."""
+    ema = soup(page)
+    if cn_mode:
+        found = {x['href'].split('.')[-1] for x in ema.select('a[href*="{0}"]'.format(CN_TRACKING))}
+        return {'zh-cn'} if found == {'json'} else found
+    params = [LOCALE_PARAM.search(x['href'])
+              for x in ema.select('a[href*="{0}"]'.format(TRACKING))]
+    return {x.group().split('=')[-1] for x in params if x}
+
+def sample(userid: str = 'abcd') -> str:
+    """An email shaped like the ASP ones: a big pile of nested tables, a few dozen links."""
+    rows = ''.join(
+        '<tr>\n<td class="spacer" style="padding: 0 20px;">&nbsp;</td>\n<td style="font-family: '
+        'Arial;">Some words about the Aussie Specialist Program, number {0}. &amp; more</td>\n'
+        '<td><a href="https://t.campaign.adobe.com/r/?id=h{0}&amp;p1=en-gb" target="_blank">'
+        '<img src="https://example.com/img{0}.png" alt="" width="600"></a></td>\n</tr>\n'.format(n)
+        for n in range(60))
+    return ('<html><head><style>td {{ color: #333; }}</style></head><body><table>\n{0}<tr>\n'
+            '<td>Username</td>\n<td>enaus0{1}</td>\n</tr>\n<tr>\n<td>Password</td>\n'
+            '<td>Xy7-temp</td>\n</tr>\n<tr><td><a href="https://www.aussiespecialist.com/'
+            'activation?u={1}&amp;p1=en-gb">Activate</a></td></tr>\n</table></body></html>'
+            ).format(rows, userid)
+
+def benchmark(pages: List[str], rounds: int = 50) -> None:
+    """Times the quick and the parsed ways of getting the locales and a cell out of the pages."""
+    for name, func in (('regex', lambda page: (locales(page), cell(page, 'abcd'))),
+                       ('bs4', lambda page: (soup_locales(page),
+                                             soup(page).find('td', string=re.compile('abcd'))))):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for page in pages:
+                func(page)
+        print('{0}: {1:.2f}ms per email'.format(
+            name, (time.perf_counter() - start) * 1000 / rounds / len(pages)))
+    if any(locales(page) != soup_locales(page) for page in pages):
+        print('The two ways disagree on the locales!')
+
+if __name__ == '__main__':
+    # Give it some saved email html files to try, or it'll use a made up one.
+    benchmark([open(x, encoding='UTF-8').read() for x in sys.argv[1:]] or [sample()])
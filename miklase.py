@@ -1,17 +1,94 @@
 """A few custom classes, slight modifications to the basic unittest functionality.
 Principally, to enable a different style of result output and recording."""
+import os
 import sys
 import time
 import enum
+import json
 import warnings
 import unittest
 from typing import Callable
 from contextlib import contextmanager
 from collections import OrderedDict
-from drivery import Drivery
+from xml.etree import ElementTree
+from drivery import SESSIONS, PROFILER
+import linkcheck
 
 STATES = enum.Enum('STATES', 'PASS SKIP FAIL ERROR')
 
+def overall_status(results: list) -> STATES:
+    """The worst status out of a test's [(status, info)] results. No results at all is an ERROR."""
+    return max((st for st, _ in results), key=lambda st: st.value, default=STATES.ERROR)
+
+class ResultLog:
+    """Streams each test's results to a JSON Lines file the moment the test finishes, a line per
+    test, so a crashed run keeps what it got through and the file can be tailed to watch progress.
+    Optionally, also keeps a JUnit XML copy of the whole file up to date, see write_junit.
+    Several processes can share the one file, so long as they all share the same lock too."""
+    def __init__(self, path: str, junit: str = None, lock=None):
+        self.path = path
+        self.junit = junit
+        self.lock = lock
+
+    def add(self, name: str, globs: dict, results: list, start: float, end: float,
+            **extra) -> None:
+        """Logs one test's results, like the [(status, info)] lists in MyTestResult.resultsList.
+        Anything extra, like how many commands it took, goes in the line too."""
+        record = OrderedDict([
+            ('test', name), ('site', globs.get('site')), ('locale', globs.get('locale')),
+            ('browser', globs.get('browser')), ('pid', os.getpid()), ('start', start),
+            ('duration', end - start),
+            ('status', overall_status(results).name),
+            ('results', [(st.name, info) for st, info in results])])
+        record.update(extra)
+        line = json.dumps(record) + '\n'
+        if self.lock is not None:
+            self.lock.acquire()
+        try:
+            with open(self.path, mode='a', encoding='UTF-8') as fil:
+                fil.write(line)
+            if self.junit:
+                write_junit(self.path, self.junit)
+        except OSError as ex:
+            print('Failed to log the result of', name, ex)
+        finally:
+            if self.lock is not None:
+                self.lock.release()
+
+# The process's ResultLog, if the results are being streamed. Like drivery's SESSIONS.
+RESULT_LOG = None
+# A multiprocessing queue to announce each test starting and stopping on, if anyone is watching.
+# Like {'event': 'start' or 'stop', 'test', 'locale', 'browser', 'time'}, and 'status', 'duration'.
+EVENTS = None
+
+def write_junit(path: str, junit: str) -> None:
+    """Rewrites a ResultLog's JSON Lines file as a JUnit XML file, for the CI tools.
+    A testsuite per site, locale and browser. Swapped in whole, so readers never see half a file."""
+    suites = OrderedDict()
+    with open(path, encoding='UTF-8') as fil:
+        for line in fil:
+            if line.strip():
+                rec = json.loads(line)
+                suites.setdefault('{0}.{1}.{2}'.format(
+                    rec['site'], (rec['locale'] or '/')[1:], rec['browser']), []).append(rec)
+    root = ElementTree.Element('testsuites')
+    for suite_name, recs in suites.items():
+        suite = ElementTree.SubElement(root, 'testsuite', name=suite_name, tests=str(len(recs)))
+        for key, status in (('failures', 'FAIL'), ('errors', 'ERROR'), ('skipped', 'SKIP')):
+            suite.set(key, str(sum(1 for rec in recs if rec['status'] == status)))
+        suite.set('time', '{0:.3f}'.format(sum(rec['duration'] for rec in recs)))
+        for rec in recs:
+            case = ElementTree.SubElement(suite, 'testcase', classname=suite_name,
+                                          name=rec['test'].split('.')[-1],
+                                          time='{0:.3f}'.format(rec['duration']))
+            tag = {'FAIL': 'failure', 'ERROR': 'error', 'SKIP': 'skipped'}.get(rec['status'])
+            if tag:
+                ElementTree.SubElement(case, tag, message=rec['status']).text = '\n\n'.join(
+                    info for status, info in rec['results'] if status != 'PASS')
+    temp = junit + '.tmp'
+    ElementTree.ElementTree(root).write(temp, encoding='UTF-8', xml_declaration=True)
+    os.replace(temp, junit)
+
 class JustStopError(unittest.TestCase.failureException):
     """Use this one if you want to crash a test, without logging another untreated exception."""
 
@@ -24,14 +101,19 @@ class MyTestCase(unittest.TestCase):
 
     def setUp(self) -> None:
         """Called just before each test is run, sets up the browser and test records."""
-        # Initialise the browser connection.
+        # Get a browser connection, a fresh one or a reset one from the pool.
         self.verificationErrors = []    # Keep a list of everything that went wrong.
         self.accept_next_alert = True
-        self.dr = Drivery(self.globs)
+        PROFILER.test = self.id()
+        self.dr = SESSIONS.acquire(self.globs)
+        self.commands_before = sum(self.dr.commands.values())
+        self.pages_before = len(self.dr.page_stats)
 
     def tearDown(self) -> None:
-        """Called after finishing each test, closes the browser and counts up the errors."""
-        self.dr.close()
+        """Called after finishing each test, returns the browser and counts up the errors."""
+        self.result.commandCounts[self.id()] = sum(self.dr.commands.values()) - self.commands_before
+        self.result.pageStats[self.id()] = self.dr.page_stats[self.pages_before:]
+        SESSIONS.release(self.dr)
         self.maxDiff = None
         for err in self.verificationErrors:
             self.result.addFailure(self, err)
@@ -67,6 +149,17 @@ class MyTestCase(unittest.TestCase):
                 self.add_error(msg)
             raise JustStopError()
 
+    def check_links(self, links: set, what: str) -> None:
+        """With check_links set, checks that all of the links actually lead somewhere.
+        Plain HTTP requests, all at once, not the browser, see linkcheck. Logs any broken ones."""
+        if not self.globs.get('check_links'):
+            return
+        with self.restraint('Could not check the {0} links'.format(what)):
+            broken = linkcheck.broken_links(links, self.globs['auth'], self.globs['base_url'],
+                                            self.globs.get('links_file'))
+            self.assertFalse(broken, 'Broken {0} links: {1}'.format(what, ', '.join(
+                '{0} ({1})'.format(url, status or 'no answer') for url, status in broken.items())))
+
     def add_error(self, message=None) -> None:
         """Adds an error to the errors list. Shortcut.
         message is a more readable Error message"""
@@ -171,8 +264,34 @@ class MyTestResult(unittest.TextTestResult):
     """Like a TextTestResult, but it actually remembers how all the tests went"""
     def __init__(self, *args, **kwargs):
         self.resultsList = OrderedDict()
+        self.commandCounts = {}     # Test name: How many WebDriver commands it took.
+        self.pageStats = {}     # Test name: [The timings of each page load it waited for]
+        self.startTimes = {}    # Test name: When it started, for the RESULT_LOG.
         super(MyTestResult, self).__init__(*args, **kwargs)
 
+    def startTest(self, test):
+        """Note when the test started, for the streamed results."""
+        self.startTimes[test.id()] = time.time()
+        super(MyTestResult, self).startTest(test)
+        if EVENTS is not None:
+            globs = getattr(test, 'globs', {})
+            EVENTS.put({'event': 'start', 'test': test.id(), 'locale': globs.get('locale'),
+                        'browser': globs.get('browser'), 'time': self.startTimes[test.id()]})
+
+    def stopTest(self, test):
+        """Once a test is completely done, stream its results out, if that's on."""
+        super(MyTestResult, self).stopTest(test)
+        name, globs, end = test.id(), getattr(test, 'globs', {}), time.time()
+        start = self.startTimes.get(name, end)
+        if RESULT_LOG is not None:
+            RESULT_LOG.add(name, globs, self.resultsList.get(name, []), start, end,
+                           commands=self.commandCounts.get(name),
+                           pages=len(self.pageStats.get(name, ())))
+        if EVENTS is not None:
+            EVENTS.put({'event': 'stop', 'test': name, 'locale': globs.get('locale'),
+                        'browser': globs.get('browser'), 'time': end, 'duration': end - start,
+                        'status': overall_status(self.resultsList.get(name, [])).name})
+
     def _exc_info_to_string(self, err, test):
         """Converts a sys.exc_info()-style tuple of values into a string."""
         return test.tidy_error(err)
@@ -210,12 +329,26 @@ class MyTestResult(unittest.TextTestResult):
             super(MyTestResult, self).addError(test, err)
             self.addResult(test, STATES.ERROR, test.tidy_error(err))
 
+    @staticmethod
+    def page_summary(stats: list) -> str:
+        """Sums up a test's page loads: how long was spent waiting, and on which was slowest.
+        The slowest one's server response, DOM ready, and load times are from the page itself."""
+        slow = max(stats, key=lambda x: x['total'])
+        return ('Page loads: {0}, {1:.1f}s waiting. Slowest: {2} {3:.1f}s (response {4}ms, '
+                'interactive {5}ms, loaded {6}ms)').format(
+                    len(stats), sum(x['total'] for x in stats), slow['url'], slow['total'],
+                    slow.get('response'), slow.get('interactive'), slow.get('load'))
+
     def printErrors(self):
         """After running the test, print out the full results"""
         self.stream.writeln()
         for name in self.resultsList:
             self.stream.writeln(self.separator1)
             self.stream.writeln(name)
+            if name in self.commandCounts:
+                self.stream.writeln('WebDriver commands: {0}'.format(self.commandCounts[name]))
+            if self.pageStats.get(name):
+                self.stream.writeln(self.page_summary(self.pageStats[name]))
             for status, info in self.resultsList[name]:
                 self.stream.writeln(self.separator2)
                 self.stream.writeln(status.name)
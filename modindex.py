@@ -0,0 +1,158 @@
+"""A small, cached index of the *_mods.json resource dumps, so the full dumps don't have to be
+parsed every time modulescripts is imported, in every process.
+
+Each dump is boiled down to {json locale: {module id: resource name}}, like
+{'en_gb': {'mod1': 'res3', ...}}, and kept in INDEX_FILE, next to the dumps. A dump's entry is
+rebuilt only once the dump itself changes: its size or time stamp, and then its contents' hash.
+The Catalogue puts all of them together, to look things up, or compare environments."""
+import os
+import sys
+import json
+import hashlib
+from glob import glob
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Where the indexes are cached. Delete it to have them all rebuilt.
+INDEX_FILE = os.path.join(HERE, 'mods_index.json')
+# Which files are module resource dumps.
+DUMPS = '*_mods.json'
+
+def build(path: str) -> dict:
+    """Reads a whole dump, and picks out each locale's module resource names."""
+    with open(path, encoding='UTF-8') as fil:
+        thelist = json.load(fil)
+    index = {}
+    for lan, content in thelist.items():
+        if not isinstance(content, dict):
+            continue    # The jcr: properties, not a locale.
+        for res, info in content.items():
+            if res.startswith('res') and isinstance(info, dict) and 'id' in info:
+                index.setdefault(lan, {})[info['id'].split('_')[-1]] = res
+    return index
+
+def digest(path: str) -> str:
+    """The hash of a dump's contents."""
+    with open(path, mode='rb') as fil:
+        return hashlib.sha1(fil.read()).hexdigest()
+
+def load_cache() -> dict:
+    """Reads the cached indexes. Missing or broken just means nothing cached."""
+    try:
+        with open(INDEX_FILE, encoding='UTF-8') as fil:
+            return json.load(fil)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(cache: dict) -> None:
+    """Writes the cached indexes, in one go, so another process never reads half of it."""
+    temp = '{0}.{1}'.format(INDEX_FILE, os.getpid())
+    try:
+        with open(temp, mode='w', encoding='UTF-8') as fil:
+            json.dump(cache, fil, indent=1, sort_keys=True)
+        os.replace(temp, INDEX_FILE)
+    except OSError as ex:
+        print('Failed to save the module index:', ex)
+
+def refresh(cache: dict, name: str) -> bool:
+    """Brings the cache's entry for one dump up to date. Returns whether it had to change it.
+    Same size and time stamp, it's fine. Otherwise, if the hash still matches, only the time stamp
+    needs updating. Only if the contents really changed does the dump get parsed again."""
+    path = os.path.join(HERE, name)
+    stat = os.stat(path)
+    entry = cache.get(name)
+    if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+        return False
+    sha = digest(path)
+    if entry and entry['sha1'] == sha:
+        entry.update(size=stat.st_size, mtime=stat.st_mtime)
+        return True
+    cache[name] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha1': sha, 'index': build(path)}
+    return True
+
+def get(name: str) -> dict:
+    """The index of the named dump, like 'uat_mods.json'. Rebuilt and saved first, if stale."""
+    cache = load_cache()
+    if refresh(cache, name):
+        save_cache(cache)
+    return cache[name]['index']
+
+def get_all() -> dict:
+    """The indexes of every dump there is, like {'uat_mods.json': index}. Stale ones rebuilt."""
+    cache = load_cache()
+    names = sorted(os.path.basename(p) for p in glob(os.path.join(HERE, DUMPS)))
+    changed = [refresh(cache, name) for name in names]
+    for name in set(cache) - set(names):     # That dump's gone, forget about it.
+        del cache[name]
+        changed.append(True)
+    if any(changed):
+        save_cache(cache)
+    return {name: cache[name]['index'] for name in names}
+
+def env_of(name: str) -> str:
+    """The environment a dump is for, going by its name. 'uat_mods.json' is 'uat'."""
+    return os.path.basename(name)[:-len(DUMPS) + 1]
+
+class Catalogue:
+    """Every environment's module resources, all in the one table, keyed by
+    (environment, json locale, module id), like ('uat', 'en_gb', 'mod1'). Any lookup is just
+    the one dict access. Nothing is read until the first time it's asked something."""
+    def __init__(self):
+        self._table = None
+        self._envs = None   # Environment: {(json locale, module id): resource name}
+
+    def load(self) -> None:
+        """Reads all of the dumps' indexes, see get_all. Call it again to pick up any changes."""
+        self._envs = {env_of(name): {(lan, mod): res for lan, mods in idx.items()
+                                     for mod, res in mods.items()}
+                      for name, idx in get_all().items()}
+        self._table = {(env,) + key: res for env, resources in self._envs.items()
+                       for key, res in resources.items()}
+
+    @property
+    def table(self) -> dict:
+        """The whole table, loaded if it hasn't been yet."""
+        if self._table is None:
+            self.load()
+        return self._table
+
+    def envs(self) -> list:
+        """The environments there are dumps for."""
+        if self._envs is None:
+            self.load()
+        return sorted(self._envs)
+
+    def resource(self, env: str, locale: str, module: str) -> str:
+        """The module's resource name in the locale on the environment. None if it's not there."""
+        return self.table.get((env, locale, module))
+
+    def locales(self, env: str, module: str) -> list:
+        """Which locales have the module on the environment."""
+        return sorted(lan for (ev, lan, mod) in self.table if ev == env and mod == module)
+
+    def diff(self, env: str, other: str) -> dict:
+        """What's different between two environments' modules. Like {'only <env>': [(locale,
+        module)], 'only <other>': [(locale, module)], 'renamed': [(locale, module, resource
+        on env, resource on other)]}."""
+        if self._envs is None:
+            self.load()
+        ours, theirs = self._envs.get(env, {}), self._envs.get(other, {})
+        return {'only ' + env: sorted(ours.keys() - theirs.keys()),
+                'only ' + other: sorted(theirs.keys() - ours.keys()),
+                'renamed': sorted(key + (ours[key], theirs[key]) for key in
+                                  ours.keys() & theirs.keys() if ours[key] != theirs[key])}
+
+# The one everything shares. It only loads when first used.
+CATALOGUE = Catalogue()
+
+if __name__ == '__main__':
+    # Run this one directly to build all of the indexes ahead of time.
+    # Or give it two environments, like 'uat prod', to see how their modules differ.
+    if len(sys.argv) == 3:
+        for what, items in CATALOGUE.diff(sys.argv[1], sys.argv[2]).items():
+            print('{0}: {1}'.format(what, len(items)))
+            for item in items:
+                print('    ' + ' '.join(item))
+    else:
+        for dump, idx in get_all().items():
+            print('{0}: {1} locales, {2} module resources'.format(
+                dump, len(idx), sum(len(mods) for mods in idx.values())))
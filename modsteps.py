@@ -0,0 +1,128 @@
+"""Compiles the module scripts from modulescripts.SCRIPTS, once, up front, into a compact form.
+The scripts are checked as they're compiled, so a typo turns up at startup, not an hour into a run.
+
+Each step becomes an (opcode, argument) pair, with the ids swapped for their number in the
+module's id table. An argument is one id number, or a tuple of them for a set of alternates,
+or, for a DRAG, a (source, target) pair of those. See modulescripts for what the steps mean."""
+import re
+from collections import OrderedDict
+from typing import Union, List
+
+# The step opcodes. CLICK clicks an id, PICK clicks whichever of its alternates is showing,
+# and DRAG drags one id (or set of alternates) onto another.
+CLICK, PICK, DRAG = range(3)
+OPNAMES = ('click', 'pick', 'drag')
+# An id, maybe followed by some extra attribute conditions, like 'Button_900[style*="z-index: 15"]'
+ID_FORM = re.compile(r'([A-Za-z_][\w-]*)((?:\[[^\]]+\])*)$')
+
+class Program:
+    """One module's script, compiled.
+    ids is the module's id table, and selectors the CSS selector for each of those ids.
+    steps are the (opcode, argument) pairs. index says which steps each id number is used in.
+    runs are the (start, stop) ranges of back to back clicking steps, which don't need anything
+    but the page to do, so could be sent off to the browser in one go."""
+    def __init__(self, name: str, script: list):
+        self.name = name
+        self.ids, self.selectors, self.steps = [], [], []
+        self.index = OrderedDict()  # id number: (step numbers)
+        self.numbers = {}   # id: id number
+        errors = []
+        for num, step in enumerate(script):
+            try:
+                self.steps.append(self.compile_step(step))
+            except ValueError as ex:
+                errors.append('{0} step {1}: {2}'.format(name, num, ex))
+        if errors:
+            raise ValueError('\n'.join(errors))
+        for num, (_, arg) in enumerate(self.steps):
+            for idnum in set(self.flatten(arg)):
+                self.index[idnum] = self.index.get(idnum, ()) + (num,)
+        self.runs, start = [], None
+        for num, (op, _) in enumerate(self.steps + [(DRAG, None)]):
+            if op == DRAG:
+                if start is not None:
+                    self.runs.append((start, num))
+                start = None
+            elif start is None:
+                start = num
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def run_end(self, num: int) -> int:
+        """Where the run of clicking steps that step num is in stops. Just num, if it isn't in one."""
+        for start, stop in self.runs:
+            if start <= num < stop:
+                return stop
+        return num
+
+    def intern(self, ident) -> int:
+        """Gets an id's number in the id table, adding it if it's new."""
+        if not isinstance(ident, str):
+            raise ValueError('{0!r} is not an id'.format(ident))
+        match = ID_FORM.match(ident)
+        if not match:
+            raise ValueError('{0!r} does not look like an id'.format(ident))
+        if ident not in self.numbers:
+            self.numbers[ident] = len(self.ids)
+            self.ids.append(ident)
+            self.selectors.append('[id="{0}"]{1}'.format(*match.groups()))
+        return self.numbers[ident]
+
+    def compile_locator(self, loc) -> Union[int, tuple]:
+        """An id to its number, or a list of alternates to a tuple of numbers."""
+        if isinstance(loc, list):
+            if not loc:
+                raise ValueError('an empty list of alternates')
+            return tuple(self.intern(l) for l in loc)
+        return self.intern(loc)
+
+    def compile_step(self, step) -> tuple:
+        """Turns a script step into an (opcode, argument) pair."""
+        if isinstance(step, tuple):
+            if len(step) != 2:
+                raise ValueError('a drag and drop needs a source and a target, got {0!r}'.format(
+                    step))
+            return DRAG, (self.compile_locator(step[0]), self.compile_locator(step[1]))
+        if isinstance(step, list):
+            return PICK, self.compile_locator(step)
+        if isinstance(step, str):
+            return CLICK, self.intern(step)
+        raise ValueError('String, List, or Tuple only, not {0!r}'.format(step))
+
+    @staticmethod
+    def flatten(arg) -> List[int]:
+        """All of the id numbers in a step's argument."""
+        if isinstance(arg, int):
+            return [arg]
+        return [n for part in arg for n in Program.flatten(part)]
+
+    def locator(self, arg) -> Union[str, List[str]]:
+        """Turns an argument back into the script's form: an id, or a list of alternates."""
+        return self.ids[arg] if isinstance(arg, int) else [self.ids[n] for n in arg]
+
+    def selector(self, arg) -> str:
+        """The CSS selector matching an argument's id, or any of its alternates."""
+        return ','.join(self.selectors[n] for n in self.flatten(arg))
+
+    def describe(self, num: int) -> str:
+        """Says what a step does, for the error messages."""
+        op, arg = self.steps[num]
+        if op == DRAG:
+            what = '{0!r} onto {1!r}'.format(self.locator(arg[0]), self.locator(arg[1]))
+        else:
+            what = repr(self.locator(arg))
+        return '{0} step {1} of {2}: {3} {4}'.format(self.name, num, len(self), OPNAMES[op], what)
+
+def compile_scripts(scripts: dict) -> OrderedDict:
+    """Compiles all of the scripts, like {module name: Program}. If any of them have problems,
+    raises a ValueError listing every one of them, not just the first."""
+    programs, errors = OrderedDict(), []
+    for name, script in scripts.items():
+        try:
+            programs[name] = Program(name, script)
+        except ValueError as ex:
+            errors.append(str(ex))
+    if errors:
+        raise ValueError('The module scripts have problems:\n' + '\n'.join(errors))
+    return programs
@@ -2,26 +2,67 @@
 import os
 import re
 import time
+import json
 import signal
 from typing import Union, List
 import argparse
+from collections import OrderedDict
 from multiprocessing import cpu_count
 from multiprocessing.pool import Pool
+from multiprocessing.util import Finalize
 from selenium.webdriver.remote.webdriver import WebDriver
-from selenium.webdriver import (Chrome, Firefox, Ie, Safari, Opera, Edge,
-                                FirefoxProfile, ActionChains)
-from selenium.webdriver.chrome.options import Options as ChromeOptions
+from selenium.webdriver import Chrome, Firefox, Ie, Safari, Opera, Edge, ActionChains
 from selenium.webdriver.remote.webelement import WebElement
 from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.remote.webdriver import WebDriverException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
-from modulescripts import (LANGS, MODULES, SCRIPTS, USER, PASSWORD, ENV, AUTH, TIMEFORMAT, DEBUG)
+from drivery import (launch_browser, wait_for_selector, PROFILER, LOGINS, COOKIE_KEYS,
+                     SHORT_WAIT)
+from journal import RunJournal
+from modulescripts import (LANGS, MODULES, SCRIPTS, USER, PASSWORD, ENV, AUTH, TIMEFORMAT, DEBUG,
+                           JSON)
+from modindex import CATALOGUE, env_of
+from modsteps import compile_scripts, Program, CLICK, PICK
 
 RESET_MODULE = 'cpCmndGotoSlide=0'
 MINIWAIT = 0.5
+# An async script that does a run of clicks right there in the module's frame, see run_clicks.
+# For each step's selector, waits for a showing match, and clicks it. When Captivate's current
+# slide changes, gives the new slide a moment to settle first. Calls back with how many it did,
+# the slide it got to, and which selector was missing, if it stopped early. Keeps count of the
+# clicks done in window.selphiBatch too, for if the call itself fails, see BATCH_PROGRESS_SCRIPT.
+# Arguments are: selectors, timeout per step ms, gap between clicks ms, slide settle ms, batch id.
+BATCH_CLICK_SCRIPT = (
+    'var s=arguments[0],m=arguments[1],g=arguments[2],q=arguments[3],b=arguments[4],d=arguments[5]'
+    ',p=window.selphiBatch={id:b,done:0,stop:false},i=0,t=Date.now(),c=null,l=sl();function sl(){t'
+    'ry{return window.cpInfoCurrentSlide||window.parent.cpInfoCurrentSlide}catch(e){return null}}f'
+    'unction vis(e){return e.getClientRects().length&&getComputedStyle(e).visibility!=="hidden"}fu'
+    'nction find(){var a=document.querySelectorAll(s[i]);for(var k=0;k<a.length;k++)if(vis(a[k]))r'
+    'eturn a[k];return null}function ev(e,k,x,y){var v;try{v=new MouseEvent(k,{bubbles:true,cancel'
+    'able:true,view:window,clientX:x,clientY:y})}catch(_){v=document.createEvent("MouseEvents");v.'
+    'initMouseEvent(k,true,true,window,1,0,0,x,y,false,false,false,false,0,null)}e.dispatchEvent(v'
+    ')}function f(){if(p.stop)return;if(i>=s.length)return d({done:i,slide:sl()});var n=sl(),e;if('
+    'n!==l){l=n;c=Date.now()}e=c===null||Date.now()-c>=q?find():null;if(e){var r=e.getBoundingClie'
+    'ntRect(),x=r.left+r.width/2,y=r.top+r.height/2;["mouseover","mousedown","mouseup","click"].fo'
+    'rEach(function(k){ev(e,k,x,y)});p.done=++i;t=Date.now();return setTimeout(f,g)}if(Date.now()-'
+    't>m)return d({done:i,slide:sl(),missing:s[i]});setTimeout(f,50)}f()')
+# A script that stops the module frame's batch of clicks, if it's still going, and says how many
+# it had done. Null if it can't know, like when the frame has been reloaded since, or that batch
+# never even started. Argument is: the batch id.
+BATCH_PROGRESS_SCRIPT = (
+    'var p=window.selphiBatch;if(!p||p.id!==arguments[0])return null;p.stop=true;return p.done')
+# How long to leave between the batched clicks, and for a new slide to settle, in milliseconds.
+BATCH_GAP = 150
+BATCH_SETTLE = 500
+# How long to wait for elements to turn up. The -w option overrides it, see parseargs.
+IMPLICITLY_WAIT = 20
 LIST_STR = List[str]    # pylint: disable=E1126
+# The module scripts, checked and compiled, see modsteps. A broken script stops it right here.
+PROGRAMS = compile_scripts(SCRIPTS)
+# Where the logins are kept between runs, see drivery.LoginCache. Shared with the website tests.
+LOGINS_FILE = 'logins.json'
 
 def do_module(driver: WebDriver, module: str) -> None:
     """Run this one if this is being imported as part of the Reg tests.
@@ -30,8 +71,7 @@ def do_module(driver: WebDriver, module: str) -> None:
     act, qld, nsw, nt, sa, tas, vic, wa, aboriginal, golf, lodges, ra, walks, wine"""
     global DRIVER    # pylint: disable=W0601
     DRIVER = driver
-    for elem in SCRIPTS[module]:
-        domo(elem)
+    run_program(PROGRAMS[module])
 
 def parseargs():
     """Do this bit separately so it can be copied into the new processes."""
@@ -63,6 +103,21 @@ def main() -> None:
                         choices=BROWSERS.keys(), metavar='')
     PARSER.add_argument('-w', '--wait', help='Wait this many seconds before deciding an element is '
                         'missing. Default is %(default)s', default=[20], type=int, nargs=1)
+    PARSER.add_argument('--headless', help='Run Chrome/Firefox without a visible window.',
+                        action='store_true')
+    PARSER.add_argument('--viewport', help='The window size to use, width height. Default is '
+                        'maximised, or 1920 1080 when headless.', nargs=2, type=int, default=None)
+    PARSER.add_argument('--lean', help='Turn off images, web fonts and animations in Chrome/Firefox.',
+                        action='store_true')
+    PARSER.add_argument('--profile', help='Time every browser command and wait, per module. Saved '
+                        'as PROF_*.json files in module_screenshots.', action='store_true')
+    PARSER.add_argument('--batch', help='Send each run of clicks to the browser in one go, rather '
+                        'than a click at a time. Drag and drops are still done one by one.',
+                        action='store_true')
+    PARSER.add_argument('--fresh-login', help='Always log in with the form, rather than borrowing '
+                        'a recent login from the last run.', action='store_true')
+    PARSER.add_argument('--resume', help='Carry on from where the last run was stopped, skipping '
+                        'the modules it already finished.', action='store_true')
     ARGS = PARSER.parse_args()
     parseargs()
     os.makedirs(SCREENSHOT_DIR, exist_ok=True)
@@ -77,93 +132,213 @@ def main() -> None:
 
 def full_languages_modules_run(langfilter: LIST_STR, modfilter: LIST_STR, brows: LIST_STR) -> None:
     """Run the selected set of modules and locales, logging results,
-    and saving a screenshot in case of failure.    By default, will run all of them."""
+    and saving a screenshot in case of failure.    By default, will run all of them.
+    Each locale and browser logs in once, then its modules are spread across the pool,
+    each in whichever browser is free, signed in with that login's cookies. See run_units."""
     output = '\n"START: {0}", {1}\n'.format(get_time(), ','.join(modfilter).upper())   # header row.
-    pool = Pool(cpu_count() * 2)
+    # Each finished module is noted down, so a cancelled run can be picked up again.
+    journal = RunJournal(os.path.join(SCREENSHOT_DIR, 'journal.jsonl'), {'env': ENV}, ARGS.resume)
+    pairs = [(lang, b) for lang in langfilter for b in brows]
+    # Anything finished in an earlier, cancelled run, doesn't need doing again.
+    cells = {key: journal.done[key] for key in journal.done}
+    # And some locales just don't have some of the modules, so don't even try those.
+    for lang, b in pairs:
+        for mod in modfilter:
+            if (mod, lang, b) not in cells and not MODULES[mod].get(lang):
+                cells[mod, lang, b] = missing_module(lang, mod)
+    todo = OrderedDict((pair, [mod for mod in modfilter if (mod,) + pair not in cells])
+                       for pair in pairs)
+    pool = Pool(cpu_count() * 2, initializer=init_worker, initargs=(ARGS,))
     try:
-        asy = pool.map_async(do_locale, [(x, LANGS, MOD_STEM, CMOD_STEM, modfilter, b,
-                                          BROWSERS[b], ARGS) for x in langfilter for b in brows])
-        while True:
-            if asy.ready():
-                break
-            time.sleep(1)   # Poolmapwaiting blocks KeyboardInterrupts, so don't do that.
+        failures, profiles = run_units(pool, todo, cells, journal)
     except KeyboardInterrupt:
         pool.terminate()
+        print('Run cancelled. Use the --resume option to carry on from where it stopped.')
         raise
-    results = asy.get()
-    output += '\n'.join(results)    # Each locale's row.
+    pool.close()
+    pool.join()
+    for (lang, b), stats in profiles.items():
+        write_profile(lang, b, stats)
+    # Each locale's row.
+    output += '\n'.join(failures.get(pair) or '_'.join([pair[0].upper(), pair[1].upper()]) + ''.join(
+        ',' + cells[(mod,) + pair] for mod in modfilter) for pair in pairs)
     output += '\n"FINISH: {0}"\n\n'.format(get_time())    # Footer row.
     try:
         with open(RESULTS_FILE, mode='a', encoding='UTF-8') as log:
             log.write(output)
+        journal.finish()
     except PermissionError:
         print('In future, be sure to not leave the log file open.')
         print('That tends to lock it, so now it cannot be written to.')
         print('\n\nNow, you have to try to read raw CSV from a console:\n\n')
         print(output)
 
-def restart_driver(br):
-    """Restarts the DRIVER."""
-    # Global not defined at module level. Well, whatever. pylint: disable=W0601
-    global DRIVER
-    if br == Firefox:   # And, a workaround for Firefox's distrust of basic authentication.
-        p = FirefoxProfile()
-        p.set_preference('network.http.phishy-userpass-length', 255)
-        DRIVER = Firefox(p)
-    elif br == Chrome:  # Now Chrome doesn't trust it either, bleh.
-        c = ChromeOptions()
-        c.add_argument('--disable-blink-features=BlockCredentialedSubresources')
-        DRIVER = Chrome(chrome_options=c)
-    else:
-        DRIVER = br()
-    DRIVER.implicitly_wait(IMPLICITLY_WAIT)
-    DRIVER.maximize_window()
+def missing_module(lang: str, mod: str) -> str:
+    """The result cell for a module the locale doesn't have. Says which environments do have it."""
+    lan, env = LANGS[lang][0].replace('-', '_'), env_of(JSON)
+    others = [other for other in CATALOGUE.envs() if CATALOGUE.resource(other, lan, mod)]
+    return '"{0}: SKIP: {1} has no {2} module on {3}{4}"'.format(
+        get_time(), lang, mod, env, ' (but {0} do)'.format(', '.join(others)) if others else '')
+
+def run_units(pool: Pool, todo: OrderedDict, cells: dict, journal: RunJournal) -> tuple:
+    """The scheduler. Logs in to every locale and browser with modules to do. As each login
+    finishes, hands its modules to the pool, with the login's cookies, so one locale's modules
+    can run side by side instead of one after another. Fills in cells, {(module, locale,
+    browser): result cell}, and notes each in the journal. Returns the failed logins' error rows,
+    {(locale, browser): row}, and the profiles, {(locale, browser): profiler stats}."""
+    logins = OrderedDict((pair, pool.apply_async(log_in_unit, (pair,)))
+                         for pair, mods in todo.items() if mods)
+    running, failures, profiles = OrderedDict(), {}, {}
+    while logins or running:
+        finished = [pair for pair in logins if logins[pair].ready()]
+        for pair in finished:
+            try:
+                session = logins.pop(pair).get()
+            except Exception as ex:    # The worker crashed. pylint: disable=W0703
+                session = {'error': repr(ex), 'profile': {}}
+            PROFILER.merge(profiles.setdefault(pair, {}), session['profile'])
+            if 'error' in session:
+                failures[pair] = ('"Login to {0} failed. That breaks the whole locale, look into '
+                                  'it:\n{1}"').format(pair[0], session['error'])
+                continue
+            for mod in todo[pair]:
+                running[(mod,) + pair] = pool.apply_async(
+                    do_module_unit, ((mod,) + pair + (session['cookies'],),))
+        done = [key for key in running if running[key].ready()]
+        for key in done:
+            try:
+                unit = running.pop(key).get()
+            except Exception as ex:    # Again, the worker crashed. pylint: disable=W0703
+                cells[key] = '"{0}: FAIL: The worker crashed: {1}"'.format(
+                    get_time(), repr(ex).replace('"', '""'))
+                continue
+            cells[key] = unit['cell']
+            journal.record(key, unit['cell'])
+            PROFILER.merge(profiles.setdefault(key[1:], {}), unit['profile'])
+        if not finished and not done:
+            time.sleep(0.1)   # Poolwaiting blocks KeyboardInterrupts, so don't do that.
+    return failures, profiles
 
-def do_locale(args):
-    """The target of a process, go do all the modules in a locale."""
+def init_worker(args: argparse.Namespace) -> None:
+    """Sets up each of the pool's worker processes, before they start taking units."""
     # Global can't be defined at module level. Processes are wierd. pylint: disable=W0601
-    global ARGS
+    global ARGS, DRIVER
     signal.signal(signal.SIGINT, signal.SIG_IGN)    # Set the workers to ignore KeyboardInterrupts.
-    # Unpack arguments
-    lang, langs, stem, cstem, modfilter, brname, browser, ARGS = args
+    ARGS, DRIVER = args, None
     parseargs()
-    # A Hack. CN has a different structure, so use a different url form.
-    if lang == 'cn':
-        stem = cstem
-    # Reset the driver between rounds
-    restart_driver(browser)
-    # Log into the site, so you can access the modules.
+    if not ARGS.fresh_login:
+        LOGINS.path = os.path.join(os.path.split(__file__)[0], LOGINS_FILE)
+    # Each worker keeps its browser between units, so close it when the worker is shut down.
+    Finalize(None, quit_driver, exitpriority=10)
+
+def restart_driver(brname: str):
+    """Restarts the DRIVER. The basic authentication workarounds are in drivery.launch_browser.
+    Headless mode still gets a full size window, so the drag and drops have room to work."""
+    # Global not defined at module level. Well, whatever. pylint: disable=W0601
+    global DRIVER
+    quit_driver()
+    DRIVER = launch_browser(brname, ARGS.headless, ARGS.viewport, ARGS.lean)
+    DRIVER.brname = brname
+    # No implicit waiting, find_surely waits for each thing explicitly.
+    DRIVER.implicitly_wait(0)
+    if ARGS.profile:
+        PROFILER.install()
+        PROFILER.watch(DRIVER)
+
+def quit_driver() -> None:
+    """Closes the worker's browser, if it has one, and if it's even still alive."""
+    global DRIVER    # pylint: disable=W0601
+    if globals().get('DRIVER') is not None:
+        try:
+            DRIVER.quit()
+        except WebDriverException:
+            pass
+    DRIVER = None
+
+def fresh_session(brname: str) -> None:
+    """Gets the worker's browser ready for a new locale: the right kind of browser, with none of
+    the last one's cookies. If it's broken, or the wrong kind, get a new one instead."""
+    if globals().get('DRIVER') is None or DRIVER.brname != brname:
+        restart_driver(brname)
+        return
     try:
-        log_in(lang)
+        DRIVER.switch_to.default_content()
+        DRIVER.delete_all_cookies()
+    except WebDriverException:
+        restart_driver(brname)
+
+def login_key(lang: str) -> tuple:
+    """What a locale's login is kept under in LOGINS. The same as the website tests key theirs:
+    the environment, the locale like /en-gb, and the username. So either can borrow the other's."""
+    return ENV, '/' + LANGS[lang][0], USER
+
+def log_in_unit(pair: tuple) -> dict:
+    """Logs in to the locale, in the given browser. Returns the session's cookies, to share
+    with the locale's module units, or the error if it didn't work. And the profile, either way.
+    A recent enough login from before, in the LOGINS cache, will do, if it still works."""
+    lang, brname = pair
+    PROFILER.test = 'log_in'
+    try:
+        fresh_session(brname)
+        cookies = LOGINS.get(*login_key(lang))
+        if cookies:
+            use_cookies(cookies)
+            open_url('{0}/{1}'.format(ENV, LANGS[lang][0]))
+            if wait_for_selector(DRIVER, '.link-signin-text', visible=True, timeout=SHORT_WAIT):
+                # Still got the Sign In link, so it's not signed in. Do it properly then.
+                LOGINS.forget(*login_key(lang))
+                DRIVER.delete_all_cookies()
+                cookies = None
+        if not cookies:
+            log_in(lang)
+            cookies = DRIVER.get_cookies()
+            LOGINS.put(*login_key(lang), cookies)
+        return {'cookies': cookies, 'profile': PROFILER.take()}
     except Exception:
-        DRIVER.quit()
-        return '"Login to {0} failed. That breaks the whole locale, look into it:\n{1}"'.format(
-            lang, tidy_error().replace('"', '""'))
+        return {'error': tidy_error().replace('"', '""'), 'profile': PROFILER.take()}
 
-    # Start recording results.
-    result = '_'.join([lang.upper(), brname.upper()])
-    for mod in modfilter:
-        try:
-            # Figure out the locale coding.
-            url = stem.format(langs[lang][0].replace('-', '_'), MODULES[mod][lang])
-            DRIVER.get(url)
-            begin_module()
-            # Try to do the module
-            for elem in SCRIPTS[mod]:
-                domo(elem)
-            result += ',"{0}: PASS"'.format(get_time())
-        # Something goes wrong, document it and go to the next module.
-        except Exception:
-            result += ',"{0}: FAIL: {1}"'.format(get_time(), tidy_error().replace('"', '""'))
-            draw_failure(lang, mod)
-    DRIVER.quit()
-    return result
+def do_module_unit(args: tuple) -> dict:
+    """Does one module in one locale. Borrows the locale's login by putting its cookies in
+    this worker's browser. Returns the result cell for the results file, and the profile."""
+    mod, lang, brname, cookies = args
+    PROFILER.test = mod
+    try:
+        fresh_session(brname)
+        use_cookies(cookies)
+        # A Hack. CN has a different structure, so use a different url form.
+        url = (CMOD_STEM if lang == 'cn' else MOD_STEM).format(
+            LANGS[lang][0].replace('-', '_'), MODULES[mod][lang])
+        open_url(url)
+        begin_module()
+        # Try to do the module
+        run_program(PROGRAMS[mod], ARGS.batch)
+        cell = '"{0}: PASS"'.format(get_time())
+    # Something goes wrong, document it and go to the next module.
+    except Exception:
+        cell = '"{0}: FAIL: {1}"'.format(get_time(), tidy_error().replace('"', '""'))
+        draw_failure(lang, mod)
+    return {'cell': cell, 'profile': PROFILER.take()}
 
-def log_in(lang: str) -> None:
-    """If testing with login, first, have to go and log in and everything.
-    Log in to ASP and to the server auth."""
-    url = '{0}/{1}'.format(ENV, LANGS[lang][0])
-    # Deal with Basic Server Authentication
+def use_cookies(cookies: list) -> None:
+    """Signs the browser in with another browser's cookies. They can only be set for the site
+    being shown, so go there first."""
+    open_url(ENV + '/robots.txt')
+    for cookie in cookies:
+        DRIVER.add_cookie({k: v for k, v in cookie.items() if k in COOKIE_KEYS})
+
+def write_profile(lang: str, brname: str, stats: dict) -> None:
+    """If profiling, saves the locale's timings in SCREENSHOT_DIR, as JSON."""
+    if not stats:
+        return
+    filna = 'PROF_{0}_{1}_{2}.json'.format(lang, brname, time.strftime('%Y%m%d_%H%M'))
+    try:
+        with open(os.path.join(SCREENSHOT_DIR, filna), mode='w', encoding='UTF-8') as fil:
+            json.dump(PROFILER.summary(stats), fil, indent=1)
+    except OSError as ex:
+        print('Failed to save the profile file:', ex)
+
+def open_url(url: str) -> None:
+    """Navigates to the url, dealing with the Basic Server Authentication on the way."""
     isie = isinstance(DRIVER, Ie)
     # Chrome and Firefox know how to use http headers.
     if not isie and AUTH:
@@ -175,12 +350,17 @@ def log_in(lang: str) -> None:
         except WebDriverException:  # If you're already logged in, never mind.
             pass
     DRIVER.get(url)
+
+def log_in(lang: str) -> None:
+    """If testing with login, first, have to go and log in and everything.
+    Log in to ASP and to the server auth."""
+    open_url('{0}/{1}'.format(ENV, LANGS[lang][0]))
     # Try to log in
     try:
-        DRIVER.find_element_by_css_selector('.link-signin-text').click()
-        DRIVER.find_element_by_id('j_username').send_keys(USER)
-        DRIVER.find_element_by_css_selector('[name="j_password"]').send_keys(PASSWORD)
-        DRIVER.find_element_by_id('usersignin').click()
+        find_surely('.link-signin-text').click()
+        find_surely('#j_username').send_keys(USER)
+        find_surely('[name="j_password"]').send_keys(PASSWORD)
+        find_surely('#usersignin').click()
         WebDriverWait(DRIVER, IMPLICITLY_WAIT).until(lambda _: '/secure' in DRIVER.current_url)
     except NoSuchElementException as ex:
         raise NoSuchElementException('Login failed, something was missing from the '
@@ -197,7 +377,7 @@ def begin_module():
     # Make sure the module is loaded first. Harder than it looks.
     # First, make sure that something is in the DOM,
     try:
-        check = DRIVER.find_element_by_css_selector('[id^="Text_Caption_"]')
+        check = find_surely('[id^="Text_Caption_"]')
     except NoSuchElementException:
         raise NoSuchElementException(
             'Failed to locate initial element. Module may be entirely broken, '
@@ -217,11 +397,11 @@ def begin_module():
 def switch_into_module(driver: WebDriver) -> None:
     """Extract the Enter Iframe function just so it can be better exported."""
     # Scorm's wrapper on the modules needs to be opened first.
-    click_surely(driver.find_element_by_css_selector('.scf-play-button'), False)
-    iframe = driver.find_element_by_css_selector('iframe[src^="/content/"]')
+    click_surely(find_surely('.scf-play-button', driver), False)
+    iframe = find_surely('iframe[src^="/content/"]', driver)
     driver.switch_to.frame(iframe)
     # Scorm has TWO layers of framing.
-    iframe = driver.find_element_by_css_selector('frame#ScormContent')
+    iframe = find_surely('frame#ScormContent', driver)
     driver.switch_to.frame(iframe)
 
 def domo(locator: Union[str, tuple, list]) -> None:
@@ -229,11 +409,7 @@ def domo(locator: Union[str, tuple, list]) -> None:
     if locator is a tuple, drags the first element to the second one.
     if a list, looks for each of the elements listed, clicks the first one that exists."""
     if isinstance(locator, str):
-        try:
-            ele = DRIVER.find_element_by_id(locator)
-        except NoSuchElementException:
-            raise NoSuchElementException("Didn't find {0}".format(locator)) from None
-        click_surely(ele)
+        click_surely(find_surely('[id="{0}"]'.format(locator)))
     elif isinstance(locator, tuple):
         new_drag_drop(locator[0], locator[1])
     elif isinstance(locator, list):
@@ -241,6 +417,60 @@ def domo(locator: Union[str, tuple, list]) -> None:
     else:
         raise TypeError('You broke it. String, List, or Tuple only.')
 
+def run_program(program: Program, batched: bool = False) -> None:
+    """Does each step of a compiled module script. If one goes wrong, the error says which.
+    If batched, each run of clicks is done in the browser in one go, see run_clicks. If the
+    batch gets stuck on a step, that step gets another go the usual way, then batching resumes.
+    If the batch's call itself fails, it carries on from however far the batch got, if the frame
+    can still say. If not, the module fails, rather than click steps that might be done already."""
+    num = 0
+    while num < len(program):
+        stop = program.run_end(num) if batched else num
+        if stop > num:
+            try:
+                num = run_clicks(program, num, stop)
+            except WebDriverException as ex:
+                done = batch_progress(num)
+                if done is None:
+                    why = 'The batch of clicks failed, not sure how far it got.'
+                    ex.msg = '{0}\n{1}\n{2}'.format(program.describe(num), why, ex.msg)
+                    raise
+                num += done
+            if num == stop:
+                continue
+        try:
+            do_step(program, num)
+        except WebDriverException as ex:
+            ex.msg = '{0}\n{1}'.format(program.describe(num), ex.msg)
+            raise
+        num += 1
+
+def run_clicks(program: Program, start: int, stop: int) -> int:
+    """Sends a run of clicking steps to the module frame, to be done there, in one round trip,
+    with BATCH_CLICK_SCRIPT. Returns the number of the step it got up to."""
+    got = DRIVER.execute_async_script(
+        BATCH_CLICK_SCRIPT, [program.selector(program.steps[n][1]) for n in range(start, stop)],
+        IMPLICITLY_WAIT * 1000, BATCH_GAP, BATCH_SETTLE, start)
+    return start + got['done']
+
+def batch_progress(start: int) -> int:
+    """Stops the batch of clicks from step start, and gets how many it had done.
+    None if it can't tell."""
+    try:
+        return DRIVER.execute_script(BATCH_PROGRESS_SCRIPT, start)
+    except WebDriverException:
+        return None
+
+def do_step(program: Program, num: int) -> None:
+    """Does one step of a compiled module script, see domo for what each kind does."""
+    op, arg = program.steps[num]
+    if op == CLICK:
+        click_surely(find_surely(program.selector(arg)))
+    elif op == PICK:
+        click_surely(pick_visible(program.selector(arg)))
+    else:
+        new_drag_drop(program.locator(arg[0]), program.locator(arg[1]))
+
 def new_drag_drop(source: str, target: str) -> None:
     """Like the ActionChains drag and drop,
     but updates the mouse position just after mousedown."""
@@ -249,11 +479,7 @@ def new_drag_drop(source: str, target: str) -> None:
         """Interpret whether input is a locator or a series or alternate locators.
         If there is a decorated clone, like in drag-drops, use frame to apply a format string."""
         if isinstance(loc, str):
-            loc = frame.format(loc)
-            try:
-                return DRIVER.find_element_by_id(loc)
-            except NoSuchElementException:
-                raise NoSuchElementException("Didn't find {0}".format(loc)) from None
+            return find_surely('[id="{0}"]'.format(frame.format(loc)))
         elif isinstance(loc, list):
             loc = [frame.format(l) for l in loc]
             return pick_from_possibilities(loc)
@@ -267,7 +493,7 @@ def new_drag_drop(source: str, target: str) -> None:
                           'wp.scrollTo(0,(h[0]+h[1])/2 - wp.innerHeight/2 + '
                           'wp.$("iframe[src*=\'/content/\']").offset().top)', source, target)
     ActionChains(DRIVER).click_and_hold(source).move_to_element(fource).release(target).perform()
-    time.sleep(MINIWAIT)
+    PROFILER.sleep(MINIWAIT, 'drag and drop')
 
 def click_surely(ele: WebElement, inframe: bool=True) -> None:
     """When clicking on an element, move it onscreen first. BECAUSE IE.
@@ -283,12 +509,29 @@ def click_surely(ele: WebElement, inframe: bool=True) -> None:
     except WebDriverException:
         ActionChains(DRIVER).move_to_element(ele).click().perform()
 
+def find_surely(selector: str, driver: WebDriver = None) -> WebElement:
+    """Finds the first element matching a css selector. There's no implicit waiting, so if it isn't
+    there yet, waits for it to turn up, for up to IMPLICITLY_WAIT seconds."""
+    driver = driver or DRIVER
+    found = driver.find_elements_by_css_selector(selector)
+    if not found and wait_for_selector(driver, selector, timeout=IMPLICITLY_WAIT):
+        found = driver.find_elements_by_css_selector(selector)
+    if not found:
+        raise NoSuchElementException("Didn't find {0}".format(selector))
+    return found[0]
+
 def pick_from_possibilities(locator: str) -> WebElement:
     """Deal with alternate ids. Use a css selector to get any proposed elements."""
-    eles = [e for e in DRIVER.find_elements_by_css_selector("#" + ",#".join(locator))
-            if e.is_displayed()]
+    return pick_visible("#" + ",#".join(locator))
+
+def pick_visible(selector: str) -> WebElement:
+    """Gets the first showing element matching the selector, waiting for one to turn up if need be.
+    Made for sets of alternate ids, in one selector, only one of which is meant to be there."""
+    if not DRIVER.find_elements_by_css_selector(selector):
+        wait_for_selector(DRIVER, selector, timeout=IMPLICITLY_WAIT)
+    eles = [e for e in DRIVER.find_elements_by_css_selector(selector) if e.is_displayed()]
     if len(eles) == 0:
-        raise NoSuchElementException("Didn't find {0}".format(locator))
+        raise NoSuchElementException("Didn't find {0}".format(selector))
     return eles[0]
 
 def get_time() -> str:
@@ -20,11 +20,12 @@ Also, something like that 'Button_2510[style*="z-index: 6"]' option is due to
 DE's nasty habit of picking button ids which are the same number as another locale's
 Open Menu Button, so the z-index is added to be more specific.
 A Tuple, like ('s15_GBR', 'gbr_drop') signifies a Drag And Drop, with the first
-one being dragged to the second. Note, Tuples can contain Lists too."""
+one being dragged to the second. Note, Tuples can contain Lists too.
+The scripts are checked, and compiled, by modsteps when modules.py starts up, so a malformed
+step stops it straight away, saying which module and step it is."""
 
-from os import path
-import json
 from collections import OrderedDict
+import modindex
 
 # Editing this is easier than using the command line.
 
@@ -106,20 +107,12 @@ MODULES = OrderedDict([('mod1', {}), ('mod2', {}), ('mod3', {}), ('act', {}), ('
                        ('aboriginal', {}), ('golf', {}), ('lodges', {}), ('ra', {}),
                        ('walks', {}), ('wine', {}), ('coastal', {}), ('cruise', {})])
 
-with open(path.join(path.dirname(__file__), JSON), encoding='UTF-8') as fil:
-    thelist = json.load(fil)
-try:
-    for lang in LANGS:
-        lan = LANGS[lang][0].replace('-', '_')
-        if lan in thelist:
-            for mod in thelist[lan]:
-                if mod.startswith('res'):
-                    modid = thelist[lan][mod]['id'].split('_')[-1]
-                    if modid in MODULES:
-                        MODULES[modid][lang] = mod
-except KeyError as ex:
-    print("KeyError: You might need to update your JSON file/setting, seems the '"
-          + ex.args[0] + "' locale/module couldn't be found in the existing one?")
+# Only the small, cached, index of the JSON file is read, see modindex. Not the whole thing.
+thelist = modindex.get(JSON)
+for lang in LANGS:
+    for modid, mod in thelist.get(LANGS[lang][0].replace('-', '_'), {}).items():
+        if modid in MODULES:
+            MODULES[modid][lang] = mod
 
 
 
@@ -0,0 +1,216 @@
+"""Records the site as a test run sees it, and plays it back again, from a local web server.
+So a change to the components or the tests can be tried out again and again in seconds,
+against a frozen copy of the site, without the network.
+
+Recording, the server passes each request on to the real site (with the basic auth), and keeps
+the response. Replaying, it answers from what was kept, and anything that wasn't is a 404.
+Either way, the site's own address in the pages is swapped for the local one, so the browser
+stays on the local server. Only the site's own responses are kept: anything from other hosts
+(CDNs, tracking, videos) the browser still gets from the internet, or not at all, offline.
+Anything random, like registering a new user, or a captcha, won't replay, of course.
+
+A snapshot is a folder per site, like snapshots/uat-pub-elb-asp.tour-aus.aws.haylix.net,
+with a .json (the status and headers) and a .body file for each request, named by its hash.
+Set replay in test.properties to have the runs use one, or run this directly:
+    python replay.py record|replay <site url> [snapshot folder] [port]"""
+import os
+import re
+import sys
+import json
+import base64
+import hashlib
+import threading
+import configparser
+import http.client
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+from typing import List, Tuple
+
+# Where the servers listen. A second site, like the chenvironment, gets the next port along.
+HOST = 'localhost'
+PORT = 8800
+# Where the snapshots go, if not told otherwise.
+SNAPSHOTS = 'snapshots'
+# The response headers not worth keeping, they're about the connection, not the page.
+# Or would stop the page working from the local server, like only allowing https.
+DROP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-length',
+                'content-encoding', 'strict-transport-security', 'content-security-policy',
+                'public-key-pins', 'alt-svc'}
+# The request headers not passed on to the site. The replacements are filled in.
+SKIP_HEADERS = {'host', 'connection', 'accept-encoding', 'authorization', 'keep-alive'}
+# Which responses have the site's address in them that needs swapping for the local one.
+TEXT_TYPES = ('text/', 'javascript', 'json', 'xml')
+
+class NoSnapshotError(FileNotFoundError):
+    """Asked to replay a site that hasn't been recorded."""
+
+def request_key(method: str, path: str, body: bytes) -> str:
+    """What a request's response is kept as: the hash of its method, path and any form data."""
+    return hashlib.sha1(b'\n'.join((method.encode(), path.encode(), body or b''))).hexdigest()
+
+def swap_site(data: bytes, site: str, local: str, scheme: str = 'http') -> bytes:
+    """Swaps a site's address for another, like https://site for http://localhost:8800.
+    Including the //site and the JSON escaped https:\\/\\/site ways of writing it."""
+    return re.sub(rb'(https?:)?(\\?/\\?/)' + re.escape(site.encode()) + rb'(?![\w.-])',
+                  lambda m: (scheme.encode() + b':' if m.group(1) else b'') + m.group(2) +
+                  local.encode(), data)
+
+class Snapshot:
+    """One site's kept responses, in a folder. Each is kept in files of its own, so the
+    server's threads never write the same file. site.json says which site it's a copy of."""
+    def __init__(self, folder: str, site: str = None):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        info = os.path.join(folder, 'site.json')
+        if site:
+            with open(info, mode='w', encoding='UTF-8') as fil:
+                json.dump({'site': site}, fil)
+        with open(info, encoding='UTF-8') as fil:
+            self.site = json.load(fil)['site']
+
+    def load(self, key: str) -> Tuple[int, List[list], bytes]:
+        """A kept response: its status, headers, and body. None if there isn't one."""
+        path = os.path.join(self.folder, key)
+        try:
+            with open(path + '.json', encoding='UTF-8') as fil:
+                info = json.load(fil)
+            with open(path + '.body', mode='rb') as fil:
+                return info['status'], info['headers'], fil.read()
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key: str, request: str, status: int, headers: List[list], body: bytes) -> None:
+        """Keeps a response. The body first, so there's never a .json without its .body."""
+        path = os.path.join(self.folder, key)
+        for ext, data in (('.body', body), ('.json', json.dumps(
+                {'request': request, 'status': status, 'headers': headers}, indent=1).encode())):
+            temp = '{0}{1}.{2}'.format(path, ext, threading.get_ident())
+            with open(temp, mode='wb') as fil:
+                fil.write(data)
+            os.replace(temp, path + ext)
+
+class ReplayServer(ThreadingHTTPServer):
+    """Serves one site's snapshot. Given an upstream (the site's url), records it first."""
+    daemon_threads = True
+
+    def __init__(self, port: int, snapshot: Snapshot, upstream: str = None, auth: list = None):
+        super().__init__((HOST, port), ReplayHandler)
+        self.snapshot = snapshot
+        self.local = '{0}:{1}'.format(HOST, port)
+        self.upstream = urlsplit(upstream) if upstream else None
+        self.auth = 'Basic ' + base64.b64encode(':'.join(auth).encode()).decode() if auth else None
+        # Each thread keeps its connection to the site open, for the next request.
+        self.conns = threading.local()
+        self.hits = self.misses = self.recorded = 0
+
+    def fetch(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        """Passes a request on to the site. Returns the status, headers and body it answered."""
+        for attempt in (1, 0):
+            conn = getattr(self.conns, 'conn', None)
+            if conn is None:
+                conn = self.conns.conn = (
+                    http.client.HTTPSConnection if self.upstream.scheme == 'https'
+                    else http.client.HTTPConnection)(self.upstream.netloc, timeout=60)
+            try:
+                conn.request(method, path, body or None, headers)
+                resp = conn.getresponse()
+                return resp.status, resp.getheaders(), resp.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self.conns.conn = None
+                if not attempt:
+                    raise
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """One request: answered from the snapshot, or, recording, from the site and then kept."""
+    protocol_version = 'HTTP/1.1'
+
+    def respond(self):
+        """Does whichever method was asked for, they're all the same here."""
+        server, snapshot = self.server, self.server.snapshot
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        key = request_key(self.command, self.path, body)
+        site = urlsplit(snapshot.site).netloc
+        if server.upstream:
+            headers = {k: swap_site(v.encode(), server.local, site, server.upstream.scheme).decode()
+                       for k, v in self.headers.items() if k.lower() not in SKIP_HEADERS}
+            headers.update({'Host': site, 'Accept-Encoding': 'identity'})
+            if server.auth:
+                headers['Authorization'] = server.auth
+            try:
+                status, kept, data = server.fetch(self.command, self.path, headers, body)
+            except (http.client.HTTPException, OSError) as ex:
+                self.send_error(502, 'Could not reach {0}: {1}'.format(site, ex))
+                return
+            kept = [[k, v] for k, v in kept if k.lower() not in DROP_HEADERS]
+            snapshot.save(key, '{0} {1}'.format(self.command, self.path), status, kept, data)
+            server.recorded += 1
+            found = status, kept, data
+        else:
+            found = snapshot.load(key)
+        if found is None:
+            server.misses += 1
+            self.send_error(404, 'Not in the snapshot: {0} {1}'.format(self.command, self.path))
+            return
+        server.hits += 1
+        status, headers, data = found
+        self.send_response(status)
+        for name, value in headers:
+            if name.lower() == 'set-cookie':    # The cookies have to be for the local server now.
+                value = re.sub(r';\s*(domain=[^;]*|secure)(?=;|$)', '', value, flags=re.I)
+            elif name.lower() == 'location':
+                value = swap_site(value.encode(), site, server.local).decode()
+            elif name.lower() == 'content-type' and any(t in value for t in TEXT_TYPES):
+                data = swap_site(data, site, server.local)
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    do_GET = do_POST = do_HEAD = do_PUT = do_DELETE = do_OPTIONS = respond
+
+    def log_message(self, format, *args):  # pylint: disable=W0622
+        """Only the misses are worth mentioning."""
+        if len(args) > 1 and str(args[1]) == '404':
+            super().log_message(format, *args)
+
+def folder_for(site: str, snapshots: str = SNAPSHOTS) -> str:
+    """The site's snapshot folder: named after its host, in the snapshots folder."""
+    return os.path.join(snapshots, urlsplit(site).netloc.replace(':', '_'))
+
+def serve(site: str, snapshots: str = SNAPSHOTS, port: int = PORT, record: bool = False,
+          auth: list = None) -> str:
+    """Starts a server for the site's snapshot, in the background of this process, recording
+    it first if asked to. Returns the local url to use instead of the site's.
+    Replaying a site that hasn't been recorded is a NoSnapshotError, saying so."""
+    folder = folder_for(site, snapshots)
+    if not record and not os.path.exists(os.path.join(folder, 'site.json')):
+        raise NoSnapshotError('No snapshot for {0} in {1}, record one first.'.format(site, folder))
+    server = ReplayServer(port, Snapshot(folder, site if record else None),
+                          site if record else None, auth)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return 'http://' + server.local
+
+def read_auth() -> list:
+    """The basic auth from test.properties, for recording."""
+    conf = configparser.ConfigParser()
+    conf.read(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test.properties'))
+    auth = conf['Main Section'].get('auth')
+    return auth.split(',') if auth else None
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] not in ('record', 'replay'):
+        print(__doc__)
+        sys.exit(1)
+    try:
+        LOCAL = serve(sys.argv[2], *sys.argv[3:4], *(int(x) for x in sys.argv[4:5]),
+                      record=sys.argv[1] == 'record', auth=read_auth())
+    except NoSnapshotError as ex:
+        print(ex)
+        sys.exit(1)
+    print('{0}ing {1} at {2}. Ctrl-C to stop.'.format(sys.argv[1].title(), sys.argv[2], LOCAL))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
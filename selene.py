@@ -5,24 +5,74 @@ import os
 import io
 import sys
 import time
+import json
 import signal
 import unittest
 import configparser
 from typing import Tuple
-from multiprocessing import cpu_count, Pool
+from collections import OrderedDict
+from multiprocessing import cpu_count, Pool, Lock
+from multiprocessing.util import Finalize
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.common.exceptions import ElementNotVisibleException, ElementNotInteractableException
 import drivery as DR
+import mailhost
+import replay
 import modules as MOD
 import miklase
+from journal import RunJournal
+
+# Where the durations of previous runs' tests are kept, to schedule the slow ones first.
+DURATIONS_FILE = 'durations.json'
+# How long to guess a test takes, if it has never been run before, in seconds.
+DEFAULT_DURATION = 60
+# Where the signed in sessions' cookies are kept, for the tests to borrow. See drivery.LoginCache.
+LOGINS_FILE = 'logins.json'
+# Where the checked links' statuses are kept, for the other tests to reuse. See linkcheck.LinkCache.
+LINKS_FILE = 'links.json'
+# Where the emails already downloaded are kept, so they needn't be again. See drivery.MailCache.
+MAIL_CACHE_DIR = 'mail_cache'
+# The settings a run's journal has to match to be resumed. Running somewhere else starts afresh.
+JOURNAL_SETTINGS = ('site', 'environment', 'chenvironment')
 
 def main() -> None:
     """If selene.py is the entrypoint, read the settings from the config file and run the tests."""
     # Get the test run settings from the config file.
     args = read_properties()
-    # And run the test with the config file settings.
-    launch_test_suite(args)
+    # Or, compare the highlight modes, if that's what was asked for.
+    if '--bench-highlight' in sys.argv:
+        benchmark_highlight(args)
+        return
+    # And run the test with the config file settings. Or finish off the last run, if it was cut short.
+    try:
+        launch_test_suite(args, resume='--resume' in sys.argv)
+    except replay.NoSnapshotError as ex:
+        print(ex)
+        sys.exit(1)
+
+def benchmark_highlight(args: dict) -> dict:
+    """Runs the properties file's tests, in its first locale and browser, once in each highlight
+    mode, right here in this process. Prints how many WebDriver commands each test took, per mode.
+    Returns that as well, like {mode: {test name: command count}}."""
+    perform_hacks()
+    globs = locale_globs(args['locales'][0], args['browsers'][0], args)
+    case, names, _ = suite_of(globs['site'])
+    counts = OrderedDict()
+    for mode in DR.HIGHLIGHTS:
+        globs['highlight'] = mode
+        with io.StringIO() as buf:
+            runner = miklase.MyTestRunner(stream=buf, resultclass=miklase.MyTestResult)
+            runner.run(unittest.TestSuite(
+                [case(names[x], globs.copy(), runner.result) for x in globs['tests'] or names]))
+        counts[mode] = runner.result.commandCounts
+    DR.SESSIONS.drain()
+    print('{0:<60}'.format('WebDriver commands per test') + ''.join(
+        '{0:>8}'.format(mode) for mode in counts))
+    for name in counts[DR.HIGHLIGHTS[0]]:
+        print('{0:<60}'.format(name) + ''.join(
+            '{0:>8}'.format(counts[mode].get(name, '-')) for mode in counts))
+    return counts
 
 def test_dr() -> Tuple[dict, DR.Drivery]:
     """When the module is loaded, call this one to get a prepopulated gdict and Drivery object."""
@@ -34,36 +84,333 @@ def test_dr() -> Tuple[dict, DR.Drivery]:
     d['locale_url'] = d['base_url'] + d['locale']
     return d, DR.Drivery(d)
 
-def launch_test_suite(args: dict) -> list:
-    """Set up the multiprocessing constructure, and kick off all of the tests."""
+def launch_test_suite(args: dict, events=None, resume: bool = False) -> list:
+    """Set up the multiprocessing constructure, and kick off all of the tests.
+    The run is broken up into single tests, see run_units for how they get handed out.
+    Given a multiprocessing queue of events, each test's start and stop is put on it as it
+    happens, see miklase.EVENTS. That's how the dialog window shows the run's progress.
+    Each finished test is noted in the site's JOURNAL file. With resume, the tests the journal
+    says are done already are skipped. The journal is deleted once the whole run is done."""
     outdir = os.path.split(__file__)[0]
-    # Each locale and browser combination is to be run in parallel, break out the MultiProcessing.
+    prepare_replay(args)
+    prepare_mail(args)
+    units = plan_units(args)
+    journal = RunJournal(os.path.join(outdir, 'JOURNAL_{0}.jsonl'.format(args['site'])),
+                         {k: args[k] for k in JOURNAL_SETTINGS}, resume)
+    # Each test's results are streamed to the one file as they finish, see miklase.ResultLog.
+    miklase.RESULT_LOG = result_log(outdir, args['site'], args['junit'], Lock())
+    miklase.EVENTS = events
     # Up to 3xcores, but only as many as needed.
-    count = min(cpu_count() * 3, len(args['locales']) * len(args['browsers']))
-    pool = Pool(count)
-    # KeyboardInterrupts don't actually break out of blocking-waits, so a bit of a workaround:
-    try:    # Do the things as normal,
-        asy = pool.map_async(launch_test, [(loc, bro, outdir, args.copy())
-                                           for loc in args['locales'] for bro in args['browsers']])
-        while True:     # But check every so often if they are all done.
-            if asy.ready():
-                return asy.get()  # If so, cool, let's go.
-            time.sleep(1) # If not, wait a second and check again. This doesn't block the interrupt.
+    count = min(cpu_count() * 3, len(units))
+    logins = os.path.join(outdir, LOGINS_FILE) if args['reuse_logins'] else None
+    pool = Pool(count, initializer=init_worker, initargs=(
+        args['browser_reuse'], args['profile'], miklase.RESULT_LOG, events, logins,
+        os.path.join(outdir, MAIL_CACHE_DIR)))
+    # KeyboardInterrupts don't actually break out of blocking-waits, so run_units polls instead.
+    try:
+        results = run_units(pool, count, units, outdir, args, journal)
     except KeyboardInterrupt:
         # If there is an interrupt, shut down everything, that was the Cancel Run signal.
         pool.terminate()
+        print('Run cancelled. Use selene.py --resume to carry on from where it stopped.')
         sys.exit()
+    pool.close()
+    pool.join()
+    journal.finish()
+    return results
 
-def launch_test(args) -> Tuple[str, str, dict]:
-    """Do all the things needed to run a test suite. Put this as the target call of a process."""
+def suite_of(site: str) -> Tuple[type, OrderedDict, dict]:
+    """Gets the test case class, the test names, and the test dependencies of the given site."""
     # Put these in this method here to avoid circular importing.
     import ASP, AUS, INV
+    return {'ASP': (ASP.ASP, ASP.aspnames, ASP.aspdeps),
+            'AUS': (AUS.AUS, AUS.ausnames, AUS.ausdeps),
+            'INV': (INV.INV, INV.invnames, INV.invdeps)}[site]
+
+def plan_units(args: dict) -> OrderedDict:
+    """Breaks the run up into (locale, browser, test) units, in the usual running order.
+    Each unit maps to the set of units that have to be finished before it can start."""
+    _, names, deps = suite_of(args['site'])
+    tests = args['tests'] or list(names)
+    return OrderedDict(((loc, bro, t), {(loc, bro, d) for d in deps.get(t, ()) if d in tests})
+                       for loc in args['locales'] for bro in args['browsers'] for t in tests)
+
+def run_units(pool: Pool, count: int, units: OrderedDict, outdir: str, args: dict,
+              journal: RunJournal = None) -> list:
+    """The scheduler. Whenever a worker is free, hands it the next unit whose prerequisites are
+    all done, so a slow test only holds up its own dependents, not its whole locale.
+    Any globs changes a unit makes (REG's username, say) are passed on to its locale's later units.
+    Units already in the journal count as done from the start, and each newly done one is added.
+    Returns the results in the same (browser, locale, results dict) form launch_test does."""
+    durations = load_durations(outdir)
+    rank = priorities(units, {key: estimate(durations, args['site'], key) for key in units})
+    waiting = OrderedDict((key, set(pre)) for key, pre in units.items())
+    pairs = OrderedDict.fromkeys(key[:2] for key in units)
+    globses = {pair: locale_globs(pair[0], pair[1], args.copy()) for pair in pairs}
+    left = {pair: sum(1 for key in units if key[:2] == pair) for pair in pairs}
+    running, done = {}, {}
+    for key in units:
+        if journal is not None and key in journal.done:
+            done[key] = resumed_unit(key, journal.done[key])
+            del waiting[key]
+            globses[key[:2]].update(done[key]['changes'])
+            left[key[:2]] -= 1
+    for pre in waiting.values():
+        pre.difference_update(done)
+    for pair in pairs:  # All done last time, so won't finish below, but still needs its file.
+        if not left[pair]:
+            write_output(outdir, globses[pair], [done[k] for k in units if k[:2] == pair])
+    start = time.time()
+    while waiting or running:
+        # Top up the idle workers with whatever is ready to go, longest (remaining chain) first.
+        ready = sorted((k for k in waiting if not waiting[k]), key=rank.get, reverse=True)
+        for key in ready[:count - len(running)]:
+            del waiting[key]
+            running[key] = pool.apply_async(launch_unit, ((key, globses[key[:2]].copy()),))
+        finished = [key for key in running if running[key].ready()]
+        for key in finished:
+            done[key] = collect_unit(key, running.pop(key), args['site'])
+            if journal is not None and done[key]['pid'] is not None:   # Crashes get another go.
+                journal.record(key, journal_entry(done[key]))
+            globses[key[:2]].update(done[key]['changes'])
+            for pre in waiting.values():
+                pre.discard(key)
+            left[key[:2]] -= 1
+            if not left[key[:2]]:
+                write_output(outdir, globses[key[:2]], [done[k] for k in units if k[:2] == key[:2]])
+        if not finished:    # Poll, rather than block on a result. Blocking eats KeyboardInterrupts.
+            time.sleep(0.1)
+    report_utilisation(outdir, args['site'], done, count, time.time() - start)
+    save_durations(outdir, args['site'], durations, done)
+    results = []
+    for loc, bro in pairs:
+        merged = OrderedDict()
+        for key in units:
+            if key[:2] == (loc, bro):
+                merged.update(done[key]['results'])
+        results.append((bro, loc, merged))
+    return results
+
+def duration_key(site: str, key: tuple) -> str:
+    """The durations file's key for a unit. Something like 'ASP|NAV|/en-gb|chrome'."""
+    return '|'.join((site, key[2], key[0], key[1]))
+
+def load_durations(outdir: str) -> dict:
+    """Reads the recorded test durations. No file yet just means no history yet."""
+    try:
+        with open(os.path.join(outdir, DURATIONS_FILE), encoding='UTF-8') as fil:
+            return json.load(fil)
+    except (OSError, ValueError):
+        return {}
+
+def save_durations(outdir: str, site: str, durations: dict, done: dict) -> None:
+    """Adds this run's test durations to the record. A test's recorded duration is averaged
+    with the previous one, so one unusually slow run doesn't throw off the next schedule."""
+    for key, unit in done.items():
+        if unit['pid'] is None:     # Crashed workers don't say anything about the test.
+            continue
+        took, name = unit['end'] - unit['start'], duration_key(site, key)
+        durations[name] = (durations[name] + took) / 2 if name in durations else took
+    try:
+        with open(os.path.join(outdir, DURATIONS_FILE), mode='w', encoding='UTF-8') as fil:
+            json.dump(durations, fil, indent=1, sort_keys=True)
+    except OSError as ex:
+        print("Failed to save the durations file:", ex)
 
+def estimate(durations: dict, site: str, key: tuple) -> float:
+    """Guesses how long a unit will take. Its own previous time if it has one, otherwise the
+    average of the same test in other locales and browsers, otherwise just the default."""
+    name = duration_key(site, key)
+    if name in durations:
+        return durations[name]
+    prefix = '|'.join((site, key[2], ''))
+    others = [v for k, v in durations.items() if k.startswith(prefix)]
+    return sum(others) / len(others) if others else DEFAULT_DURATION
+
+def priorities(units: OrderedDict, estimates: dict) -> dict:
+    """Ranks each unit by how long it and the longest chain of units waiting on it will take.
+    Starting the biggest ones first keeps one slow locale from finishing long after the rest."""
+    dependents = {key: [] for key in units}
+    for key, pre in units.items():
+        for p in pre:
+            dependents[p].append(key)
+    rank = {}
+    def chain(key):
+        """The unit's estimate, plus the longest of its dependents' chains."""
+        if key not in rank:
+            rank[key] = estimates[key] + max((chain(d) for d in dependents[key]), default=0)
+        return rank[key]
+    for key in units:
+        chain(key)
+    return rank
+
+def journal_entry(unit: dict) -> dict:
+    """What the journal needs to remember of a finished unit, to put it back together on resume."""
+    return {'start': unit['start'], 'end': unit['end'], 'output': unit['output'],
+            'changes': unit['changes'], 'results': [
+                (name, [(st.name, info) for st, info in res])
+                for name, res in unit['results'].items()]}
+
+def resumed_unit(key: tuple, entry: dict) -> dict:
+    """Puts a journalled unit back together. It has no pid, this run didn't actually run it."""
+    return {'key': key, 'pid': None, 'start': entry['start'], 'end': entry['end'],
+            'output': entry['output'], 'changes': entry['changes'], 'sessions': '', 'profile': {},
+            'results': OrderedDict((name, [(miklase.STATES[st], info) for st, info in res])
+                                   for name, res in entry['results'])}
+
+def collect_unit(key: tuple, asy, site: str) -> dict:
+    """Gets the finished unit's results. If the worker itself crashed, rather than the test
+    failing, make up a result saying so, the rest of the run can go on without it."""
+    try:
+        return asy.get()
+    except Exception as ex:    # Anything at all, it is being logged. pylint: disable=W0703
+        name = suite_of(site)[1][key[2]]
+        if miklase.RESULT_LOG is not None:
+            miklase.RESULT_LOG.add(name, {'site': site, 'locale': key[0], 'browser': key[1]},
+                                   [(miklase.STATES.ERROR, 'The worker crashed: {0!r}'.format(ex))],
+                                   time.time(), time.time())
+        if miklase.EVENTS is not None:
+            miklase.EVENTS.put({'event': 'stop', 'test': name, 'locale': key[0], 'browser': key[1],
+                                'time': time.time(), 'duration': 0, 'status': 'ERROR'})
+        return {'key': key, 'pid': None, 'start': 0, 'end': 0, 'changes': {}, 'sessions': '',
+                'profile': {},
+                'output': '\n{0}: the worker crashed: {1!r}\n'.format(name, ex),
+                'results': {name: [(miklase.STATES.ERROR, 'The worker crashed: {0!r}'.format(ex))]}}
+
+def init_worker(reuse: int, profile: bool = False, log: miklase.ResultLog = None,
+                events=None, logins: str = None, mail_cache: str = None) -> None:
+    """Sets up each of the pool's worker processes, before they start taking units."""
     signal.signal(signal.SIGINT, signal.SIG_IGN)    # Set the workers to ignore KeyboardInterrupts.
-    locale, browser, outdir, globs = args   # Unpack arguments.
     # Do a bunch of method overrides to get it to work properly.
     perform_hacks()
-    # Set up the run settings.
+    # How many tests each browser can be used for before it gets replaced.
+    DR.SESSIONS.max_uses = reuse
+    # Time everything that talks to the browser, if asked to. See write_output.
+    if profile:
+        DR.PROFILER.install()
+    # Where to stream the results to, shared between all of the workers.
+    miklase.RESULT_LOG = log
+    # And who to tell about each test starting and stopping, if anyone.
+    miklase.EVENTS = events
+    # Where to keep the logins to share, if they're to be shared.
+    DR.LOGINS.path = logins
+    # And the emails, which are always shared.
+    DR.MAIL_CACHE.path = mail_cache
+    # And close all the browsers once the worker is shut down.
+    Finalize(DR.SESSIONS, DR.SESSIONS.drain, exitpriority=10)
+    # And log out of the mail server too.
+    Finalize(DR.MAIL, DR.MAIL.close_all, exitpriority=10)
+
+def launch_unit(args) -> dict:
+    """Runs one single test. Put this as the target call of an init_worker'd process.
+    Returns the results, along with any changes the test made to the globs."""
+    key, globs = args
+    case, names, _ = suite_of(globs['site'])
+    before = globs.copy()
+    start = time.time()
+    with io.StringIO() as buf:
+        runner = miklase.MyTestRunner(stream=buf, resultclass=miklase.MyTestResult)
+        runner.run(case(names[key[2]], globs, runner.result))
+        output = buf.getvalue()
+    return {'key': key, 'pid': os.getpid(), 'start': start, 'end': time.time(),
+            'output': output, 'results': runner.result.resultsList,
+            'changes': {k: v for k, v in globs.items() if before.get(k) != v},
+            'sessions': DR.SESSIONS.report() + DR.MAIL.report(), 'profile': DR.PROFILER.take()}
+
+def prepare_replay(args: dict) -> None:
+    """Points the run at local copies of the sites instead, if asked to, see replay.py.
+    Recording them first, if asked to. The environment and chenvironment each get a server.
+    The servers do the basic auth themselves, so the browsers don't have to.
+    Raises a replay.NoSnapshotError if there's nothing recorded to replay."""
+    if not args['replay']:
+        return
+    for num, setting in enumerate(('environment', 'chenvironment')):
+        if args[setting]:
+            local = replay.serve(args[setting], args['replay'], replay.PORT + num,
+                                 args['record'], args['auth'])
+            print('{0}ing {1} at {2}'.format('Record' if args['record'] else 'Replay',
+                                             args[setting], local))
+            args[setting] = local
+    args['auth'] = []
+
+def prepare_mail(args: dict) -> None:
+    """Gets the mail server ready for the run: starts the stand-in one if it's being used,
+    and clears out the old emails, if asked to. See drivery.MAIL_BACKENDS."""
+    if args['mail_backend'] == 'local' and mailhost.ensure_running():
+        print('Started the stand-in mail server, see mailhost.py')
+    if args['purge_mail_days'] is not None:
+        try:
+            print('Purged {0} old emails'.format(DR.purge_mail(args, args['purge_mail_days'])))
+        except (DR.imaplib.IMAP4.error, OSError) as ex:
+            print('Failed to purge the old emails:', ex)
+        DR.MAIL.close_all()
+
+def result_log(outdir: str, name: str, junit: bool, lock=None) -> miklase.ResultLog:
+    """Makes a ResultLog for the run, streaming to RESULTS_name_time.jsonl, next to the REGR
+    files. With junit, the same results are also kept in RESULTS_name_time.xml."""
+    path = os.path.join(outdir, 'RESULTS_{0}_{1}'.format(name, time.strftime('%Y%m%d_%H%M')))
+    return miklase.ResultLog(path + '.jsonl', path + '.xml' if junit else None, lock)
+
+def write_output(outdir: str, globs: dict, units: list) -> None:
+    """Writes a finished locale and browser's units to its results file, in test order.
+    If the run was profiled, the units' timings go in a PROF file of the same name, as JSON."""
+    # Give a unique name to the output file so you don't overwrite it every time!
+    filna = '{0}_{1}_{2}_{3}'.format(globs['locale'][1:], globs['site'],
+                                     globs['browser'], time.strftime('%Y%m%d_%H%M'))
+    try:
+        with open(os.path.join(outdir, 'REGR_' + filna + '.txt'), mode='w',
+                  encoding='UTF-8') as newfil:
+            newfil.write(globs.get('username'))
+            for unit in units:
+                newfil.write(unit['output'])
+    except Exception as ex:
+        print("Failed to save the output file:", ex)
+    profile = {}
+    for unit in units:
+        DR.Profiler.merge(profile, unit.get('profile') or {})
+    if not profile:
+        return
+    try:
+        with open(os.path.join(outdir, 'PROF_' + filna + '.json'), mode='w',
+                  encoding='UTF-8') as newfil:
+            json.dump(DR.Profiler.summary(profile), newfil, indent=1)
+    except Exception as ex:
+        print("Failed to save the profile file:", ex)
+
+def report_utilisation(outdir: str, site: str, done: dict, count: int, wall: float) -> None:
+    """Prints, and saves, how busy each worker was during the run. Also works out roughly how
+    long the same tests would have taken with the old one-task-per-locale-and-browser layout."""
+    busy, sessions = OrderedDict(), {}
+    for unit in sorted(done.values(), key=lambda u: u['start']):
+        if unit['pid'] is not None:
+            busy[unit['pid']] = busy.get(unit['pid'], 0) + unit['end'] - unit['start']
+            sessions[unit['pid']] = unit['sessions']
+    lines = ['{0} units on {1} workers, finished in {2:.0f}s, {3:.0%} utilisation.'.format(
+        len(done), count, wall, sum(busy.values()) / (wall * count or 1))]
+    for pid in busy:
+        lines.append('Worker {0}: {1:.0f}s busy ({2:.0%}). {3}'.format(
+            pid, busy[pid], busy[pid] / (wall or 1), sessions[pid].strip()))
+    # The old layout ran each pair's tests back to back, a pair to a worker, in order.
+    chains = OrderedDict()
+    for (loc, bro, _), unit in done.items():
+        chains[loc, bro] = chains.get((loc, bro), 0) + unit['end'] - unit['start']
+    loads = [0] * min(cpu_count() * 3, len(chains))
+    for chain in chains.values():
+        loads[loads.index(min(loads))] += chain
+    lines.append('One task per locale and browser would have taken about {0:.0f}s, '
+                 '{1:.0%} utilisation.'.format(max(loads), sum(loads) / (
+                     max(loads) * len(loads) or 1)))
+    report = '\n'.join(lines) + '\n'
+    print(report)
+    try:
+        with open(os.path.join(outdir, 'SCHED_{0}_{1}.txt'.format(
+                site, time.strftime('%Y%m%d_%H%M'))), mode='w', encoding='UTF-8') as newfil:
+            newfil.write(report)
+    except Exception as ex:
+        print("Failed to save the utilisation file:", ex)
+
+def locale_globs(locale: str, browser: str, globs: dict) -> dict:
+    """Fills in the run settings specific to a locale and browser. Modifies and returns globs."""
     globs['locale'] = locale
     globs['browser'] = browser
     # If China Mode, do it in China, otherwise, don't do it in China
@@ -75,35 +422,43 @@ def launch_test(args) -> Tuple[str, str, dict]:
         globs['cn_mode'] = False
         globs['base_url'] = globs['environment']
     globs['locale_url'] = globs['base_url'] + locale
+    return globs
+
+def launch_test(args) -> Tuple[str, str, dict]:
+    """Do all the things needed to run a test suite. Put this as the target call of a process.
+    This is the whole locale and browser in one go, back to back, the way it used to be done.
+    The runners use launch_test_suite now, but this is still handy for a quick one-off."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)    # Set the workers to ignore KeyboardInterrupts.
+    locale, browser, outdir, globs = args   # Unpack arguments.
+    # Do a bunch of method overrides to get it to work properly.
+    perform_hacks()
+    # Set up the run settings.
+    locale_globs(locale, browser, globs)
+    # How many tests each browser can be used for before it gets replaced.
+    DR.SESSIONS.max_uses = globs['browser_reuse']
+    if globs['profile']:
+        DR.PROFILER.install()
+    if globs['reuse_logins']:
+        DR.LOGINS.path = os.path.join(outdir, LOGINS_FILE)
+    DR.MAIL_CACHE.path = os.path.join(outdir, MAIL_CACHE_DIR)
+    # Only this process is writing to this locale and browser's log, no lock needed.
+    miklase.RESULT_LOG = result_log(outdir, '{0}_{1}_{2}'.format(
+        locale[1:], globs['site'], browser), globs['junit'])
 
     # Create the test runner, choose the output path: right next to the test script file.
     with io.StringIO() as buf:
         # A custom hack to enable multiple-test-failues
         runner = miklase.MyTestRunner(stream=buf, resultclass=miklase.MyTestResult)
         # Instantiate the test suites, and give them their process-unique globals and accesses
-        site = globs['site']
-        if site == 'ASP':
-            names = [ASP.ASP(ASP.aspnames[x], globs, runner.result)
-                     for x in globs['tests'] or ASP.aspnames]
-        elif site == 'AUS':
-            names = [AUS.AUS(AUS.ausnames[x], globs, runner.result)
-                     for x in globs['tests'] or AUS.ausnames]
-        elif site == 'INV':
-            names = [INV.INV(INV.invnames[x], globs, runner.result)
-                     for x in globs['tests'] or INV.invnames]
+        case, names, _ = suite_of(globs['site'])
         suite = unittest.TestSuite()
-        suite.addTests(unittest.TestSuite(names))
+        suite.addTests(unittest.TestSuite(
+            [case(names[x], globs, runner.result) for x in globs['tests'] or names]))
         result = runner.run(suite)
-
-        # Give a unique name to the output file so you don't overwrite it every time!
-        filna = 'REGR_{0}_{1}_{2}_{3}.txt'.format(locale[1:], site, browser,
-                                                  time.strftime('%Y%m%d_%H%M'))
-        try:
-            with open(os.path.join(outdir, filna), mode='w', encoding='UTF-8') as newfil:
-                newfil.write(globs.get('username'))
-                newfil.write(buf.getvalue())
-        except Exception as ex:
-            print("Failed to save the output file:", ex)
+        DR.SESSIONS.drain()
+        DR.MAIL.close_all()
+        buf.write(DR.SESSIONS.report() + DR.MAIL.report())
+        write_output(outdir, globs, [{'output': buf.getvalue(), 'profile': DR.PROFILER.take()}])
         return (browser, locale, result.resultsList)
 
 def perform_hacks() -> None:
@@ -115,12 +470,12 @@ def perform_hacks() -> None:
         try:
             oldclick(*args, **kwargs)
         except ElementNotVisibleException:
-            time.sleep(1)   # Just wait till it's finished animating or whatever
+            DR.PROFILER.sleep(1, "click retry")    # Just wait till it's done animating
             oldclick(*args, **kwargs)
         except ElementNotInteractableException:  # args[0] will be the 'self': the WebElement
             args[0].parent.execute_script(DR.SCROLL_SCRIPT, args[0])
             oldclick(*args, **kwargs)
-    DR.WebElement.click = newclick
+    DR.WebElement.click = DR.PROFILER.wrap(newclick, 'element', 'click')
 
     def newctrlclick(self):
         """Create a new method, for control-clicking"""
@@ -130,7 +485,7 @@ def perform_hacks() -> None:
         except MOD.WebDriverException:
             dr.execute_script(DR.SCROLL_SCRIPT, self)
             ActionChains(dr).key_down(Keys.CONTROL).click(self).key_up(Keys.CONTROL).perform()
-    DR.WebElement.ctrl_click = newctrlclick
+    DR.WebElement.ctrl_click = DR.PROFILER.wrap(newctrlclick, 'element', 'ctrl_click')
 
 def read_properties() -> dict:
     """Read the run options from the properties file and tidy them up a little."""
@@ -142,6 +497,25 @@ def read_properties() -> dict:
     result['browsers'] = result['browsers'].split(',')
     result['tests'] = result['tests'].split(',') if result['tests'] else []
     result['asp_from_emails'] = result['asp_from_emails'].split(',')
+    result['test_email_imap_port'] = int(result.get('test_email_imap_port') or 0) or None
+    result['test_email_imap_ssl'] = bool(result.get('test_email_imap_ssl'))
+    result['mail_backend'] = result.get('mail_backend') or 'imap'
+    result['replay'] = result.get('replay') or None
+    result['check_links'] = bool(result.get('check_links'))
+    result['links_file'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), LINKS_FILE)
+    result['record'] = bool(result.get('record'))
+    result['purge_mail_days'] = (int(result['purge_mail_days'])
+                                 if result.get('purge_mail_days') else None)
+    result['browser_reuse'] = int(result.get('browser_reuse') or 0)
+    result['highlight'] = result.get('highlight') or 'full'
+    result['network_idle'] = bool(result.get('network_idle'))
+    result['profile'] = bool(result.get('profile'))
+    result['junit'] = bool(result.get('junit'))
+    result['reuse_logins'] = bool(result.get('reuse_logins'))
+    result['headless'] = bool(result.get('headless'))
+    result['lean'] = bool(result.get('lean'))
+    result['viewport'] = (tuple(int(x) for x in result['viewport'].split(','))
+                          if result.get('viewport') else None)
     # Fill out the user details if username is included.
     if result['username']:
         result['userid'] = result['username'][-4:]    # The mail ID is the last four characters.